@@ -14,7 +14,7 @@ from .operators.ui_helper import ToggleFaces, ToggleSurfPatchCollection
 from .operators.ui_color import COLOR_OT_TemplateOperator
 from .operators.moments import Moments
 from .operators.subdivide_mesh import SubdivideMesh
-from .operators.ui_exporter import IGSExporter
+from .operators.ui_exporter import IGSExporter, MeshExporter, PatchArchiveExporter
 
 from .operators.surface_mesh import SurfaceMesh, SurfaceMeshUpdaterModal, StartSurfaceMeshUpdater
 
@@ -26,6 +26,8 @@ classes = (
     MainUI,
     COLOR_OT_TemplateOperator,
     IGSExporter,
+    MeshExporter,
+    PatchArchiveExporter,
     Moments,
     SubdivideMesh,
 
@@ -35,4 +37,6 @@ classes = (
 )
 
 register, unregister = bpy.utils.register_classes_factory(classes)
-bpy.types.TOPBAR_MT_file_export.append(IGSExporter.menu_func_export)
\ No newline at end of file
+bpy.types.TOPBAR_MT_file_export.append(IGSExporter.menu_func_export)
+bpy.types.TOPBAR_MT_file_export.append(MeshExporter.menu_func_export)
+bpy.types.TOPBAR_MT_file_export.append(PatchArchiveExporter.menu_func_export)
\ No newline at end of file
@@ -28,6 +28,9 @@ class BezierBsplineConverter:
         [0, -6, 29, -46, 24]
     ])
 
+    # Inverse of the masks above, computed once per degree
+    inverse_masks: dict = {}
+
     @classmethod
     def bezier_to_bspline(cls, bezier_coefs_mat, deg_u, deg_v):
         return cls.base_transform(bezier_coefs_mat, deg_u, deg_v, trans_type="BB2B")
@@ -40,31 +43,38 @@ class BezierBsplineConverter:
     def base_transform(cls, coefs_mat, deg_u, deg_v, trans_type="BB2B"):
         assert trans_type in ["BB2B", "B2BB"] # BB2B=Bernstein bezier to B-spline, B2BB=B-spline to Bernstein bezier
         total_coefs, vert_dim = coefs_mat.shape
-        bezier_coef_per_patch = (deg_u + 1) * (deg_v + 1)
+        order_u = deg_u + 1
+        order_v = deg_v + 1
 
-        invert = trans_type=="B2BB"
+        # Rows of coefs_mat are patches of order_u * order_v coefs, v index running fastest
+        patches = np.asarray(coefs_mat).reshape(-1, order_u, order_v, vert_dim)
+        coefs = cls.transform_patches(patches, deg_u, deg_v, trans_type)
+        return coefs.reshape(total_coefs, vert_dim)
 
-        # horizatal direction (v direction)   TODO: ADD DETAIL EXPLINATION HERE
+    @classmethod
+    def transform_patches(cls, patches, deg_u, deg_v, trans_type="BB2B"):
+        """ Transform a stack of patches, P by (deg_u+1) by (deg_v+1) by dim, with two batched contractions
+        """
+        assert trans_type in ["BB2B", "B2BB"]
+        invert = trans_type == "B2BB"
+        num_of_patches, order_u, order_v, vert_dim = patches.shape
+
+        # horizatal direction (v direction): temp[p, a, j] = sum_b mask_v[j, b] * patches[p, a, b]
         mask_v = cls.bb2b_mask_selector(deg_v, invert=invert)
-        order_v = deg_v + 1
-        temp_coef = np.zeros((total_coefs, vert_dim))
-        for i in range(0, total_coefs, order_v):
-            for j in range(order_v):
-                temp_coef[i + j, :] = np.dot(mask_v[j, :], coefs_mat[i:i + order_v, :])
+        temp_coef = np.matmul(mask_v, patches)
 
-        # vertical direction (u direction)
+        # vertical direction (u direction): coefs[p, i, j] = sum_a mask_u[i, a] * temp[p, a, j]
         mask_u = cls.bb2b_mask_selector(deg_u, invert=invert)
-        order_u = deg_u + 1
-        coefs = np.zeros((total_coefs, vert_dim))
+        coefs = np.matmul(mask_u, temp_coef.reshape(num_of_patches, order_u, order_v * vert_dim))
 
-        for k in range(0, total_coefs, bezier_coef_per_patch):
-            for i in range(order_u):
-                for j in range(order_v):
-                    coefs[k + i * order_v + j] = np.dot(mask_u[i, :],
-                                                        temp_coef[k + j:k + bezier_coef_per_patch:order_v, :])
-
-        return coefs
+        return coefs.reshape(num_of_patches, order_u, order_v, vert_dim)
 
+    @classmethod
+    def get_transform_matrix(cls, deg_u, deg_v, trans_type="BB2B"):
+        """ Return base_transform of a single patch as one matrix acting on its (deg_u+1)*(deg_v+1) rows
+        """
+        invert = trans_type == "B2BB"
+        return np.kron(cls.bb2b_mask_selector(deg_u, invert=invert), cls.bb2b_mask_selector(deg_v, invert=invert))
 
     @classmethod
     def bb2b_mask_selector(cls, deg, invert=False):
@@ -78,4 +88,8 @@ class BezierBsplineConverter:
             print("Error: degree setting is not yet supported")
             return False
 
-        return np.linalg.inv(mask) if invert else mask
+        if not invert:
+            return mask
+        if deg not in cls.inverse_masks:
+            cls.inverse_masks[deg] = np.linalg.inv(mask)
+        return cls.inverse_masks[deg]
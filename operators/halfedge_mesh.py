@@ -0,0 +1,296 @@
+import numpy as np
+
+"""
+Array-backed halfedge mesh which can stand in for a BMesh.
+
+All connectivity is stored in flat NumPy arrays. The MeshVert, MeshFace,
+MeshLoop and MeshEdge handles expose the small subset of the BMVert, BMFace,
+BMLoop and BMEdge interface used by the patch constructors, so PatchHelper
+and every PatchConstructor run on this mesh without bpy.
+
+Halfedge h belongs to face he_face[h] and starts at vertex he_vert[h], which
+matches the BMLoop convention (loop.vert is the origin of loop.edge).
+"""
+
+
+class HalfedgeMesh:
+    # Every array of the mesh, enough to rebuild it without recomputing the connectivity
+    array_names: tuple = (
+        "positions", "face_offsets", "face_indices", "face_sizes", "he_face", "he_next", "he_prev", "he_twin",
+        "he_edge", "vert_he_indices", "vert_he_offsets", "edge_verts", "valences", "vert_edge_indices",
+        "vert_edge_offsets", "is_boundary"
+    )
+
+    def __init__(self, positions, face_offsets, face_indices):
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        self.face_offsets = np.asarray(face_offsets, dtype=np.int64)
+        self.face_indices = np.asarray(face_indices, dtype=np.int64)
+        self.__init_halfedges__()
+        self.__init_edges__()
+        self.__init_elements__()
+
+    def __init_elements__(self):
+        self.verts = [MeshVert(self, i) for i in range(self.num_verts)]
+        self.faces = [MeshFace(self, i) for i in range(self.num_faces)]
+
+    def get_arrays(self) -> dict:
+        return {name: getattr(self, name) for name in HalfedgeMesh.array_names}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """ Rebuild a mesh from get_arrays() (e.g. views into shared memory) without copying
+        """
+        mesh = cls.__new__(cls)
+        for name in HalfedgeMesh.array_names:
+            setattr(mesh, name, arrays[name])
+        mesh.he_vert = mesh.face_indices
+        mesh.__init_elements__()
+        return mesh
+
+    @classmethod
+    def from_pydata(cls, verts, faces):
+        """ Build the mesh from a vertex list and a list of faces (lists of vert indices)
+        """
+        face_sizes = [len(f) for f in faces]
+        face_offsets = np.zeros(len(faces) + 1, dtype=np.int64)
+        face_offsets[1:] = np.cumsum(face_sizes)
+        face_indices = [i for f in faces for i in f]
+        return cls(verts, face_offsets, face_indices)
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        """ Build the mesh from a Blender mesh datablock using foreach_get only
+        """
+        positions = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+        mesh.vertices.foreach_get("co", positions)
+
+        loop_start = np.empty(len(mesh.polygons), dtype=np.int64)
+        loop_total = np.empty(len(mesh.polygons), dtype=np.int64)
+        mesh.polygons.foreach_get("loop_start", loop_start)
+        mesh.polygons.foreach_get("loop_total", loop_total)
+        loop_verts = np.empty(len(mesh.loops), dtype=np.int64)
+        mesh.loops.foreach_get("vertex_index", loop_verts)
+
+        # Polygons are not required to store their loops in order
+        face_offsets = np.zeros(len(loop_total) + 1, dtype=np.int64)
+        face_offsets[1:] = np.cumsum(loop_total)
+        loop_ids = np.repeat(loop_start - face_offsets[:-1], loop_total) + np.arange(face_offsets[-1])
+        return cls(positions, face_offsets, loop_verts[loop_ids])
+
+    @property
+    def num_verts(self) -> int:
+        return len(self.positions)
+
+    @property
+    def num_faces(self) -> int:
+        return len(self.face_offsets) - 1
+
+    @property
+    def num_halfedges(self) -> int:
+        return len(self.face_indices)
+
+    def __init_halfedges__(self):
+        face_sizes = np.diff(self.face_offsets)
+        num_halfedges = self.num_halfedges
+        self.face_sizes = face_sizes
+        self.he_vert = self.face_indices
+        self.he_face = np.repeat(np.arange(self.num_faces), face_sizes)
+
+        # Next / previous halfedge inside the same face
+        halfedges = np.arange(num_halfedges)
+        face_start = self.face_offsets[self.he_face]
+        local = halfedges - face_start
+        sizes = face_sizes[self.he_face]
+        self.he_next = face_start + (local + 1) % sizes
+        self.he_prev = face_start + (local - 1) % sizes
+
+        # Opposite halfedge: match (origin, dest) against (dest, origin)
+        num_verts = np.int64(self.num_verts)
+        origin = self.he_vert
+        dest = self.he_vert[self.he_next]
+        keys = origin * num_verts + dest
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        twin_keys = dest * num_verts + origin
+        pos = np.searchsorted(sorted_keys, twin_keys)
+        pos = np.minimum(pos, num_halfedges - 1)
+        found = sorted_keys[pos] == twin_keys if num_halfedges else np.zeros(0, dtype=bool)
+        self.he_twin = np.where(found, order[pos], -1)
+
+        # Outgoing halfedges of each vert (CSR), equivalent of BMVert.link_loops, in the order of the ring
+        counts = np.bincount(origin, minlength=self.num_verts)
+        heads, ranks = self.get_ring_ranks(counts.max() if len(counts) else 0)
+        self.vert_he_indices = np.lexsort((ranks, heads, origin))
+        self.vert_he_offsets = np.zeros(self.num_verts + 1, dtype=np.int64)
+        self.vert_he_offsets[1:] = np.cumsum(counts)
+
+    def get_ring_ranks(self, max_valence):
+        """ Walk the outgoing halfedges around each vert, h -> he_twin[he_prev[h]], the way the
+        constructors expect BMVert.link_loops to run (consecutive loops share an edge)
+        Return the first halfedge of the fan of every halfedge and its rank in the fan. A fan starts at
+        the boundary halfedge of a boundary vert and at the lowest halfedge of an interior vert
+        """
+        num_halfedges = self.num_halfedges
+        halfedges = np.arange(num_halfedges)
+        succ = self.he_twin[self.he_prev] if num_halfedges else np.zeros(0, dtype=np.int64)
+        pred = np.full(num_halfedges, -1, dtype=np.int64)
+        pred[succ[succ >= 0]] = halfedges[succ >= 0]
+        # A fan has at most max_valence halfedges, so num_jumps doublings reach its first one
+        num_jumps = int(max_valence).bit_length() + 1
+
+        # Closed fans have no first halfedge yet, cut them before their lowest halfedge
+        jumps, lowest = pred.copy(), halfedges.copy()
+        for _ in range(num_jumps):
+            has_pred = jumps >= 0
+            lowest[has_pred] = np.minimum(lowest[has_pred], lowest[jumps[has_pred]])
+            jumps[has_pred] = jumps[jumps[has_pred]]
+        closed = jumps >= 0
+        pred[lowest[closed]] = -1
+
+        # Rank of every halfedge in its fan by pointer jumping
+        heads = np.where(pred >= 0, pred, halfedges)
+        ranks = (pred >= 0).astype(np.int64)
+        jumps = pred.copy()
+        for _ in range(num_jumps):
+            has_pred = np.flatnonzero(jumps >= 0)
+            ranks[has_pred] += ranks[jumps[has_pred]]
+            heads[has_pred] = heads[jumps[has_pred]]
+            jumps[has_pred] = jumps[jumps[has_pred]]
+        return heads, ranks
+
+    def __init_edges__(self):
+        origin = self.he_vert
+        dest = self.he_vert[self.he_next]
+        lo = np.minimum(origin, dest)
+        hi = np.maximum(origin, dest)
+        edge_keys, self.he_edge = np.unique(lo * np.int64(self.num_verts) + hi, return_inverse=True)
+        self.he_edge = self.he_edge.reshape(-1)
+        self.edge_verts = np.stack([edge_keys // self.num_verts, edge_keys % self.num_verts], axis=1) \
+            if len(edge_keys) else np.zeros((0, 2), dtype=np.int64)
+
+        # Valence = number of edges around the vert (len(BMVert.link_edges))
+        ends = self.edge_verts.reshape(-1)
+        self.valences = np.bincount(ends, minlength=self.num_verts)
+        self.vert_edge_indices = np.argsort(ends, kind="stable") // 2
+        self.vert_edge_offsets = np.zeros(self.num_verts + 1, dtype=np.int64)
+        self.vert_edge_offsets[1:] = np.cumsum(self.valences)
+
+        # A vert is on the boundary if any edge around it has a single face
+        boundary_he = self.he_twin < 0
+        self.is_boundary = np.zeros(self.num_verts, dtype=bool)
+        self.is_boundary[origin[boundary_he]] = True
+        self.is_boundary[dest[boundary_he]] = True
+
+    def get_vert_halfedges(self, vert_id):
+        return self.vert_he_indices[self.vert_he_offsets[vert_id]:self.vert_he_offsets[vert_id + 1]]
+
+    def get_vert_edges(self, vert_id):
+        return self.vert_edge_indices[self.vert_edge_offsets[vert_id]:self.vert_edge_offsets[vert_id + 1]]
+
+    def get_face_verts(self, face_id):
+        return self.face_indices[self.face_offsets[face_id]:self.face_offsets[face_id + 1]]
+
+    def update_positions(self, positions):
+        """ Replace the vertex positions, the connectivity is kept
+        """
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+
+
+class MeshElement:
+    __slots__ = ("mesh", "index")
+
+    def __init__(self, mesh, index):
+        self.mesh = mesh
+        self.index = int(index)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.mesh is other.mesh and self.index == other.index
+
+    def __hash__(self):
+        return hash((type(self).__name__, self.index))
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, self.index)
+
+
+class MeshVert(MeshElement):
+    __slots__ = ()
+
+    @property
+    def co(self):
+        return self.mesh.positions[self.index]
+
+    @property
+    def is_boundary(self) -> bool:
+        return bool(self.mesh.is_boundary[self.index])
+
+    @property
+    def link_loops(self) -> list:
+        return [MeshLoop(self.mesh, h) for h in self.mesh.get_vert_halfedges(self.index)]
+
+    @property
+    def link_faces(self) -> list:
+        return [MeshFace(self.mesh, self.mesh.he_face[h]) for h in self.mesh.get_vert_halfedges(self.index)]
+
+    @property
+    def link_edges(self) -> list:
+        return [MeshEdge(self.mesh, e) for e in self.mesh.get_vert_edges(self.index)]
+
+
+class MeshEdge(MeshElement):
+    __slots__ = ()
+
+    @property
+    def verts(self) -> list:
+        return [MeshVert(self.mesh, v) for v in self.mesh.edge_verts[self.index]]
+
+    def other_vert(self, vert):
+        v0, v1 = self.mesh.edge_verts[self.index]
+        if vert.index == v0:
+            return MeshVert(self.mesh, v1)
+        if vert.index == v1:
+            return MeshVert(self.mesh, v0)
+        return None
+
+
+class MeshFace(MeshElement):
+    __slots__ = ()
+
+    @property
+    def verts(self) -> list:
+        return [MeshVert(self.mesh, v) for v in self.mesh.get_face_verts(self.index)]
+
+    @property
+    def loops(self) -> list:
+        start, end = self.mesh.face_offsets[self.index], self.mesh.face_offsets[self.index + 1]
+        return [MeshLoop(self.mesh, h) for h in range(start, end)]
+
+
+class MeshLoop(MeshElement):
+    __slots__ = ()
+
+    @property
+    def vert(self):
+        return MeshVert(self.mesh, self.mesh.he_vert[self.index])
+
+    @property
+    def face(self):
+        return MeshFace(self.mesh, self.mesh.he_face[self.index])
+
+    @property
+    def edge(self):
+        return MeshEdge(self.mesh, self.mesh.he_edge[self.index])
+
+    @property
+    def link_loop_next(self):
+        return MeshLoop(self.mesh, self.mesh.he_next[self.index])
+
+    @property
+    def link_loop_prev(self):
+        return MeshLoop(self.mesh, self.mesh.he_prev[self.index])
+
+    @property
+    def link_loop_radial_next(self):
+        # Like BMesh, a boundary loop is its own radial neighbor
+        twin = self.mesh.he_twin[self.index]
+        return self if twin < 0 else MeshLoop(self.mesh, twin)
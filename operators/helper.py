@@ -20,10 +20,15 @@ class Helper:
 
     @staticmethod
     def convert_verts_from_list_to_matrix(verts):
-        mat = ()  # Number by 3(xyz)
-        for v in verts:
-            mat = mat + (list(v.co),)
-        return mat
+        return np.array([list(v.co) for v in verts], dtype=np.float64)  # Number by 3(xyz)
+
+    @staticmethod
+    def get_vert_positions(mesh):
+        """ Return the positions of all verts of a BMesh or HalfedgeMesh as a V by 3 matrix
+        """
+        if hasattr(mesh, "positions"):
+            return mesh.positions
+        return Helper.convert_verts_from_list_to_matrix(mesh.verts)
 
     @staticmethod
     def split_list(list, numb_of_pieces):
@@ -36,34 +41,48 @@ class Helper:
 
     @staticmethod
     def list_to_npmatrices(vlist, u, v):
-        xCoefs = np.empty((v,u))
-        yCoefs = np.empty((v,u))
-        zCoefs = np.empty((v,u))
-        for i in range(0, v):
-            for j in range(0, u):
-                xCoefs[i][j] = vlist[i*u+j][0]
-                yCoefs[i][j] = vlist[i*u+j][1]
-                zCoefs[i][j] = vlist[i*u+j][2]
+        xCoefs = np.empty((u,v))
+        yCoefs = np.empty((u,v))
+        zCoefs = np.empty((u,v))
+        for i in range(0, u):
+            for j in range(0, v):
+                xCoefs[i][j] = vlist[i*v+j][0]
+                yCoefs[i][j] = vlist[i*v+j][1]
+                zCoefs[i][j] = vlist[i*v+j][2]
         return xCoefs, yCoefs, zCoefs
 
     @staticmethod
     def convert_verts_from_matrix_to_list(mat) -> list:
-        vlist = []
-        for row in mat:
-            vlist = vlist + [tuple(row)]
-        return vlist
+        return [tuple(row) for row in mat]
 
     @staticmethod
     def normalize_each_row(mat):
-        row_sums = np.array(mat).sum(axis=1)
+        mat = np.array(mat, dtype=np.float64)
+        row_sums = mat.sum(axis=1)
         return mat / row_sums[:, np.newaxis]
 
     @staticmethod
-    def apply_mask_on_neighbor_verts(mask, nbverts) -> list:
+    def apply_mask_on_neighbor_verts(mask, nbverts, is_normalized=False) -> list:
         nbmat = Helper.convert_verts_from_list_to_matrix(nbverts)  # vector
-        mask = Helper.normalize_each_row(mask)
+        if not is_normalized:
+            mask = Helper.normalize_each_row(mask)
         return np.dot(mask, nbmat)
 
+    @staticmethod
+    def apply_mask_on_neighbor_ids_batched(mask, positions, nb_ids):
+        """ Apply one (normalized) mask on N groups of neighbor verts at once
+        mask: rows by k, positions: V by 3, nb_ids: N by k vert indices
+        Return N by rows by 3 coefs
+        """
+        return np.matmul(mask, positions[nb_ids])
+
+    @staticmethod
+    def get_unique_ids(ids):
+        """ Sorted unique ids, sorting then dropping repeats is faster than np.unique for int ids
+        """
+        ids = np.sort(ids)
+        return ids[np.concatenate([[True], ids[1:] != ids[:-1]])] if len(ids) else ids
+
     @staticmethod
     def edges_number_of_face(face) -> int:
         return len(face.verts)
@@ -0,0 +1,261 @@
+import numpy as np
+
+"""
+IGES export of Bezier patches straight from coefficient arrays.
+
+Every patch is a rational B-spline surface entity (type 128) with two
+directory lines and a parameter block whose line count only depends on its
+orders. So the directory pointers and sequence numbers of all patches are
+known up front, and each batch of patches of the same orders is written as a
+byte array: a template of the constant text of one patch block repeated per
+patch, with the numbers written into their columns by vectorized digit
+extraction. Coordinates are formatted as C's %20e, values too close to a
+rounding tie to be decided in float64 fall back to Python formatting, so the
+output is the same as formatting every number with %.
+"""
+
+
+class IGESWriter:
+    # Characters per line, without the newline
+    line_width: int = 80
+    # Patches formatted per block, bounds the memory of the byte arrays
+    chunk_size: int = 1024
+    # Largest sequence number of the 7 columns of the IGES format
+    max_lines: int = 9999999
+
+    # Parameter block of one patch without its numbers, param_templates[(rows, cols)] = L by 81 uint8 array
+    param_templates: dict = {}
+    # Directory entry of one patch without its numbers, directory_templates[(rows, cols)] = 2 by 81 uint8 array
+    directory_templates: dict = {}
+    # Digit groups of the number formatting, see get_char_table
+    char_tables: dict = {}
+
+    @staticmethod
+    def get_param_line_count(rows, cols) -> int:
+        """ Parameter lines of a patch: header, both knot vectors and the weights 8 per line, one line
+        per control point and the parameter range
+        """
+        return 1 + -(-2 * cols // 8) + -(-2 * rows // 8) + -(-rows * cols // 8) + rows * cols + 1
+
+    @staticmethod
+    def to_bytes(lines) -> np.ndarray:
+        """ Lines of line_width characters as a len(lines) by line_width + 1 uint8 array, newlines included
+        """
+        text = "".join(line + "\n" for line in lines).encode("ascii")
+        return np.frombuffer(text, dtype=np.uint8).reshape(len(lines), IGESWriter.line_width + 1)
+
+    @classmethod
+    def get_param_template(cls, rows, cols) -> np.ndarray:
+        """ Parameter block of a rows by cols patch with blank pointers, sequence numbers and coordinates
+        """
+        if (rows, cols) not in cls.param_templates:
+            # Sequence number columns are blanked, the directory pointer and coordinates are filled per patch
+            def values_lines(values):
+                lines = []
+                for start in range(0, len(values), 8):
+                    lines.append("".join(values[start:start + 8]).ljust(64) + " " * 8 + "P" + " " * 7)
+                return lines
+
+            lines = ["128,%7d,%7d,%7d,%7d,0,0,1,0,0," % (cols - 1, rows - 1, cols - 1, rows - 1)
+                     + " " * 26 + "P" + " " * 7]
+            lines += values_lines(["0.00000,"] * cols + ["1.00000,"] * cols)
+            lines += values_lines(["0.00000,"] * rows + ["1.00000,"] * rows)
+            lines += values_lines(["1.00000,"] * (rows * cols))
+            lines += [" " * 20 + "," + " " * 20 + "," + " " * 20 + "," + " " * 9 + "P" + " " * 7] * (rows * cols)
+            lines += ["0.00000,1.00000,0.00000,1.00000;" + " " * 40 + "P" + " " * 7]
+            cls.param_templates[(rows, cols)] = cls.to_bytes(lines)
+        return cls.param_templates[(rows, cols)]
+
+    @classmethod
+    def get_directory_template(cls, rows, cols) -> np.ndarray:
+        """ Directory entry of a rows by cols patch with blank parameter pointer and sequence numbers
+        """
+        if (rows, cols) not in cls.directory_templates:
+            lines = ["     128" + " " * 8 + "       0       1       0       0       0        00000000D" + " " * 7,
+                     "     128%8d       8%8d       2                NurbSurf       0D" % (
+                         0, cls.get_param_line_count(rows, cols)) + " " * 7]
+            cls.directory_templates[(rows, cols)] = cls.to_bytes(lines)
+        return cls.directory_templates[(rows, cols)]
+
+    @classmethod
+    def get_char_table(cls, name) -> np.ndarray:
+        """ Four characters per entry viewed as one uint32, so a group of digits is written with one gather
+        padded: %04d of 0 to 9999, spaced: %4d of 0 to 9999, high: spaced with 0 blank,
+        mantissa: d.dd of 0 to 999, exponent: e+XX of -99 to 99
+        """
+        if not cls.char_tables:
+            tables = {"padded": ["%04d" % i for i in range(10000)],
+                      "spaced": ["%4d" % i for i in range(10000)],
+                      "high": ["    "] + ["%4d" % i for i in range(1, 10000)],
+                      "mantissa": ["%d.%02d" % divmod(i, 100) for i in range(1000)],
+                      "exponent": ["e%+03d" % e for e in range(-99, 100)],
+                      "sign": ["    ", "   -"]}
+            cls.char_tables = {key: np.frombuffer("".join(strings).encode("ascii"), dtype=np.uint32)
+                               for key, strings in tables.items()}
+        return cls.char_tables[name]
+
+    @classmethod
+    def format_integers(cls, values, width) -> np.ndarray:
+        """ %{width}d of non negative integers below 10 ** width, width up to 8, as a (..., width) uint8 array
+        """
+        high, low = np.divmod(np.asarray(values, dtype=np.int64), 10000)
+        words = np.empty(high.shape + (2,), dtype=np.uint32)
+        words[..., 0] = cls.get_char_table("high")[high]
+        words[..., 1] = np.where(high > 0, cls.get_char_table("padded")[low], cls.get_char_table("spaced")[low])
+        return words.view(np.uint8)[..., 8 - width:]
+
+    @classmethod
+    def format_floats(cls, values) -> np.ndarray:
+        """ %20e of every value, as a (..., 20) uint8 array
+        """
+        values = np.asarray(values, dtype=np.float64)
+        flat = values.reshape(-1)
+        magnitudes = np.abs(flat)
+        is_nonzero = magnitudes > 0
+        safe = np.where(is_nonzero & np.isfinite(flat), magnitudes, 1.0)
+
+        # Decimal exponent and 7 digit mantissa, log10 can be off by one next to powers of ten.
+        # Three digit exponents, inf and nan are left to the fallback
+        exponents = np.floor(np.log10(safe)).astype(np.int64)
+        is_out_of_range = ~np.isfinite(flat) | (np.abs(exponents) > 98)
+        safe[is_out_of_range] = 1.0
+        exponents[is_out_of_range] = 0
+        scales = 10.0 ** (6 - np.arange(-99, 100))
+
+        # scaled is within a few ulp of the exact product, a tie closer than that could round either way,
+        # also before the exponent is corrected since the tie decides whether it carries to 10 ** 7
+        is_fallback = is_out_of_range.copy()
+        scaled = safe * scales[exponents + 99]
+        is_fallback |= np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+        exponents += np.rint(scaled) >= 1e7
+        exponents -= scaled < 1e6 - 0.5
+        scaled = safe * scales[exponents + 99]
+        is_fallback |= np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+        mantissas = np.rint(scaled).astype(np.int64)
+        mantissas[~is_nonzero] = 0
+        exponents[~is_nonzero] = 0
+        is_fallback |= is_nonzero & ((mantissas < 1000000) | (mantissas > 9999999))
+
+        # Columns 0-3 blank, 4-7 the sign, 8-11 d.dd, 12-15 dddd and 16-19 e+XX
+        high, low = np.divmod(mantissas, 10000)
+        words = np.empty((len(flat), 5), dtype=np.uint32)
+        words[:, 0] = cls.get_char_table("sign")[0]
+        words[:, 1] = cls.get_char_table("sign")[np.signbit(flat).astype(np.int64)]
+        words[:, 2] = cls.get_char_table("mantissa")[np.minimum(high, 999)]
+        words[:, 3] = cls.get_char_table("padded")[low]
+        words[:, 4] = cls.get_char_table("exponent")[exponents + 99]
+        chars = words.view(np.uint8)
+        for i in np.flatnonzero(is_fallback):
+            chars[i] = np.frombuffer(("%20e" % flat[i]).encode("ascii"), dtype=np.uint8)
+        return chars.reshape(values.shape + (20,))
+
+    @staticmethod
+    def get_coefs(stencil_index, positions) -> list:
+        """ Bezier coefs of every patch of the stencil index, one N by order_u by order_v by 3 array per batch
+        """
+        coefs = []
+        for batch, batch_coefs in zip(stencil_index.batches,
+                                      stencil_index.evaluate(np.asarray(positions, dtype=np.float64).reshape(-1, 3),
+                                                             isBSpline=False)):
+            # Coef i * order_v + j (v running fastest) is row i and col j, as for bbFunctions
+            coefs.append(batch_coefs.reshape(-1, batch.constructor.deg_u + 1, batch.constructor.deg_v + 1, 3))
+        return coefs
+
+    @classmethod
+    def get_layout(cls, coefs_list):
+        """ Prefix sums of the file layout: parameter lines per patch of each array of coefs_list, index of the
+        first patch of each array and number of its first parameter line, the last entries are the totals
+        """
+        param_line_counts = np.array([cls.get_param_line_count(*coefs.shape[1:3]) for coefs in coefs_list],
+                                     dtype=np.int64)
+        patch_counts = np.array([len(coefs) for coefs in coefs_list], dtype=np.int64)
+        patch_offsets = np.zeros(len(coefs_list) + 1, dtype=np.int64)
+        patch_offsets[1:] = np.cumsum(patch_counts)
+        first_param_lines = np.ones(len(coefs_list) + 1, dtype=np.int64)
+        first_param_lines[1:] += np.cumsum(param_line_counts * patch_counts)
+        return param_line_counts, patch_offsets, first_param_lines
+
+    @classmethod
+    def check_layout(cls, patch_offsets, first_param_lines) -> bool:
+        num_lines = max(2 * int(patch_offsets[-1]), int(first_param_lines[-1]) - 1)
+        if num_lines > cls.max_lines:
+            print("Error: %d patches need %d IGES lines, more than %d" % (patch_offsets[-1], num_lines, cls.max_lines))
+            return False
+        return True
+
+    @staticmethod
+    def get_terminator(patch_offsets, first_param_lines) -> bytes:
+        return ("S%7dG%7dD%7dP%7d%40dT%7d\n" % (1, 10, 2 * patch_offsets[-1], first_param_lines[-1] - 1, 1, 1)) \
+            .encode("ascii")
+
+    @classmethod
+    def format_directory(cls, rows, cols, first_patch, param_pointers) -> np.ndarray:
+        """ Directory entries of consecutive patches, first_patch is the index of the first one in the file
+        """
+        block = np.repeat(cls.get_directory_template(rows, cols)[None], len(param_pointers), axis=0)
+        block[:, 0, 8:16] = cls.format_integers(param_pointers, 8)
+        sequence_numbers = 2 * (first_patch + np.arange(len(param_pointers)))[:, None] + np.arange(1, 3)
+        block[:, :, 73:80] = cls.format_integers(sequence_numbers, 7)
+        return block
+
+    @classmethod
+    def format_params(cls, coefs, first_patch, first_line) -> np.ndarray:
+        """ Parameter blocks of consecutive patches of the same orders, N by rows by cols by 3 coefs
+        first_patch is the index of the first patch in the file and first_line the number of its first line
+        """
+        num_patches, rows, cols = coefs.shape[:3]
+        template = cls.get_param_template(rows, cols)
+        num_lines = len(template)
+        block = np.repeat(template[None], num_patches, axis=0)
+
+        # Each line ends with the directory pointer of its patch and its own sequence number
+        directory_pointers = 2 * (first_patch + np.arange(num_patches)) + 1
+        block[:, :, 64:72] = cls.format_integers(directory_pointers, 8)[:, None]
+        block[:, :, 73:80] = cls.format_integers(
+            first_line + np.arange(num_patches * num_lines).reshape(num_patches, num_lines), 7)
+
+        points = slice(num_lines - 1 - rows * cols, num_lines - 1)
+        chars = cls.format_floats(coefs.reshape(num_patches, rows * cols, 3))
+        block[:, points, 0:20] = chars[:, :, 0]
+        block[:, points, 21:41] = chars[:, :, 1]
+        block[:, points, 42:62] = chars[:, :, 2]
+        return block
+
+    @classmethod
+    def write_directory(cls, f, coefs, first_patch, first_line):
+        """ Write the directory entries of consecutive patches of the same orders, N by rows by cols by 3 coefs
+        first_patch is the index of the first patch in the file and first_line the number of its first
+        parameter line
+        """
+        num_lines = cls.get_param_line_count(*coefs.shape[1:3])
+        for start in range(0, len(coefs), cls.chunk_size):
+            end = min(start + cls.chunk_size, len(coefs))
+            f.write(cls.format_directory(coefs.shape[1], coefs.shape[2], first_patch + start,
+                                         first_line + np.arange(start, end) * num_lines))
+
+    @classmethod
+    def write_params(cls, f, coefs, first_patch, first_line):
+        """ Write the parameter blocks of consecutive patches of the same orders, as write_directory
+        """
+        num_lines = cls.get_param_line_count(*coefs.shape[1:3])
+        for start in range(0, len(coefs), cls.chunk_size):
+            f.write(cls.format_params(coefs[start:start + cls.chunk_size], first_patch + start,
+                                      first_line + start * num_lines))
+
+    @classmethod
+    def write(cls, filepath, coefs_list) -> bool:
+        """ Write the patches of coefs_list, a list of N by rows by cols by 3 Bezier coef arrays, as one IGES file
+        The patches are written in the order of the list. Return False if they do not fit the format
+        """
+        coefs_list = [np.asarray(coefs, dtype=np.float64) for coefs in coefs_list if len(coefs)]
+        _, patch_offsets, first_param_lines = cls.get_layout(coefs_list)
+        if not cls.check_layout(patch_offsets, first_param_lines):
+            return False
+
+        with open(filepath, 'wb') as f:
+            for coefs, first_patch, first_line in zip(coefs_list, patch_offsets, first_param_lines):
+                cls.write_directory(f, coefs, first_patch, first_line)
+            for coefs, first_patch, first_line in zip(coefs_list, patch_offsets, first_param_lines):
+                cls.write_params(f, coefs, first_patch, first_line)
+            f.write(cls.get_terminator(patch_offsets, first_param_lines))
+        return True
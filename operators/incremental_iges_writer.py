@@ -0,0 +1,126 @@
+import os
+
+import numpy as np
+
+from .iges_writer import IGESWriter
+from .parallel_iges_writer import ParallelIGESWriter
+
+"""
+Re-export of an IGES file in place after the control mesh moved.
+
+Every record of the file is 81 bytes and the coordinates are fixed %20e
+fields, so the file only depends on the layout (orders and number of the
+patches of each array) and on the coefs. A sidecar index next to the file
+keeps the layout, the byte offset of the first coordinate line of every
+patch, the coefs that were written and the size and modification time of
+the file. While the layout is unchanged, an export compares the coefs with
+the written ones and rewrites only the coordinate fields of the patches
+that differ, through a memory map of the file. A topology change that
+changes the layout, a missing or stale index or a file changed by someone
+else falls back to a full rewrite.
+"""
+
+
+class IncrementalIGESWriter:
+    # The index holds the layout, offsets and file stamp, the coefs are kept apart so they can be memory mapped
+    index_suffix: str = ".index.npz"
+    coefs_suffix: str = ".coefs.npy"
+
+    @staticmethod
+    def get_point_offsets(coefs_list) -> np.ndarray:
+        """ Byte offset of the first coordinate line of every patch, patches in file order
+        """
+        line_bytes = IGESWriter.line_width + 1
+        param_line_counts, patch_offsets, first_param_lines = IGESWriter.get_layout(coefs_list)
+        offsets = [np.zeros(0, dtype=np.int64)]
+        for coefs, num_lines, first_line in zip(coefs_list, param_line_counts, first_param_lines):
+            # The coordinate lines are followed by the parameter range line
+            first_point_lines = first_line + np.arange(len(coefs)) * num_lines + num_lines - 1 - coefs[0, ..., 0].size
+            offsets.append((2 * patch_offsets[-1] + first_point_lines - 1) * line_bytes)
+        return np.concatenate(offsets)
+
+    @staticmethod
+    def get_orders(coefs_list) -> np.ndarray:
+        return np.array([coefs.shape[:3] for coefs in coefs_list], dtype=np.int64).reshape(-1, 3)
+
+    @staticmethod
+    def get_file_stamp(filepath) -> np.ndarray:
+        stat = os.stat(filepath)
+        return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    @staticmethod
+    def save_index(filepath, coefs_list, point_offsets):
+        with open(filepath + IncrementalIGESWriter.index_suffix, 'wb') as f:
+            np.savez(f, orders=IncrementalIGESWriter.get_orders(coefs_list), point_offsets=point_offsets,
+                     stamp=IncrementalIGESWriter.get_file_stamp(filepath))
+
+    @staticmethod
+    def load_index(filepath, coefs_list):
+        """ Return the byte offsets of the patches of the file and a writable memory map of its coefs,
+        or None if the file was not written last by this writer or has another layout than coefs_list
+        """
+        index_path = filepath + IncrementalIGESWriter.index_suffix
+        coefs_path = filepath + IncrementalIGESWriter.coefs_suffix
+        if not all(os.path.exists(p) for p in (filepath, index_path, coefs_path)):
+            return None
+        try:
+            with np.load(index_path) as index:
+                orders, point_offsets, stamp = index["orders"], index["point_offsets"], index["stamp"]
+            written_coefs = np.load(coefs_path, mmap_mode='r+')
+        except (OSError, ValueError, KeyError):
+            return None
+        if not np.array_equal(orders, IncrementalIGESWriter.get_orders(coefs_list)) \
+                or not np.array_equal(stamp, IncrementalIGESWriter.get_file_stamp(filepath)) \
+                or len(written_coefs) != sum(coefs[..., 0].size for coefs in coefs_list):
+            return None
+        return point_offsets, written_coefs
+
+    @staticmethod
+    def write(filepath, coefs_list, num_workers=None, incremental=True):
+        """ Write the patches of coefs_list as ParallelIGESWriter.write, updating an earlier export in place
+        when possible. Return the number of patches written, or None if they do not fit the format
+        """
+        coefs_list = [np.asarray(coefs, dtype=np.float64) for coefs in coefs_list if len(coefs)]
+        index = IncrementalIGESWriter.load_index(filepath, coefs_list) if incremental else None
+        if index is None:
+            if not ParallelIGESWriter.write(filepath, coefs_list, num_workers):
+                return None
+            # Coefs of all patches in file order, one row per control point
+            np.save(filepath + IncrementalIGESWriter.coefs_suffix,
+                    np.concatenate([coefs.reshape(-1, 3) for coefs in coefs_list] + [np.zeros((0, 3))]))
+            IncrementalIGESWriter.save_index(filepath, coefs_list, IncrementalIGESWriter.get_point_offsets(coefs_list))
+            return sum(len(coefs) for coefs in coefs_list)
+
+        point_offsets, written_coefs = index
+        line_bytes = IGESWriter.line_width + 1
+        patch_offset = 0
+        point_offset = 0
+        num_written = 0
+        lines = None
+        for coefs in coefs_list:
+            num_patches = len(coefs)
+            num_points = coefs[0, ..., 0].size
+            written = written_coefs[point_offset:point_offset + num_patches * num_points]
+            dirty = np.flatnonzero(np.any((coefs.reshape(-1, 3) != written).reshape(num_patches, -1), axis=1))
+            if len(dirty):
+                if lines is None:
+                    lines = np.memmap(filepath, dtype=np.uint8, mode='r+').reshape(-1, line_bytes)
+                for start in range(0, len(dirty), IGESWriter.chunk_size):
+                    patches = dirty[start:start + IGESWriter.chunk_size]
+                    chars = IGESWriter.format_floats(coefs[patches].reshape(len(patches), num_points, 3))
+                    rows = (point_offsets[patch_offset + patches] // line_bytes)[:, None] + np.arange(num_points)
+                    lines[rows, 0:20] = chars[:, :, 0]
+                    lines[rows, 21:41] = chars[:, :, 1]
+                    lines[rows, 42:62] = chars[:, :, 2]
+                    points = (patches[:, None] * num_points + np.arange(num_points)).reshape(-1)
+                    written[points] = coefs.reshape(-1, 3)[points]
+                num_written += len(dirty)
+            patch_offset += num_patches
+            point_offset += num_patches * num_points
+
+        if lines is not None:
+            lines.flush()
+            del lines
+            written_coefs.flush()
+            IncrementalIGESWriter.save_index(filepath, coefs_list, point_offsets)
+        return num_written
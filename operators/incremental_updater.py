@@ -0,0 +1,156 @@
+import numpy as np
+
+from .stencil_index import StencilIndex
+
+"""
+Incremental surface update while the control mesh is edited.
+
+The positions of the last update are kept next to a preallocated read
+buffer. Every update reads all positions with one foreach_get, compares the
+two arrays to find the moved verts, maps them through the vert to patch
+index of the StencilIndex to a deduplicated set of dirty patches and
+re-evaluates only those, grouped by mask. The two buffers are then swapped,
+so nothing is allocated per vert or per event.
+
+An updater is only reused while the mesh has the topology of its stencil
+index. Besides the element counts, the loop sizes and loop verts are read
+into preallocated buffers and compared with the topology key, so an edit
+that keeps the counts (Rotate Edge, a face deleted and filled again) drops
+the updater as well.
+
+The last written coefs are kept as x, y, z, w float32 rows, the layout of
+the spline points. Patches whose coefs moved less than epsilon are dropped
+before writing, the others are handed over as one flat buffer.
+"""
+
+
+class IncrementalUpdater:
+    # Updater of each control mesh, updaters["object name"] = IncrementalUpdater
+    updaters: dict = {}
+
+    # Largest coef change which is not written to the spline points
+    epsilon: float = 1e-6
+
+    def __init__(self, stencil_index: StencilIndex, positions, num_faces, num_loops):
+        self.stencil_index = stencil_index
+        # Blender stores the vert coords as float32, reading into float32 keeps foreach_get a plain copy
+        self.positions = np.array(positions, dtype=np.float32).reshape(-1)
+        self.buffer = np.empty_like(self.positions)
+        self.counts = (len(self.positions) // 3, num_faces, num_loops)
+
+        # Topology of the stencil index, and buffers to read the polygons and loops of the mesh into
+        self.face_offsets = np.frombuffer(stencil_index.topology_key[1], dtype=np.int64)
+        self.loop_totals = np.diff(self.face_offsets)
+        self.loop_verts = np.frombuffer(stencil_index.topology_key[2], dtype=np.int64)
+        self.face_buffer = np.empty(num_faces, dtype=np.int64)
+        self.loop_buffer = np.empty(num_loops, dtype=np.int64)
+        # Built now rather than on the first drag
+        stencil_index.get_vert_patch_index()
+
+        # Coefs as written to the spline points, in patch id order
+        all_coefs = stencil_index.evaluate(self.positions.reshape(-1, 3))
+        all_coefs = np.concatenate([c.reshape(-1, 3) for c in all_coefs] + [np.zeros((0, 3))])
+        self.coefs_4d = np.ones((len(all_coefs), 4), dtype=np.float32)
+        self.coefs_4d[:, :3] = all_coefs
+
+    @classmethod
+    def from_mesh(cls, stencil_index, mesh):
+        """ Build the updater of a HalfedgeMesh, its positions are the ones the patches were built from
+        """
+        return cls(stencil_index, mesh.positions, mesh.num_faces, mesh.num_halfedges)
+
+    @classmethod
+    def register(cls, obj_name, updater):
+        cls.updaters[obj_name] = updater
+
+    @classmethod
+    def get(cls, obj_name, mesh=None):
+        """ Return the updater of the object, or None if there is none or the topology of the mesh changed
+        mesh can be a HalfedgeMesh or a Blender mesh datablock
+        """
+        updater = cls.updaters.get(obj_name)
+        if updater is None:
+            return None
+        if mesh is not None and (updater.counts != cls.get_counts(mesh) or not updater.has_topology(mesh)):
+            del cls.updaters[obj_name]
+            return None
+        return updater
+
+    @staticmethod
+    def get_counts(mesh) -> tuple:
+        if hasattr(mesh, "face_indices"):
+            return mesh.num_verts, mesh.num_faces, mesh.num_halfedges
+        return len(mesh.vertices), len(mesh.polygons), len(mesh.loops)
+
+    def has_topology(self, mesh) -> bool:
+        """ Whether the mesh, with the element counts of the updater, has the topology of the stencil index
+        The polygons and loops of a Blender mesh are read into the buffers, the full topology key is only
+        built when its polygons do not store their loops in order
+        """
+        if hasattr(mesh, "face_indices"):
+            return StencilIndex.get_topology_key(mesh) == self.stencil_index.topology_key
+        mesh.polygons.foreach_get("loop_total", self.face_buffer)
+        if not np.array_equal(self.face_buffer, self.loop_totals):
+            return False
+        mesh.polygons.foreach_get("loop_start", self.face_buffer)
+        if not np.array_equal(self.face_buffer, self.face_offsets[:-1]):
+            return StencilIndex.get_topology_key(mesh) == self.stencil_index.topology_key
+        mesh.loops.foreach_get("vertex_index", self.loop_buffer)
+        return np.array_equal(self.loop_buffer, self.loop_verts)
+
+    def get_changed_verts(self, positions):
+        """ Return the ids of the verts whose position differs from the last update
+        """
+        # Flat compare then map the changed floats to their verts, faster than a row-wise any
+        return np.unique(np.flatnonzero(positions != self.positions) // 3)
+
+    def __evaluate_dirty_patches__(self, positions, changed_vert_ids, isBSpline):
+        if changed_vert_ids is None:
+            changed_vert_ids = self.get_changed_verts(positions)
+        if len(changed_vert_ids) == 0:
+            return np.zeros(0, dtype=np.int64), []
+        patch_ids = self.stencil_index.get_dirty_patches(changed_vert_ids)
+        return self.stencil_index.evaluate_patches(positions.reshape(-1, 3), patch_ids, isBSpline)
+
+    def update_positions(self, positions, changed_vert_ids=None, isBSpline=True):
+        """ Re-evaluate the patches fed by the changed verts
+        Return the unique dirty patch ids and a list of their coefs
+        """
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1)
+        result = self.__evaluate_dirty_patches__(positions, changed_vert_ids, isBSpline)
+        self.positions[:] = positions
+        return result
+
+    def update(self, mesh, changed_vert_ids=None, isBSpline=True):
+        """ Read the positions of the Blender mesh into the buffer and update from them
+        """
+        mesh.vertices.foreach_get("co", self.buffer)
+        result = self.__evaluate_dirty_patches__(self.buffer, changed_vert_ids, isBSpline)
+        self.positions, self.buffer = self.buffer, self.positions
+        return result
+
+    def get_changed_coefs(self, patch_ids, coefs, epsilon=None):
+        """ Keep the patches whose coefs moved more than epsilon since they were last written
+        Return their ids, their coefs as one flat x, y, z, w float32 buffer and the row offset of each patch
+        """
+        if epsilon is None:
+            epsilon = IncrementalUpdater.epsilon
+        patch_ids = np.asarray(patch_ids, dtype=np.int64)
+        if len(patch_ids) == 0:
+            return patch_ids, np.zeros(0, dtype=np.float32), np.zeros(1, dtype=np.int64)
+
+        offsets = self.stencil_index.patch_coef_offsets
+        num_rows = offsets[patch_ids + 1] - offsets[patch_ids]
+        rows = np.repeat(offsets[patch_ids] - np.cumsum(num_rows) + num_rows, num_rows) + np.arange(num_rows.sum())
+        new_coefs = np.concatenate(coefs).astype(np.float32)
+
+        # Largest change of each patch
+        row_change = np.abs(new_coefs - self.coefs_4d[rows, :3]).max(axis=1)
+        row_starts = np.concatenate([[0], np.cumsum(num_rows)[:-1]])
+        is_changed = np.maximum.reduceat(row_change, row_starts) > epsilon
+
+        changed_rows = rows[np.repeat(is_changed, num_rows)]
+        self.coefs_4d[changed_rows, :3] = new_coefs[np.repeat(is_changed, num_rows)]
+        coef_offsets = np.zeros(np.count_nonzero(is_changed) + 1, dtype=np.int64)
+        coef_offsets[1:] = np.cumsum(num_rows[is_changed])
+        return patch_ids[is_changed], self.coefs_4d[changed_rows].reshape(-1), coef_offsets
@@ -27,6 +27,19 @@ class MainUI(bpy.types.Panel):
         calculationBox = layout.box()
         calculationBox.label(text="Calculations")
         calculationBox.operator(operator=PolyhedralSplines.bl_idname, text="Generate Bspline Patches")
+        calculationBox.prop(context.scene, "polyhedral_splines_workers", text="Worker Processes")
+        # The tessellated mesh replaces the spline objects, packed or not
+        packedRow = calculationBox.row()
+        packedRow.enabled = not context.scene.polyhedral_splines_tessellated
+        packedRow.prop(context.scene, "polyhedral_splines_packed", text="Pack Patches by Type")
+        calculationBox.prop(context.scene, "polyhedral_splines_tessellated", text="Tessellated Mesh")
+        tessellationColumn = calculationBox.column(align=True)
+        tessellationColumn.enabled = context.scene.polyhedral_splines_tessellated
+        tessellationColumn.prop(context.scene, "polyhedral_splines_resolution", text="Max Resolution")
+        tessellationColumn.prop(context.scene, "polyhedral_splines_tolerance", text="Tolerance")
+        tessellationColumn.prop(context.scene, "polyhedral_splines_preview_resolution", text="Drag Preview Resolution")
+        if not context.scene.polyhedral_splines_tessellated:
+            tessellationColumn.label(text="Adaptive resolution and drag preview need the tessellated mesh", icon='INFO')
         calculationBox.operator(operator=SubdivideMesh.bl_idname, text="Subdivide Mesh")
         calculationBox.operator(operator=Moments.bl_idname, text="Calculate Moments")
         calculationBox.operator(operator=SurfaceMesh.bl_idname, text="Create Surface Mesh")
@@ -0,0 +1,357 @@
+import os
+import tempfile
+
+import numpy as np
+
+from .iges_writer import IGESWriter
+from .tessellator import Tessellator
+
+"""
+Streaming export of Bezier patches as one tessellated mesh, as PLY, STL or OBJ.
+
+The patches are evaluated on a uniform grid chunk by chunk, so the memory of
+the samples is bounded by chunk_samples whatever the number of patches. Only
+the samples on the boundary of a patch can be shared with its neighbors, they
+are welded through a spatial hash of their grid cells (cells of weld_tolerance
+times the bounding box diagonal, which contains every patch as it contains
+their Bezier coefs). The hash keeps the id and position of every boundary
+vert, so a seam is welded to the same vert whichever chunk reaches it first,
+and the interior verts of a chunk are written and dropped at once.
+
+Where the neighbors of an edge are the same size, the same resolution puts
+the samples of both sides at the same points. Around extraordinary points and
+T-junctions an edge can instead meet several patches, each covering part of
+it at its own parameters. Such an edge is found before the export, as a
+boundary curve whose samples are not the samples of any other curve (see
+Tessellator.get_seams). The samples of these seams closer than the weld
+tolerance are snapped to one point, and every sample of a neighbor lying on
+a seam is inserted into the face of the boundary row of the grid it falls
+in. So both sides of a seam run through the same verts and the mesh is
+watertight.
+
+PLY needs the counts in its header, its verts and faces are spooled into
+temporary files next to the output and copied after the header. STL
+triangles are written straight away and the count is patched in at the end.
+OBJ lines are written as they come, verts before the faces using them.
+"""
+
+
+class SpatialHash:
+    """ Open addressing hash table of non negative int64 keys with linear probing, every key has
+    an int64 value and a point. Lookups and inserts are vectorized over a batch of keys
+    """
+    # Largest fraction of used slots before the table doubles
+    max_load: float = 0.5
+
+    def __init__(self, capacity=1 << 16):
+        """ capacity is rounded up to a power of two
+        """
+        capacity = 1 << max(int(capacity) - 1, 1).bit_length()
+        self.keys = np.full(capacity, -1, dtype=np.int64)
+        self.values = np.zeros(capacity, dtype=np.int64)
+        self.points = np.zeros((capacity, 3))
+        self.num_keys = 0
+
+    def get_slots(self, keys):
+        """ Slot of every key, the keys must be unique. Missing keys are added with unset value and point
+        Return the slots and whether each key was added
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        if self.num_keys + len(keys) > self.max_load * len(self.keys):
+            self.__grow__(self.num_keys + len(keys))
+        bits = len(self.keys).bit_length() - 1
+        # Fibonacci hashing, the high bits of the product spread neighboring cells over the table
+        slots = ((keys.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(64 - bits)).astype(np.int64)
+
+        is_added = np.zeros(len(keys), dtype=bool)
+        pending = np.arange(len(keys))
+        while len(pending):
+            stored = self.keys[slots[pending]]
+            is_done = stored == keys[pending]
+            # Of the keys reaching the same empty slot the first one takes it, the others probe on
+            empty = np.flatnonzero(stored == -1)
+            _, first = np.unique(slots[pending[empty]], return_index=True)
+            winners = pending[empty[first]]
+            self.keys[slots[winners]] = keys[winners]
+            is_added[winners] = True
+            is_done[empty[first]] = True
+            pending = pending[~is_done]
+            slots[pending] = (slots[pending] + 1) & (len(self.keys) - 1)
+        self.num_keys += np.count_nonzero(is_added)
+        return slots, is_added
+
+    def __grow__(self, num_keys):
+        capacity = len(self.keys)
+        while num_keys > self.max_load * capacity:
+            capacity *= 2
+        is_used = self.keys >= 0
+        keys, values, points = self.keys[is_used], self.values[is_used], self.points[is_used]
+        self.keys = np.full(capacity, -1, dtype=np.int64)
+        self.values = np.zeros(capacity, dtype=np.int64)
+        self.points = np.zeros((capacity, 3))
+        self.num_keys = 0
+        slots, _ = self.get_slots(keys)
+        self.values[slots] = values
+        self.points[slots] = points
+
+
+class MeshWriter:
+    # File format of each extension
+    formats: dict = {".ply": "PLY", ".stl": "STL", ".obj": "OBJ"}
+    # Samples evaluated per chunk, bounds the memory of the chunk arrays
+    chunk_samples: int = 1 << 18
+    # Samples closer than weld_tolerance times the bounding box diagonal become one vert.
+    # The cells of the spatial hash have 21 bits per axis, enough for 1 / weld_tolerance cells
+    weld_tolerance: float = Tessellator.weld_tolerance
+    cell_bits: int = 21
+    # Vert indices are int32 in PLY and the triangle count is uint32 in STL
+    max_ply_verts: int = 2 ** 31 - 1
+    max_stl_triangles: int = 2 ** 32 - 1
+    # Triangle record of binary STL
+    stl_triangle = np.dtype([("normal", "<f4", 3), ("verts", "<f4", (3, 3)), ("attributes", "<u2")])
+
+    @classmethod
+    def get_format(cls, filepath):
+        return cls.formats.get(os.path.splitext(filepath)[1].lower())
+
+    @classmethod
+    def get_keys(cls, points, lower, cell_size) -> np.ndarray:
+        """ Spatial hash key of the grid cell of every point, the cell coords packed into one int64
+        """
+        cells = np.clip(np.rint((points - lower) / cell_size), 0, (1 << cls.cell_bits) - 1).astype(np.int64)
+        return (cells[..., 0] << (2 * cls.cell_bits)) | (cells[..., 1] << cls.cell_bits) | cells[..., 2]
+
+    @classmethod
+    def get_bounds(cls, coefs_list):
+        """ Lower corner of the bounding box of the Bezier coefs of all patches and the size of the weld cells
+        """
+        lower = np.min([coefs.reshape(-1, 3).min(axis=0) for coefs in coefs_list], axis=0)
+        upper = np.max([coefs.reshape(-1, 3).max(axis=0) for coefs in coefs_list], axis=0)
+        return lower, max(np.linalg.norm(upper - lower) * cls.weld_tolerance, 1e-300)
+
+    @staticmethod
+    def get_seams(coefs_list, resolution, lower, cell_size):
+        """ Tessellator.get_seams of the boundary curves of the patches of coefs_list, numbered patch by patch
+        """
+        curves = []
+        num_patches = 0
+        for coefs in coefs_list:
+            for e, edge in enumerate(Tessellator.get_edges(coefs)):
+                curves.append((4 * (num_patches + np.arange(len(coefs))) + e, edge))
+            num_patches += len(coefs)
+        return Tessellator.get_seams(curves, np.full(4 * num_patches, resolution, dtype=np.int64), cell_size, lower)
+
+    @staticmethod
+    def get_faces(vert_ids, face_ids, keys, corners, num_patches, resolution) -> list:
+        """ Faces of the sample grids of a chunk of patches, as rows of the chunk samples: the grids patch by
+        patch, then the inserted samples. The inserted corners go into the cells face_ids (numbered patch by
+        patch) as Tessellator.get_loops. A face with collapsed edges loses the repeated corners, one with less
+        than three left is dropped. Return one F by k array per number k of corners
+        """
+        r = resolution
+        i, j = np.divmod(np.arange((r - 1) * (r - 1)), r - 1)
+        cell = i * r + j
+        quads = (np.arange(num_patches)[:, None, None] * r * r
+                 + np.stack([cell, cell + r, cell + r + 1, cell + 1], axis=1)).reshape(-1, 4)
+        offsets, loops, _ = Tessellator.get_loops(quads, face_ids, keys, corners, vert_ids)
+        sizes = np.diff(offsets)
+        return [loops[offsets[:-1][sizes == size, None] + np.arange(size)] for size in np.unique(sizes)]
+
+    @classmethod
+    def tessellate(cls, coefs_list, resolution, seams=None):
+        """ Evaluate the patches of coefs_list (N by order_u by order_v by 3 Bezier coef arrays) chunk by chunk
+        on a resolution by resolution grid and weld them, with the samples of the seams (see get_seams) snapped
+        and inserted. Yield for every chunk the points of the verts first used by the chunk in order of their
+        ids, the vert id (-1 if not used) and welded point of every sample of the chunk, and its faces as
+        get_faces
+        """
+        coefs_list = [np.asarray(coefs, dtype=np.float64) for coefs in coefs_list if len(coefs)]
+        if not coefs_list:
+            return
+        lower, cell_size = cls.get_bounds(coefs_list)
+        if seams is None:
+            seams = cls.get_seams(coefs_list, resolution, lower, cell_size)
+        (snapped_curves, snapped_samples, snapped_points, _, _), \
+            (inserted_curves, inserted_params, inserted_points, _, _) = seams
+
+        num_grid_samples = resolution * resolution
+        is_boundary = np.ones((resolution, resolution), dtype=bool)
+        is_boundary[1:-1, 1:-1] = False
+        boundary = np.flatnonzero(is_boundary)
+        interior = np.flatnonzero(~is_boundary)
+
+        spatial_hash = SpatialHash()
+        num_verts = 0
+        first_patch = 0
+        chunk_size = max(cls.chunk_samples // num_grid_samples, 1)
+        for coefs in coefs_list:
+            order_u, order_v = coefs.shape[1:3]
+            basis_u = Tessellator.get_basis(order_u - 1, resolution)[0]
+            basis_v = Tessellator.get_basis(order_v - 1, resolution)[0]
+            for start in range(0, len(coefs), chunk_size):
+                chunk = coefs[start:start + chunk_size]
+                num_patches = len(chunk)
+                # Contract u first, then v, as Tessellator.evaluate_patches
+                along_u = np.matmul(basis_u, chunk.reshape(num_patches, order_u, order_v * 3))
+                grid = np.matmul(basis_v, along_u.reshape(num_patches, resolution, order_v, 3))
+
+                # Curves of the chunk, its snapped samples replace the grid ones and the inserted ones follow the grids
+                first_curve = 4 * (first_patch + start)
+                curve_range = [first_curve, first_curve + 4 * num_patches]
+                s = slice(*np.searchsorted(snapped_curves, curve_range))
+                patch_ids, edges = np.divmod(snapped_curves[s] - first_curve, 4)
+                points = grid.reshape(-1, 3)
+                points[patch_ids * num_grid_samples + Tessellator.get_edge_samples(
+                    edges, snapped_samples[s], resolution)] = snapped_points[s]
+                s = slice(*np.searchsorted(inserted_curves, curve_range))
+                patch_ids, cells, keys = Tessellator.get_inserted_cells(
+                    inserted_curves[s] - first_curve, inserted_params[s], np.full(num_patches, resolution))
+                inserted_rows = num_patches * num_grid_samples + np.arange(len(keys))
+                points = np.concatenate([points, inserted_points[s]])
+
+                # Boundary and inserted samples are welded, the interior ones are verts of their own
+                welded_rows = np.concatenate([
+                    (np.arange(num_patches)[:, None] * num_grid_samples + boundary).reshape(-1), inserted_rows])
+                interior_rows = (np.arange(num_patches)[:, None] * num_grid_samples + interior).reshape(-1)
+                welded_points = points[welded_rows]
+                keys_of_cells, first, inverse = np.unique(cls.get_keys(welded_points, lower, cell_size),
+                                                          return_index=True, return_inverse=True)
+                slots, is_added = spatial_hash.get_slots(keys_of_cells)
+                # Verts are numbered in order of first use
+                added = np.flatnonzero(is_added)
+                added = added[np.argsort(first[added])]
+                spatial_hash.values[slots[added]] = num_verts + np.arange(len(added))
+                spatial_hash.points[slots[added]] = welded_points[first[added]]
+                num_verts += len(added)
+
+                vert_ids = np.full(len(points), -1, dtype=np.int64)
+                vert_ids[welded_rows] = spatial_hash.values[slots][inverse.reshape(-1)]
+                points[welded_rows] = spatial_hash.points[slots][inverse.reshape(-1)]
+                vert_ids[interior_rows] = num_verts + np.arange(len(interior_rows))
+                num_verts += len(interior_rows)
+
+                verts = np.concatenate([welded_points[first[added]], points[interior_rows]])
+                faces = cls.get_faces(vert_ids, patch_ids * (resolution - 1) ** 2 + cells, keys, inserted_rows,
+                                      num_patches, resolution)
+                yield verts, vert_ids, points, faces
+            first_patch += len(coefs)
+
+    @classmethod
+    def write_ply(cls, filepath, chunks):
+        """ Binary little endian PLY of float32 verts and int32 polygon faces
+        """
+        directory = os.path.dirname(os.path.abspath(filepath))
+        num_verts = 0
+        num_faces = 0
+        with tempfile.TemporaryFile(dir=directory) as verts_file, tempfile.TemporaryFile(dir=directory) as faces_file:
+            for verts, vert_ids, _, faces in chunks:
+                for corners in faces:
+                    records = np.empty(len(corners), dtype=[("count", "u1"), ("verts", "<i4", corners.shape[1])])
+                    records["count"] = corners.shape[1]
+                    records["verts"] = vert_ids[corners]
+                    faces_file.write(records.tobytes())
+                    num_faces += len(corners)
+                verts_file.write(verts.astype("<f4").tobytes())
+                num_verts += len(verts)
+
+            header = ["ply", "format binary_little_endian 1.0", "element vertex %d" % num_verts,
+                      "property float x", "property float y", "property float z", "element face %d" % num_faces,
+                      "property list uchar int vertex_indices", "end_header"]
+            with open(filepath, 'wb') as f:
+                f.write("".join(line + "\n" for line in header).encode("ascii"))
+                for spool in (verts_file, faces_file):
+                    spool.seek(0)
+                    for block in iter(lambda: spool.read(1 << 24), b""):
+                        f.write(block)
+        return num_verts, num_faces
+
+    @classmethod
+    def write_stl(cls, filepath, chunks):
+        """ Binary STL, every face split into a fan of triangles around its first corner
+        """
+        num_verts = 0
+        num_triangles = 0
+        with open(filepath, 'wb') as f:
+            # A binary STL header must not start with "solid", which marks ASCII STL
+            f.write(b"Binary STL of polyhedral spline patches".ljust(80) + b"\0\0\0\0")
+            for verts, _, points, faces in chunks:
+                triangles = np.concatenate([corners[:, [0, k, k + 1]] for corners in faces
+                                            for k in range(1, corners.shape[1] - 1)] + [np.zeros((0, 3), np.int64)])
+                corners = points[triangles].astype(np.float32)
+                normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]).astype(np.float64)
+                lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+                records = np.zeros(len(triangles), dtype=cls.stl_triangle)
+                records["normal"] = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+                records["verts"] = corners
+                f.write(records.tobytes())
+                num_verts += len(verts)
+                num_triangles += len(triangles)
+            f.seek(80)
+            f.write(np.array(num_triangles, dtype="<u4").tobytes())
+        return num_verts, num_triangles
+
+    @classmethod
+    def format_lines(cls, tag, fields) -> np.ndarray:
+        """ OBJ lines of a tag and N by k fields of fixed width chars each, as an N by line length uint8 array
+        """
+        lines = np.full(fields.shape[:2] + (fields.shape[2] + 1,), ord(" "), dtype=np.uint8)
+        lines[:, :, 1:] = fields
+        return np.concatenate([np.full((len(lines), 1), ord(tag), dtype=np.uint8), lines.reshape(len(lines), -1),
+                               np.full((len(lines), 1), ord("\n"), dtype=np.uint8)], axis=1)
+
+    @classmethod
+    def write_obj(cls, filepath, chunks):
+        """ OBJ with the vert coords formatted as %e, verts before the faces using them.
+        The fields are fixed width, so the indices of a face can be padded with spaces
+        """
+        num_verts = 0
+        num_faces = 0
+        with open(filepath, 'wb') as f:
+            for verts, vert_ids, _, faces in chunks:
+                f.write(cls.format_lines("v", IGESWriter.format_floats(verts)).tobytes())
+                num_verts += len(verts)
+                for corners in faces:
+                    indices = vert_ids[corners] + 1
+                    width = len(str(num_verts))
+                    if width <= 8:
+                        f.write(cls.format_lines("f", IGESWriter.format_integers(indices, width)).tobytes())
+                    else:
+                        f.write("".join("f %s\n" % " ".join(map(str, face)) for face in indices.tolist())
+                                .encode("ascii"))
+                    num_faces += len(corners)
+        return num_verts, num_faces
+
+    @classmethod
+    def write(cls, filepath, coefs_list, resolution=8, file_format=None):
+        """ Tessellate the patches of coefs_list (N by order_u by order_v by 3 Bezier coef arrays) with
+        resolution samples per patch side into one welded mesh and write it as PLY, STL or OBJ, by default
+        from the extension of filepath. Return the numbers of verts and faces written, or None on error
+        """
+        if file_format is None:
+            file_format = cls.get_format(filepath)
+        if file_format not in cls.formats.values():
+            print("Error: unknown mesh format of %s" % filepath)
+            return None
+        if resolution < 2:
+            print("Error: at least 2 samples per patch side are needed, not %d" % resolution)
+            return None
+
+        # The samples of the grids bound the verts, the inserted samples are verts of other grids. Each inserted
+        # sample adds one STL triangle to the two of a cell
+        coefs_list = [np.asarray(coefs, dtype=np.float64) for coefs in coefs_list if len(coefs)]
+        num_patches = sum(len(coefs) for coefs in coefs_list)
+        seams = cls.get_seams(coefs_list, resolution, *cls.get_bounds(coefs_list)) if coefs_list else None
+        num_inserted = len(seams[1][0]) if coefs_list else 0
+        if file_format == "PLY" and num_patches * resolution ** 2 > cls.max_ply_verts \
+                or file_format == "STL" and num_patches * 2 * (resolution - 1) ** 2 + num_inserted \
+                > cls.max_stl_triangles:
+            print("Error: %d patches at resolution %d are too many for one %s file" % (
+                num_patches, resolution, file_format))
+            return None
+
+        chunks = cls.tessellate(coefs_list, resolution, seams)
+        if file_format == "PLY":
+            return cls.write_ply(filepath, chunks)
+        if file_format == "STL":
+            return cls.write_stl(filepath, chunks)
+        return cls.write_obj(filepath, chunks)
@@ -0,0 +1,78 @@
+import numpy as np
+
+from .moment_tensors import MomentTensors
+from .parallel_moments import ParallelMoments
+from .stencil_index import StencilIndex
+
+"""
+Volume, centre of mass and second moments which follow interactive edits.
+
+The moments about the origin of every patch are kept in arrays in patch id
+order next to their totals. When the dirty patches of an edit are
+re-evaluated, their old contributions are subtracted from the totals and
+the new ones added, so an edit costs as much as its dirty patches. The
+totals are summed again from the arrays every resum_interval updates to
+drop the round-off of the running sums. The initial moments and those
+full sums go through ParallelMoments, so they do not depend on the number
+of workers.
+"""
+
+
+class MomentAccumulator:
+    # Accumulator of each control mesh, accumulators["object name"] = MomentAccumulator
+    accumulators: dict = {}
+
+    # Updates between two full sums of the per patch moments
+    resum_interval: int = 256
+
+    def __init__(self, stencil_index: StencilIndex, positions, num_workers=1):
+        self.stencil_index = stencil_index
+        _, self.volumes, self.firsts, self.seconds = ParallelMoments.get_patch_moments(
+            stencil_index, positions, num_workers)
+        self.resum()
+
+    @classmethod
+    def register(cls, obj_name, accumulator):
+        cls.accumulators[obj_name] = accumulator
+
+    @classmethod
+    def get(cls, obj_name, stencil_index=None):
+        """ Return the accumulator of the object, or None if there is none or it was built for another stencil index
+        """
+        accumulator = cls.accumulators.get(obj_name)
+        if accumulator is None:
+            return None
+        if stencil_index is not None and accumulator.stencil_index is not stencil_index:
+            del cls.accumulators[obj_name]
+            return None
+        return accumulator
+
+    def resum(self):
+        """ Sum the totals again from the per patch moments
+        """
+        self.volume, self.first, self.second = ParallelMoments.get_totals(self.volumes, self.firsts, self.seconds)
+        self.num_updates = 0
+
+    def update(self, positions, patch_ids):
+        """ Replace the contributions of the dirty patches by the ones of the new positions
+        """
+        if len(patch_ids) == 0:
+            return
+        patch_ids, volumes, firsts, seconds = MomentTensors.get_patch_moments(
+            self.stencil_index, np.asarray(positions, dtype=np.float64).reshape(-1, 3), patch_ids)
+
+        self.volume += (volumes - self.volumes[patch_ids]).sum()
+        self.first += (firsts - self.firsts[patch_ids]).sum(axis=0)
+        self.second += (seconds - self.seconds[patch_ids]).sum(axis=0)
+        self.volumes[patch_ids] = volumes
+        self.firsts[patch_ids] = firsts
+        self.seconds[patch_ids] = seconds
+
+        self.num_updates += 1
+        if self.num_updates >= MomentAccumulator.resum_interval:
+            self.resum()
+
+    def get_mass_properties(self):
+        """ Volume, centre of mass and second moments about the centre of mass of the current positions
+        """
+        return MomentTensors.get_mass_properties(self.volume, self.first, self.second)
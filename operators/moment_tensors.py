@@ -0,0 +1,206 @@
+import os
+from math import comb
+
+import numpy as np
+
+"""
+Exact volume, first and second moments of Bezier patches from tensors
+precomputed per degree.
+
+With n3 = x_u * y_v - x_v * y_u, the moments of bbFunctions are integrals
+of n3 * z times up to two more coordinates. n3 is a Bernstein polynomial
+of degree (2 deg_u - 1, 2 deg_v - 1) whose coefs are a bilinear form in the
+x and y coefs, and the rest is a multilinear integral:
+
+    normal_tensor[a, b, k] = coef k of n3(e_a, e_b)
+    integral_tensor[k, c, d, e] = integral of f_k * e_c * e_d * e_e
+
+over the unit square, e being the Bernstein basis of the patch and f the
+one of n3. Both factor into a rows part and a cols part of 1D Bernstein
+products and are built once per degree and kept on disk. Per patch
+G[d, e] = integral of n3 * z * e_d * e_e is contracted once, the Bernstein
+basis sums to one so volume and first moments are sums over G.
+
+Coefs are rows by cols matrices as given to bbFunctions (u along the cols),
+with an optional leading batch axis.
+"""
+
+
+class MomentTensors:
+    # tensors[(rows, cols)] = (normal_tensor, integral_tensor), n by n by m and m by n by n by n,
+    # with n = rows * cols and m = (2 * rows - 2) * (2 * cols - 2) coefs of n3
+    tensors: dict = {}
+
+    cache_dir: str = os.path.join(os.path.dirname(__file__), "tables", "moment_tensors")
+
+    # Patches contracted at once
+    chunk_size: int = 256
+
+    @classmethod
+    def get_tensors(cls, rows, cols) -> tuple:
+        """ Return the tensors of the degree, from memory, the disk cache or built and saved
+        """
+        if (rows, cols) not in cls.tensors:
+            path = os.path.join(cls.cache_dir, "{}x{}.npz".format(rows, cols))
+            if os.path.exists(path):
+                with np.load(path) as cached:
+                    tensors = (cached["normal_tensor"], cached["integral_tensor"])
+            else:
+                tensors = cls.build_tensors(rows, cols)
+                try:
+                    os.makedirs(cls.cache_dir, exist_ok=True)
+                    np.savez(path, normal_tensor=tensors[0], integral_tensor=tensors[1])
+                except OSError as e:
+                    print("Moment tensors not cached: ", e)
+            cls.tensors[(rows, cols)] = tensors
+        return cls.tensors[(rows, cols)]
+
+    @staticmethod
+    def get_product_integrals(degrees) -> np.ndarray:
+        """ Integral over [0, 1] of the product of one Bernstein polynomial per degree,
+        for every combination of their indices (one tensor axis per degree)
+        """
+        grids = np.meshgrid(*[np.arange(d + 1) for d in degrees], indexing="ij")
+        total = sum(degrees)
+        binomials = np.prod([np.array([comb(d, i) for i in range(d + 1)], dtype=np.float64)[g]
+                             for d, g in zip(degrees, grids)], axis=0)
+        index_sums = sum(grids)
+        return binomials / np.array([comb(total, k) for k in range(total + 1)], dtype=np.float64)[index_sums] \
+            / (total + 1)
+
+    @staticmethod
+    def get_product_coefs(deg1, deg2) -> np.ndarray:
+        """ P[i, j, k] = coef k of the degree deg1 + deg2 product of the Bernstein polynomials i and j
+        """
+        i, j = np.meshgrid(np.arange(deg1 + 1), np.arange(deg2 + 1), indexing="ij")
+        product = np.zeros((deg1 + 1, deg2 + 1, deg1 + deg2 + 1))
+        product[i, j, i + j] = np.array([[comb(deg1, a) * comb(deg2, b) / comb(deg1 + deg2, a + b)
+                                          for b in range(deg2 + 1)] for a in range(deg1 + 1)])
+        return product
+
+    @staticmethod
+    def get_derivative_matrix(deg) -> np.ndarray:
+        """ deg by deg + 1 map from the coefs of a degree deg polynomial to the coefs of its derivative
+        """
+        derivative = np.zeros((deg, deg + 1))
+        derivative[np.arange(deg), np.arange(deg) + 1] = deg
+        derivative[np.arange(deg), np.arange(deg)] = -deg
+        return derivative
+
+    @classmethod
+    def build_tensors(cls, rows, cols) -> tuple:
+        deg_v, deg_u = rows - 1, cols - 1
+        d_u = cls.get_derivative_matrix(deg_u)
+        d_v = cls.get_derivative_matrix(deg_v)
+
+        # x_u * y_v: along the cols the first factor is differentiated, along the rows the second one
+        u1 = np.einsum("ka,kbl->abl", d_u, cls.get_product_coefs(deg_u - 1, deg_u))
+        v1 = np.einsum("kb,akl->abl", d_v, cls.get_product_coefs(deg_v, deg_v - 1))
+        # x_v * y_u
+        u2 = np.einsum("kb,akl->abl", d_u, cls.get_product_coefs(deg_u, deg_u - 1))
+        v2 = np.einsum("ka,kbl->abl", d_v, cls.get_product_coefs(deg_v - 1, deg_v))
+        # Interleave (row, col) of each factor, a coef with row r and col c has flat index r * cols + c
+        normal_tensor = np.einsum("acg,bdh->abcdgh", v1, u1) - np.einsum("acg,bdh->abcdgh", v2, u2)
+        n = rows * cols
+        m = (2 * deg_v) * (2 * deg_u)
+        normal_tensor = normal_tensor.reshape(n, n, m)
+
+        integral_u = cls.get_product_integrals([2 * deg_u - 1] + [deg_u] * 3)
+        integral_v = cls.get_product_integrals([2 * deg_v - 1] + [deg_v] * 3)
+        integral_tensor = np.einsum("aceg,bdfh->abcdefgh", integral_v, integral_u).reshape(m, n, n, n)
+        return normal_tensor, integral_tensor
+
+    @classmethod
+    def get_integrands(cls, xCoefs, yCoefs, zCoefs) -> np.ndarray:
+        """ G[p, d, e] = integral of n3 * z * e_d * e_e of patch p, P by n by n
+        """
+        rows, cols = xCoefs.shape[-2:]
+        n = rows * cols
+        normal_tensor, integral_tensor = cls.get_tensors(rows, cols)
+        m = normal_tensor.shape[-1]
+        normal_tensor = normal_tensor.reshape(n, n * m)
+        integral_tensor = integral_tensor.reshape(m, n ** 3)
+        x, y, z = [np.asarray(c, dtype=np.float64).reshape(-1, n) for c in (xCoefs, yCoefs, zCoefs)]
+        integrands = np.empty((len(x), n, n))
+        for start in range(0, len(x), cls.chunk_size):
+            end = min(start + cls.chunk_size, len(x))
+            normals = np.matmul(x[start:end], normal_tensor).reshape(end - start, n, m)
+            normals = np.matmul(y[start:end, None, :], normals).reshape(end - start, m)
+            contracted = np.matmul(normals, integral_tensor).reshape(end - start, n, n * n)
+            integrands[start:end] = np.matmul(z[start:end, None, :], contracted).reshape(end - start, n, n)
+        return integrands
+
+    @classmethod
+    def moments(cls, xCoefs, yCoefs, zCoefs):
+        """ Volume, first moments (allMoments's com) and second moments about the origin (secondMoment)
+        Shapes (), (3,) and (3, 3), with the batch axis first if the coefs have one
+        """
+        batch_shape = np.shape(xCoefs)[:-2]
+        rows, cols = np.shape(xCoefs)[-2:]
+        integrands = cls.get_integrands(xCoefs, yCoefs, zCoefs)
+        coords = np.stack([np.reshape(c, (-1, rows * cols)) for c in (xCoefs, yCoefs, zCoefs)], axis=1)
+
+        # Partition of unity: summing an axis of G drops its factor
+        volume = integrands.sum(axis=(1, 2))
+        first = np.einsum("pkd,pde->pk", coords, integrands) / np.array([1, 1, 2])
+        second = np.einsum("pid,pde,pje->pij", coords, integrands, coords)
+        # secondMoment halves the terms with one z and divides z z by 3
+        second = second / np.array([[1, 1, 2], [1, 1, 2], [2, 2, 3]])
+        return volume.reshape(batch_shape), first.reshape(batch_shape + (3,)), second.reshape(batch_shape + (3, 3))
+
+    @classmethod
+    def all_moments(cls, xCoefs, yCoefs, zCoefs):
+        """ Same as bbFunctions.allMoments
+        """
+        volume, first, _ = cls.moments(xCoefs, yCoefs, zCoefs)
+        return volume, first
+
+    @classmethod
+    def second_moment(cls, xCoefs, yCoefs, zCoefs, offset=np.array([0, 0, 0])):
+        """ Same as bbFunctions.secondMoment, offset is one point or one point per patch
+        """
+        offset = np.asarray(offset)
+        _, _, second = cls.moments(xCoefs - offset[..., 0, None, None], yCoefs - offset[..., 1, None, None],
+                                   zCoefs - offset[..., 2, None, None])
+        return second
+
+    @classmethod
+    def get_patch_moments(cls, stencil_index, positions, patch_ids=None):
+        """ Moments about the origin of the given patches of the stencil index, all of them by default
+        Patches of the same degree are contracted together, the Bezier coefs are evaluated once
+        Return the unique patch ids, their volumes (P,), first moments (P, 3) and second moments (P, 3, 3)
+        """
+        rows_by_order = {}
+        coefs_by_order = {}
+        if patch_ids is None:
+            patch_ids = np.arange(stencil_index.num_patches)
+            for b, coefs in enumerate(stencil_index.evaluate(positions, isBSpline=False)):
+                constructor = stencil_index.batches[b].constructor
+                order = (constructor.deg_u + 1, constructor.deg_v + 1)
+                offset = stencil_index.batch_patch_offsets[b]
+                rows_by_order.setdefault(order, []).append(np.arange(offset, offset + len(coefs) * coefs.shape[1]))
+                coefs_by_order.setdefault(order, []).append(coefs.reshape(-1, order[0] * order[1], 3))
+        else:
+            patch_ids, coefs = stencil_index.evaluate_patches(positions, patch_ids, isBSpline=False)
+            for row, patch_id in enumerate(patch_ids):
+                order = stencil_index.get_patch_order(patch_id)
+                rows_by_order.setdefault(order, []).append([row])
+                coefs_by_order.setdefault(order, []).append(coefs[row].reshape(1, -1, 3))
+
+        volumes = np.zeros(len(patch_ids))
+        firsts = np.zeros((len(patch_ids), 3))
+        seconds = np.zeros((len(patch_ids), 3, 3))
+        for order, coefs in coefs_by_order.items():
+            rows = np.concatenate(rows_by_order[order])
+            # Coef i * order_v + j (v running fastest) is row i and col j of the matrices given to bbFunctions
+            coefs = np.concatenate(coefs).reshape(-1, order[0], order[1], 3)
+            volumes[rows], firsts[rows], seconds[rows] = cls.moments(coefs[..., 0], coefs[..., 1], coefs[..., 2])
+        return patch_ids, volumes, firsts, seconds
+
+    @staticmethod
+    def get_mass_properties(volume, first, second):
+        """ Volume, centre of mass and second moments about the centre of mass of a closed surface
+        from its moments about the origin, by the parallel-axis theorem
+        """
+        com = first / volume
+        return volume, com, second - np.outer(first, first) / volume
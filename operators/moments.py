@@ -1,7 +1,6 @@
-from .patch import BezierPatch
-from .patch_helper import PatchHelper
-from .helper import Helper
-from .bivariateBBFunctions import bbFunctions
+from .halfedge_mesh import HalfedgeMesh
+from .stencil_index import StencilIndex
+from .moment_accumulator import MomentAccumulator
 from random import randint
 #from unittest.loader import VALID_MODULE_NAME
 import bpy
@@ -77,52 +76,39 @@ class Moments(bpy.types.Operator):
 
     def calculateMoments(context, controlMeshName):
         mesh = Moments.CurrentSelection.data
-        bm = bmesh.new()
-        bm.from_mesh(mesh)
 
         if controlMeshName not in Moments.ControlMeshNames:
             Moments.ControlMeshNames.append(controlMeshName)
 
         sourceObj = bpy.context.scene.objects[controlMeshName]
 
-        runningSum = 0.000
-        centerOfMass = np.zeros(3)
-        momentOfInertia = np.zeros((3,3))
-
-        #Center of mass calculation
-        comPatches = PatchHelper.getPatches(bm, False)
-        for patch in comPatches:
-            bezierPatch: BezierPatch = patch.patch
-            for bp in bezierPatch.bezier_coefs:
-                xCoefs, yCoefs, zCoefs = Helper.list_to_npmatrices(bp, bezierPatch.order_u, bezierPatch.order_v)
-                #TODO: allMoments incorrectly states what is being calculating, only the first two moments are being calculating
-                pieceVol, pieceCOM = bbFunctions.allMoments(xCoefs, yCoefs, zCoefs)
-                runningSum = runningSum + pieceVol
-                centerOfMass = centerOfMass + pieceCOM
-        #Center of Mass needs to be normalized by volume
-        centerOfMass = centerOfMass / runningSum
+        # Reuse the stencil index of the generated surface, the topology is only classified if it changed
+        stencil_index = StencilIndex.get(controlMeshName, mesh)
+        if stencil_index is None:
+            stencil_index = StencilIndex.build(HalfedgeMesh.from_mesh(mesh))
+        positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", positions)
+
+        # Single pass over the patches: moments about the origin, then the parallel-axis theorem
+        # gives the second moments about the center of mass. The per patch moments are kept so
+        # that edits of the control mesh only update the dirty patches
+        num_workers = bpy.context.scene.polyhedral_splines_workers
+        accumulator = MomentAccumulator(stencil_index, positions, num_workers)
+        MomentAccumulator.register(controlMeshName, accumulator)
+        runningSum, centerOfMass, momentOfInertia = accumulator.get_mass_properties()
         centerOfMass = centerOfMass + np.array(sourceObj.location)
 
-        #Moment of Inertia calculation needs to be done after calculating center of mass
-        inertiaPatches = PatchHelper.getPatches(bm, False)      #Can't reuse the patches up there for some reason, so grab a new set here for intertia calculations
-        for patch in inertiaPatches:
-            bezierPatch: BezierPatch = patch.patch
-            for bp in bezierPatch.bezier_coefs:
-                xCoefs, yCoefs, zCoefs = Helper.list_to_npmatrices(bp, bezierPatch.order_u, bezierPatch.order_v)
-                pieceMOI = bbFunctions.secondMoment(xCoefs, yCoefs, zCoefs, offset=centerOfMass)
-                momentOfInertia = momentOfInertia + pieceMOI
+        Moments.setValues(runningSum, centerOfMass, momentOfInertia)
+        print(f"TOTAL SUM = {runningSum}\nCENTER OF MASS = {centerOfMass}\nMOMENT OF INTERTIA = {momentOfInertia}\nPRINCIPAL AXES = {Moments.InertiaTens}")
 
+    def setValues(volume, centerOfMass, momentOfInertia):
+        """ Set the values shown in the panel, the inertia tensor is shown by its principal axes
+        """
         #To display the moment of inertia, the eigen values and eigenvectors of the matrix needs to be calculated
         eigenVectors = np.linalg.eig(momentOfInertia)
-        eigenScalers = np.abs(eigenVectors[0])
-        eigenScalers = eigenScalers / np.amax(eigenScalers)
-        momentOfInertia = eigenVectors[1]
-        for i in range(0,3):
-            momentOfInertia[:,i] = momentOfInertia[:,i] * eigenScalers[i]
-        print(f"TOTAL SUM = {runningSum}\nCENTER OF MASS = {centerOfMass}\nMOMENT OF INTERTIA = {momentOfInertia}\nEIGENVALUES = {eigenVectors}")
         momentOfInertia = eigenVectors[1]
 
-        Moments.Volume = runningSum
+        Moments.Volume = volume
         Moments.CoM = np.around(centerOfMass, decimals=3).tolist()
         momentOfInertia = np.around(momentOfInertia, decimals=3)
         for i in range(0, 3):
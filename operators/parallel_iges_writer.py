@@ -0,0 +1,103 @@
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .iges_writer import IGESWriter
+from .parallel_patch_builder import ParallelPatchBuilder, SharedArrays
+
+"""
+IGES export of Bezier patches by a pool of worker processes.
+
+The line count of a patch only depends on its orders, so prefix sums over
+the arrays give every patch its directory entry, its first parameter line
+and with that the byte offset of both in the file before anything is
+formatted. The patches are split into blocks of block_size patches, a worker
+formats its block with IGESWriter and writes the shard straight at its
+offsets into the file, which is sized up front. The shards land in file
+order without being copied back through the parent process, and the file is
+byte-identical to IGESWriter.write whatever the number of workers.
+"""
+
+# Arrays of the shared memory block, attached by each worker
+_worker_arrays = None
+_worker_shm = None
+
+
+def _init_worker(shm_name, specs):
+    global _worker_arrays, _worker_shm
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_arrays = SharedArrays.attach(_worker_shm, specs)
+
+
+def _write_block(task):
+    ParallelIGESWriter.write_block(_worker_arrays, *task)
+
+
+class ParallelIGESWriter:
+    # Patches per block, fixed so that the blocks do not depend on the number of workers
+    block_size: int = 16384
+
+    @staticmethod
+    def get_tasks(filepath, coefs_list) -> list:
+        """ (file path, array id, first patch, end patch, index of the first patch in the file, number of its
+        first parameter line, directory lines of the file) of every block, from the prefix sums of the layout
+        """
+        param_line_counts, patch_offsets, first_param_lines = IGESWriter.get_layout(coefs_list)
+        num_directory_lines = 2 * int(patch_offsets[-1])
+        tasks = []
+        for i, coefs in enumerate(coefs_list):
+            for start in range(0, len(coefs), ParallelIGESWriter.block_size):
+                end = min(start + ParallelIGESWriter.block_size, len(coefs))
+                tasks.append((filepath, i, start, end, int(patch_offsets[i]) + start,
+                              int(first_param_lines[i]) + start * int(param_line_counts[i]), num_directory_lines))
+        return tasks
+
+    @staticmethod
+    def write_block(arrays, filepath, i, start, end, first_patch, first_line, num_directory_lines):
+        """ Format patches start..end of array i and write them at their offsets into the sized file
+        """
+        line_bytes = IGESWriter.line_width + 1
+        coefs = arrays["coefs_{}".format(i)][start:end]
+        with open(filepath, 'r+b') as f:
+            f.seek(2 * first_patch * line_bytes)
+            IGESWriter.write_directory(f, coefs, first_patch, first_line)
+            f.seek((num_directory_lines + first_line - 1) * line_bytes)
+            IGESWriter.write_params(f, coefs, first_patch, first_line)
+
+    @staticmethod
+    def write(filepath, coefs_list, num_workers=None) -> bool:
+        """ Write the patches of coefs_list as one IGES file, the same file as IGESWriter.write
+        num_workers=1 (or no usable start method) writes the same blocks in this process
+        """
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        coefs_list = [np.asarray(coefs, dtype=np.float64) for coefs in coefs_list if len(coefs)]
+        _, patch_offsets, first_param_lines = IGESWriter.get_layout(coefs_list)
+        if not IGESWriter.check_layout(patch_offsets, first_param_lines):
+            return False
+
+        # Size the file and write the terminator, the blocks fill in everything before it
+        line_bytes = IGESWriter.line_width + 1
+        terminator_offset = (2 * int(patch_offsets[-1]) + int(first_param_lines[-1]) - 1) * line_bytes
+        with open(filepath, 'wb') as f:
+            f.seek(terminator_offset)
+            f.write(IGESWriter.get_terminator(patch_offsets, first_param_lines))
+
+        tasks = ParallelIGESWriter.get_tasks(filepath, coefs_list)
+        context = ParallelPatchBuilder.get_context() if num_workers > 1 and len(tasks) > 1 else None
+        arrays = {"coefs_{}".format(i): coefs for i, coefs in enumerate(coefs_list)}
+        if context is None:
+            for task in tasks:
+                ParallelIGESWriter.write_block(arrays, *task)
+            return True
+
+        # Build the digit tables once here, forked workers inherit them
+        IGESWriter.get_char_table("padded")
+        shared = SharedArrays(arrays)
+        try:
+            with context.Pool(num_workers, initializer=_init_worker, initargs=(shared.name, shared.specs)) as pool:
+                pool.map(_write_block, tasks)
+        finally:
+            shared.close()
+        return True
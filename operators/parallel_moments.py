@@ -0,0 +1,124 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .helper import Helper
+from .moment_tensors import MomentTensors
+from .parallel_patch_builder import ParallelPatchBuilder, SharedArrays
+
+"""
+Moments of every patch of a stencil index computed by a pool of worker
+processes, with totals that do not depend on the number of workers.
+
+The seeds of each batch are split into blocks of block_size seeds, a split
+which only depends on the mesh. The positions, the neighbor ids and the
+output arrays share one shared memory block, a worker evaluates the Bezier
+coefs of a block and writes the moments of its patches into their rows, so
+nothing but the task tuples travels between processes. Every block is
+computed the same way whichever process runs it, and the totals are summed
+pairwise in patch id order, so the results are bit-identical from 1 to N
+workers.
+"""
+
+# Arrays of the shared memory block, attached by each worker
+_worker_arrays = None
+_worker_shm = None
+
+
+def _init_worker(shm_name, specs):
+    global _worker_arrays, _worker_shm
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_arrays = SharedArrays.attach(_worker_shm, specs)
+
+
+def _compute_block(task):
+    ParallelMoments.compute_block(_worker_arrays, *task)
+
+
+class ParallelMoments:
+    # Seeds per block, fixed so that the blocks do not depend on the number of workers
+    block_size: int = 1024
+
+    @staticmethod
+    def get_tasks(stencil_index) -> list:
+        """ (batch id, constructor id, mask name, first seed, end seed, first patch id) of every block
+        """
+        tasks = []
+        for b, batch in enumerate(stencil_index.batches):
+            num_seeds = len(batch.neighbor_ids)
+            patches_per_seed = int(stencil_index.batch_patches_per_seed[b])
+            for start in range(0, num_seeds, ParallelMoments.block_size):
+                end = min(start + ParallelMoments.block_size, num_seeds)
+                tasks.append((b, int(stencil_index.batch_constructor_ids[b]), batch.mask_name, start, end,
+                              int(stencil_index.batch_patch_offsets[b]) + start * patches_per_seed))
+        return tasks
+
+    @staticmethod
+    def compute_block(arrays, b, constructor_id, mask_name, start, end, first_patch_id):
+        """ Write the moments about the origin of the patches of seeds start..end of batch b
+        """
+        pc = ParallelPatchBuilder.constructors[constructor_id]
+        mask = pc.get_coef_mask(mask_name, False)
+        coefs = Helper.apply_mask_on_neighbor_ids_batched(
+            mask, arrays["positions"], arrays["neighbor_ids_{}".format(b)][start:end])
+        # Coef i * order_v + j (v running fastest) is row i and col j of the matrices given to bbFunctions
+        coefs = coefs.reshape(-1, pc.deg_u + 1, pc.deg_v + 1, 3)
+        rows = slice(first_patch_id, first_patch_id + len(coefs))
+        arrays["volumes"][rows], arrays["firsts"][rows], arrays["seconds"][rows] = MomentTensors.moments(
+            coefs[..., 0], coefs[..., 1], coefs[..., 2])
+
+    @staticmethod
+    def get_patch_moments(stencil_index, positions, num_workers=1):
+        """ Moments about the origin of every patch, in patch id order, as MomentTensors.get_patch_moments
+        num_workers None, 0 or 1 (or no usable start method) runs the same blocks in this process, the pool
+        is opt in since inside Blender it forks the whole Blender process
+        """
+        num_workers = num_workers or 1
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        num_patches = stencil_index.num_patches
+        tasks = ParallelMoments.get_tasks(stencil_index)
+        context = ParallelPatchBuilder.get_context() if num_workers > 1 and len(tasks) > 1 else None
+
+        arrays = {"positions": positions, "volumes": np.zeros(num_patches),
+                  "firsts": np.zeros((num_patches, 3)), "seconds": np.zeros((num_patches, 3, 3))}
+        arrays.update({"neighbor_ids_{}".format(b): batch.neighbor_ids
+                       for b, batch in enumerate(stencil_index.batches)})
+        if context is None:
+            for task in tasks:
+                ParallelMoments.compute_block(arrays, *task)
+            return np.arange(num_patches), arrays["volumes"], arrays["firsts"], arrays["seconds"]
+
+        # Build the tensors once here, forked workers inherit them
+        for batch in stencil_index.batches:
+            MomentTensors.get_tensors(batch.constructor.deg_u + 1, batch.constructor.deg_v + 1)
+        shared = SharedArrays(arrays)
+        try:
+            with context.Pool(num_workers, initializer=_init_worker, initargs=(shared.name, shared.specs)) as pool:
+                pool.map(_compute_block, tasks)
+            results = SharedArrays.attach(shared.shm, shared.specs)
+            moments = [results[name].copy() for name in ("volumes", "firsts", "seconds")]
+            del results
+        finally:
+            shared.close()
+        return (np.arange(num_patches), *moments)
+
+    @staticmethod
+    def pairwise_sum(values) -> np.ndarray:
+        """ Sum along the first axis by adding neighbors level by level, always in the same order
+        The round-off grows with log(n) instead of n and only depends on the number of values
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return np.zeros(values.shape[1:])
+        while len(values) > 1:
+            paired = values[:len(values) // 2 * 2]
+            summed = paired[0::2] + paired[1::2]
+            values = np.concatenate([summed, values[len(paired):]]) if len(values) % 2 else summed
+        return values[0]
+
+    @staticmethod
+    def get_totals(volumes, firsts, seconds):
+        """ Total volume, first and second moments of per patch moments, summed pairwise in patch id order
+        """
+        return (ParallelMoments.pairwise_sum(volumes), ParallelMoments.pairwise_sum(firsts),
+                ParallelMoments.pairwise_sum(seconds))
@@ -0,0 +1,169 @@
+import multiprocessing
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .halfedge_mesh import HalfedgeMesh
+from .helper import Helper
+from .patch_helper import PatchHelper, PatchBatch
+
+"""
+Build the patch batches of a HalfedgeMesh with a pool of worker processes.
+
+The mesh arrays are copied once into a single shared memory block, every
+worker maps them read-only and rebuilds the HalfedgeMesh without copying or
+recomputing the connectivity. The verts and faces are split into contiguous
+chunks. A worker classifies its chunk, gathers the neighbor vert ids and
+applies the fused masks, so only the small per-chunk results travel back.
+Chunks are merged in order, which gives exactly the batches and coefs of the
+serial PatchHelper.getPatchBatches / evaluatePatchBatch.
+"""
+
+# Mesh rebuilt by each worker from the shared memory block
+_worker_mesh = None
+_worker_shm = None
+
+
+class SharedArrays:
+    """ Several numpy arrays packed into one shared memory block
+    """
+    alignment: int = 64
+
+    def __init__(self, arrays: dict):
+        self.specs = {}
+        offset = 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            self.specs[name] = (offset, array.shape, array.dtype.str)
+            offset += -(-array.nbytes // SharedArrays.alignment) * SharedArrays.alignment
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for name, view in SharedArrays.attach(self.shm, self.specs).items():
+            view[...] = arrays[name]
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @staticmethod
+    def attach(shm, specs) -> dict:
+        arrays = {}
+        for name, (offset, shape, dtype) in specs.items():
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        return arrays
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _init_worker(shm_name, specs):
+    global _worker_mesh, _worker_shm
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_mesh = HalfedgeMesh.from_arrays(SharedArrays.attach(_worker_shm, specs))
+
+
+def _build_chunk(task):
+    """ Classify the verts (or faces) start..end of the worker mesh
+    Return a list of (constructor id, mask name, source ids, neighbor ids, coefs) in first appearance order
+    """
+    is_vert_based, start, end, isBSpline = task
+    return ParallelPatchBuilder.build_chunk(_worker_mesh, is_vert_based, start, end, isBSpline)
+
+
+class ParallelPatchBuilder:
+    constructors: list = PatchHelper.vert_based_patch_constructors + PatchHelper.face_based_patch_constructors
+
+    # Number of chunks per worker, more chunks balance the load better
+    chunks_per_worker: int = 4
+
+    @staticmethod
+    def get_context():
+        """ Return the multiprocessing context to use, or None if the build has to stay serial
+        Inside Blender only fork works, a spawned worker would import the add-on and bpy again
+        """
+        methods = multiprocessing.get_all_start_methods()
+        if "fork" in methods:
+            return multiprocessing.get_context("fork")
+        if "bpy" not in sys.modules and "spawn" in methods:
+            return multiprocessing.get_context("spawn")
+        return None
+
+    @staticmethod
+    def build_chunk(mesh, is_vert_based, start, end, isBSpline=True) -> list:
+        elems = mesh.verts if is_vert_based else mesh.faces
+        pcs = PatchHelper.vert_based_patch_constructors if is_vert_based \
+            else PatchHelper.face_based_patch_constructors
+        groups = {}
+        for elem in elems[start:end]:
+            for pc in pcs:
+                if pc.is_same_type(elem):
+                    key = (ParallelPatchBuilder.constructors.index(pc), pc.get_mask_name(elem))
+                    source_ids, neighbor_ids = groups.setdefault(key, ([], []))
+                    source_ids.append(elem.index)
+                    neighbor_ids.append(Helper.get_verts_id(pc.get_neighbor_verts(elem)))
+
+        results = []
+        for (pc_id, mask_name), (source_ids, neighbor_ids) in groups.items():
+            pc = ParallelPatchBuilder.constructors[pc_id]
+            neighbor_ids = np.array(neighbor_ids, dtype=np.int64)
+            mask = pc.get_coef_mask(mask_name, isBSpline)
+            coefs = Helper.apply_mask_on_neighbor_ids_batched(mask, mesh.positions, neighbor_ids)
+            results.append((pc_id, mask_name, np.array(source_ids, dtype=np.int64), neighbor_ids, coefs))
+        return results
+
+    @staticmethod
+    def get_tasks(mesh, num_chunks, isBSpline=True) -> list:
+        tasks = []
+        for is_vert_based, num_elems in [(True, mesh.num_verts), (False, mesh.num_faces)]:
+            bounds = np.linspace(0, num_elems, min(num_chunks, num_elems) + 1).astype(np.int64)
+            tasks.extend((is_vert_based, int(s), int(e), isBSpline) for s, e in zip(bounds[:-1], bounds[1:]))
+        return tasks
+
+    @staticmethod
+    def merge_chunks(chunk_results) -> tuple[list[PatchBatch], list]:
+        """ Concatenate the chunk results per (constructor, mask), keeping the serial order
+        """
+        groups = {}
+        for is_vert_based, results in chunk_results:
+            for pc_id, mask_name, source_ids, neighbor_ids, coefs in results:
+                parts = groups.setdefault((pc_id, mask_name, is_vert_based), ([], [], []))
+                parts[0].append(source_ids)
+                parts[1].append(neighbor_ids)
+                parts[2].append(coefs)
+
+        patchBatches = []
+        batchCoefs = []
+        for (pc_id, mask_name, is_vert_based), (source_ids, neighbor_ids, coefs) in groups.items():
+            patchBatches.append(PatchBatch(
+                constructor=ParallelPatchBuilder.constructors[pc_id],
+                mask_name=mask_name,
+                is_vert_based=is_vert_based,
+                source_ids=np.concatenate(source_ids),
+                neighbor_ids=np.concatenate(neighbor_ids)
+            ))
+            batchCoefs.append(np.concatenate(coefs))
+        return patchBatches, batchCoefs
+
+    @staticmethod
+    def build(mesh: HalfedgeMesh, isBSpline=True, num_workers=1) -> tuple[list[PatchBatch], list]:
+        """ Return the patch batches of the mesh and the coefs of each batch (N by rows by 3)
+        num_workers None, 0 or 1 (or no usable start method) runs the same chunks in this process, the pool
+        is opt in since inside Blender it forks the whole Blender process
+        """
+        num_workers = num_workers or 1
+        context = ParallelPatchBuilder.get_context() if num_workers > 1 else None
+        num_chunks = num_workers * ParallelPatchBuilder.chunks_per_worker if context is not None else 1
+        tasks = ParallelPatchBuilder.get_tasks(mesh, num_chunks, isBSpline)
+
+        if context is None:
+            chunk_results = [ParallelPatchBuilder.build_chunk(mesh, *task) for task in tasks]
+        else:
+            shared = SharedArrays(mesh.get_arrays())
+            try:
+                with context.Pool(num_workers, initializer=_init_worker, initargs=(shared.name, shared.specs)) as pool:
+                    chunk_results = pool.map(_build_chunk, tasks)
+            finally:
+                shared.close()
+
+        return ParallelPatchBuilder.merge_chunks(zip([t[0] for t in tasks], chunk_results))
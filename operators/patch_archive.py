@@ -0,0 +1,334 @@
+import bz2
+import json
+import lzma
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .iges_writer import IGESWriter
+
+"""
+Compact binary archive of Bezier patches with random access.
+
+The patches keep their ids (the order of the coefs arrays written, which is
+patch id order for IGESWriter.get_coefs) and are stored by (order_u, order_v)
+group, the coefs of a group being one contiguous float64 array. Per patch
+columns give its group, its struct type (an id into a table of (constructor
+name, mask name, is vert based)), the id of its source vert/face and its sub
+patch of the source. Per group, the sorted ids of its patches map any patch
+id range to one row range of the group.
+
+The coefs of a group are split into chunks of chunk_size patches, and a chunk
+index keeps the byte offset of every chunk. Without compression the chunks
+are the raw rows and the coefs are read straight from a memory map. With
+compression (zlib, bz2 or lzma, all lossless) each chunk is byte shuffled
+(the n-th byte of every float next to each other, which groups the sign and
+exponent bytes) and compressed on its own, so reading a patch range only
+decompresses the chunks it touches.
+
+File layout, every array aligned to alignment bytes:
+    magic | arrays ... | JSON footer | footer size (uint64) | magic
+The footer lists the groups, the struct types, the compression and the
+offset, dtype and shape of every array. Opening an archive only reads the
+footer and memory maps the file, whatever its size.
+"""
+
+
+class PatchArchive:
+    magic: bytes = b"PSPLARC1"
+    version: int = 1
+    alignment: int = 64
+    # Patches per chunk of a group, fixed at write time and kept in the footer
+    chunk_size: int = 4096
+    # Decompressed chunks kept by an open archive
+    max_cached_chunks: int = 16
+
+    # compression name: (compress, decompress)
+    compressors: dict = {
+        "zlib": (lambda data: zlib.compress(data, 6), zlib.decompress),
+        "bz2": (lambda data: bz2.compress(data, 9), bz2.decompress),
+        "lzma": (lambda data: lzma.compress(data, preset=6), lzma.decompress),
+    }
+
+    def __init__(self, filepath):
+        """ Memory map an archive written by PatchArchive.write, use PatchArchive.open to get None on errors
+        """
+        self.filepath = filepath
+        self.data = np.memmap(filepath, dtype=np.uint8, mode='r')
+        trailer = len(PatchArchive.magic) + 8
+        if len(self.data) < 2 * trailer or bytes(self.data[:len(PatchArchive.magic)]) != PatchArchive.magic \
+                or bytes(self.data[-len(PatchArchive.magic):]) != PatchArchive.magic:
+            raise ValueError("not a patch archive")
+        footer_size = int(self.data[-trailer:-len(PatchArchive.magic)].view("<u8")[0])
+        self.footer = json.loads(bytes(self.data[-trailer - footer_size:-trailer]).decode("utf-8"))
+        if self.footer["version"] > PatchArchive.version:
+            raise ValueError("archive version %d is not supported" % self.footer["version"])
+
+        self.compression = self.footer["compression"]
+        self.chunk_size = self.footer["chunk_size"]
+        self.num_patches = self.footer["num_patches"]
+        self.orders = [tuple(order) for order in self.footer["orders"]]
+        self.struct_types = [tuple(struct_type) for struct_type in self.footer["struct_types"]]
+        self.metadata = self.footer["metadata"]
+
+        # Per patch columns
+        self.group_ids = self.get_array("group_ids")
+        self.struct_type_ids = self.get_array("struct_type_ids")
+        self.source_ids = self.get_array("source_ids")
+        self.sub_ids = self.get_array("sub_ids")
+
+        # Per group
+        self.group_patch_ids = [self.get_array("patch_ids_{}".format(g)) for g in range(len(self.orders))]
+        self.chunk_offsets = [self.get_array("chunks_{}".format(g)) for g in range(len(self.orders))]
+        self.chunks = {}  # (group, chunk) to decompressed coefs
+
+    @staticmethod
+    def open(filepath):
+        """ Return the open archive, or None if the file is missing or is not a patch archive
+        """
+        try:
+            return PatchArchive(filepath)
+        except (OSError, ValueError, KeyError) as e:
+            print("Error: cannot open patch archive {}: {}".format(filepath, e))
+            return None
+
+    def close(self):
+        self.chunks.clear()
+        self.group_ids = self.struct_type_ids = self.source_ids = self.sub_ids = None
+        self.group_patch_ids = self.chunk_offsets = []
+        self.data = None
+
+    def get_array(self, name) -> np.ndarray:
+        """ Read only view of an array of the file, straight on the memory map
+        """
+        offset, dtype, shape = self.footer["arrays"][name]
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        return self.data[offset:offset + size].view(dtype).reshape(shape)
+
+    def get_num_patches(self, group) -> int:
+        return len(self.group_patch_ids[group])
+
+    def get_chunk(self, group, chunk) -> np.ndarray:
+        """ Coefs of the patches of one chunk of a group
+        """
+        key = (group, chunk)
+        if key in self.chunks:
+            return self.chunks[key]
+        order_u, order_v = self.orders[group]
+        start, end = self.chunk_offsets[group][chunk:chunk + 2]
+        if self.compression is None:
+            coefs = self.data[start:end].view("<f8").reshape(-1, order_u, order_v, 3)
+        else:
+            decompress = PatchArchive.compressors[self.compression][1]
+            shuffled = np.frombuffer(decompress(memoryview(self.data[start:end])), dtype=np.uint8).reshape(8, -1)
+            coefs = np.ascontiguousarray(shuffled.T).view("<f8").reshape(-1, order_u, order_v, 3)
+            coefs.flags.writeable = False
+            # Evict the oldest chunk, dicts keep their insertion order
+            if len(self.chunks) >= self.max_cached_chunks:
+                del self.chunks[next(iter(self.chunks))]
+            self.chunks[key] = coefs
+        return coefs
+
+    def get_rows(self, group, start, end) -> np.ndarray:
+        """ Coefs of rows start..end of a group, a view of the memory map without compression
+        """
+        order_u, order_v = self.orders[group]
+        if start >= end:
+            return np.zeros((0, order_u, order_v, 3))
+        if self.compression is None:
+            offset = int(self.chunk_offsets[group][0])
+            return self.data[offset:offset + self.get_num_patches(group) * order_u * order_v * 24] \
+                .view("<f8").reshape(-1, order_u, order_v, 3)[start:end]
+        first_chunk, last_chunk = start // self.chunk_size, (end - 1) // self.chunk_size
+        coefs = [self.get_chunk(group, c) for c in range(first_chunk, last_chunk + 1)]
+        coefs = coefs[0] if len(coefs) == 1 else np.concatenate(coefs)
+        return coefs[start - first_chunk * self.chunk_size:end - first_chunk * self.chunk_size]
+
+    def read(self, start=0, end=None) -> list:
+        """ Patches start..end. Return (patch ids, coefs) of every group with patches in the range,
+        the coefs being N by order_u by order_v by 3
+        """
+        end = self.num_patches if end is None else min(end, self.num_patches)
+        patches = []
+        for group, patch_ids in enumerate(self.group_patch_ids):
+            first_row, end_row = np.searchsorted(patch_ids, [start, end])
+            if first_row < end_row:
+                patches.append((np.array(patch_ids[first_row:end_row]), self.get_rows(group, first_row, end_row)))
+        return patches
+
+    def get_patches(self, patch_ids):
+        """ Return the unique patch ids and a list of their coefs, as StencilIndex.evaluate_patches
+        """
+        patch_ids = np.unique(np.asarray(patch_ids, dtype=np.int64))
+        coefs = [None] * len(patch_ids)
+        group_ids = self.group_ids[patch_ids]
+        for group in np.unique(group_ids):
+            in_group = np.flatnonzero(group_ids == group)
+            rows = np.searchsorted(self.group_patch_ids[group], patch_ids[in_group])
+            if self.compression is None:
+                group_coefs = self.get_rows(group, rows[0], rows[-1] + 1)
+                for k, row in zip(in_group, rows):
+                    coefs[k] = group_coefs[row - rows[0]]
+                continue
+            # One decompression per chunk touched, rows are sorted
+            chunk_ids = rows // self.chunk_size
+            for chunk in np.unique(chunk_ids):
+                chunk_coefs = self.get_chunk(group, chunk)
+                for k, row in zip(in_group[chunk_ids == chunk], rows[chunk_ids == chunk]):
+                    coefs[k] = chunk_coefs[row - chunk * self.chunk_size]
+        return patch_ids, coefs
+
+    def get_coefs(self) -> list:
+        """ Coefs of every group, to pass to the IGES or mesh writers. Memory maps without compression
+        """
+        return [self.get_rows(group, 0, self.get_num_patches(group)) for group in range(len(self.orders))]
+
+    @staticmethod
+    def get_columns(stencil_index):
+        """ Struct type of every batch, and source and sub patch ids of every patch of the batch
+        """
+        struct_types = [(batch.constructor.name, batch.mask_name, bool(batch.is_vert_based))
+                        for batch in stencil_index.batches]
+        source_ids, sub_ids = [], []
+        for b, batch in enumerate(stencil_index.batches):
+            start, end = stencil_index.batch_patch_offsets[b:b + 2]
+            source_ids.append(batch.source_ids[stencil_index.patch_seed_rows[start:end]])
+            sub_ids.append(stencil_index.patch_sub_ids[start:end])
+        return struct_types, source_ids, sub_ids
+
+    @staticmethod
+    def write_stencil_index(filepath, stencil_index, positions, compression=None, metadata=None):
+        """ Evaluate the patches of the stencil index and write them with their columns
+        """
+        struct_types, source_ids, sub_ids = PatchArchive.get_columns(stencil_index)
+        return PatchArchive.write(filepath, IGESWriter.get_coefs(stencil_index, positions), struct_types,
+                                  source_ids, sub_ids, compression, metadata=metadata)
+
+    @staticmethod
+    def get_chunks(arrays, chunk_size):
+        """ Split the concatenation of the arrays into chunks of chunk_size rows, copying only
+        the chunks across two arrays
+        """
+        pieces = []
+        num_rows = 0
+        for coefs in arrays:
+            start = 0
+            while start < len(coefs):
+                end = min(start + chunk_size - num_rows, len(coefs))
+                pieces.append(coefs[start:end])
+                num_rows += end - start
+                start = end
+                if num_rows == chunk_size:
+                    yield pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+                    pieces = []
+                    num_rows = 0
+        if pieces:
+            yield pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+
+    @staticmethod
+    def compress_chunk(compress, coefs) -> bytes:
+        shuffled = np.ascontiguousarray(coefs, dtype="<f8").reshape(-1).view(np.uint8).reshape(-1, 8).T
+        return compress(np.ascontiguousarray(shuffled))
+
+    @staticmethod
+    def write(filepath, coefs_list, struct_types=None, source_ids=None, sub_ids=None, compression=None,
+              chunk_size=None, num_workers=None, metadata=None):
+        """ Write the patches of coefs_list, patch ids in list order. struct_types gives one (constructor
+        name, mask name, is vert based) per array, source_ids and sub_ids one int array per array
+        compression is None, "zlib", "bz2" or "lzma", the chunks are compressed by num_workers threads
+        Return the number of patches written, or None if the compression is unknown
+        """
+        if compression is not None and compression not in PatchArchive.compressors:
+            print("Error: unknown compression {}, use one of {}".format(
+                compression, ", ".join(PatchArchive.compressors)))
+            return None
+        chunk_size = chunk_size or PatchArchive.chunk_size
+        coefs_list = [np.asarray(coefs, dtype=np.float64) for coefs in coefs_list]
+        counts = np.array([len(coefs) for coefs in coefs_list], dtype=np.int64)
+        array_offsets = np.zeros(len(coefs_list) + 1, dtype=np.int64)
+        array_offsets[1:] = np.cumsum(counts)
+        if struct_types is None:
+            struct_types = [("None", "None", False)] * len(coefs_list)
+        if source_ids is None:
+            source_ids = [np.full(n, -1) for n in counts]
+        if sub_ids is None:
+            sub_ids = [np.zeros(n) for n in counts]
+
+        # Struct type table and groups by order, in order of first use
+        struct_type_table, struct_type_ids = {}, []
+        orders, array_group_ids = {}, []
+        for coefs, struct_type in zip(coefs_list, struct_types):
+            struct_type = (str(struct_type[0]), str(struct_type[1]), bool(struct_type[2]))
+            struct_type_ids.append(struct_type_table.setdefault(struct_type, len(struct_type_table)))
+            array_group_ids.append(orders.setdefault(tuple(coefs.shape[1:3]), len(orders)) if len(coefs) else -1)
+        array_group_ids = np.array(array_group_ids, dtype=np.int16)
+
+        arrays = {}
+        with open(filepath, 'wb') as f:
+            f.write(PatchArchive.magic)
+
+            def add_array(name, values):
+                f.seek(-f.tell() % PatchArchive.alignment, os.SEEK_CUR)
+                values = np.ascontiguousarray(values)
+                arrays[name] = (f.tell(), values.dtype.str, list(values.shape))
+                f.write(values.data)
+
+            add_array("group_ids", np.repeat(array_group_ids, counts))
+            add_array("struct_type_ids", np.repeat(np.array(struct_type_ids, dtype=np.int16), counts))
+            add_array("source_ids", np.concatenate([np.asarray(ids, dtype=np.int32).reshape(-1) for ids in source_ids]
+                                                   + [np.zeros(0, dtype=np.int32)]))
+            add_array("sub_ids", np.concatenate([np.asarray(ids, dtype=np.int16).reshape(-1) for ids in sub_ids]
+                                                + [np.zeros(0, dtype=np.int16)]))
+
+            num_workers = num_workers or os.cpu_count() or 1
+            executor = ThreadPoolExecutor(num_workers) if compression is not None else None
+            try:
+                for group, (order_u, order_v) in enumerate(orders):
+                    in_group = np.flatnonzero(array_group_ids == group)
+                    add_array("patch_ids_{}".format(group), np.concatenate(
+                        [np.arange(array_offsets[i], array_offsets[i + 1]) for i in in_group]
+                        + [np.zeros(0, dtype=np.int64)]))
+
+                    f.seek(-f.tell() % PatchArchive.alignment, os.SEEK_CUR)
+                    offsets = [f.tell()]
+                    chunks = PatchArchive.get_chunks([coefs_list[i] for i in in_group], chunk_size)
+                    if executor is None:
+                        for coefs in chunks:
+                            f.write(np.ascontiguousarray(coefs, dtype="<f8").data)
+                            offsets.append(f.tell())
+                    else:
+                        # A window of chunks in flight at a time bounds the memory of the compressed chunks
+                        compress = PatchArchive.compressors[compression][0]
+                        window = []
+                        for coefs in chunks:
+                            window.append(executor.submit(PatchArchive.compress_chunk, compress, coefs))
+                            if len(window) == 2 * num_workers:
+                                for future in window:
+                                    f.write(future.result())
+                                    offsets.append(f.tell())
+                                window = []
+                        for future in window:
+                            f.write(future.result())
+                            offsets.append(f.tell())
+                    add_array("chunks_{}".format(group), np.array(offsets, dtype=np.int64))
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+
+            footer = json.dumps({
+                "version": PatchArchive.version,
+                "compression": compression,
+                "chunk_size": chunk_size,
+                "num_patches": int(array_offsets[-1]),
+                "orders": [list(order) for order in orders],
+                "struct_types": [list(struct_type) for struct_type in struct_type_table],
+                "arrays": arrays,
+                "metadata": metadata or {},
+            }).encode("utf-8")
+            f.write(footer)
+            f.write(np.array([len(footer)], dtype="<u8").tobytes())
+            f.write(PatchArchive.magic)
+        return int(array_offsets[-1])
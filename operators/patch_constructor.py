@@ -1,5 +1,23 @@
 from abc import ABC, abstractmethod
 
+import numpy as np
+
+from .helper import Helper
+from .bezier_bspline_converter import BezierBsplineConverter
+
+# Row-normalized masks, normalized once per (constructor, mask) pair
+# normalized_masks[(constructor name, mask name)] = mask as numpy matrix
+normalized_masks: dict = {}
+
+# Normalized masks fused with the bezier to B-spline conversion
+# bspline_masks[(constructor name, mask name)] = neighbor verts -> B-spline coefs matrix
+bspline_masks: dict = {}
+
+# Rows of the normalized masks which give the patch corners
+# corner_masks[(constructor name, mask name)] = neighbor verts -> corner coords matrix
+corner_masks: dict = {}
+
+
 class PatchConstructor(ABC):
     @classmethod
     @abstractmethod
@@ -16,7 +34,68 @@ class PatchConstructor(ABC):
     def get_neighbor_verts(cls, obj) -> list:
         pass
 
+    @classmethod
+    @abstractmethod
+    def get_mask_name(cls, obj) -> str:
+        """ Return the name of the mask (table) used for the input vert/face
+        """
+        pass
+
+    @classmethod
+    @abstractmethod
+    def get_corner_ids(cls, mask_name) -> list:
+        """ Return the rows of the bezier coefs (output of the mask) which are patch corners
+        """
+        pass
+
     @classmethod
     @abstractmethod
     def get_patch(cls, obj, isBspline=True) -> list:  # List of bezier coef list (multiple patches)
         pass
+
+    @classmethod
+    def get_normalized_mask(cls, mask_name):
+        key = (cls.name, mask_name)
+        if key not in normalized_masks:
+            normalized_masks[key] = Helper.normalize_each_row(cls.masks[mask_name])
+        return normalized_masks[key]
+
+    @classmethod
+    def get_bspline_mask(cls, mask_name):
+        """ Return the mask mapping the neighbor verts straight to B-spline coefs
+        bezier_to_bspline is linear, so it is folded into the mask once per patch type
+        """
+        key = (cls.name, mask_name)
+        if key not in bspline_masks:
+            mask = cls.get_normalized_mask(mask_name)
+            trans = BezierBsplineConverter.get_transform_matrix(cls.deg_u, cls.deg_v)
+            num_of_patches = len(mask) // len(trans)
+            bspline_masks[key] = np.kron(np.eye(num_of_patches), trans) @ mask
+        return bspline_masks[key]
+
+    @classmethod
+    def get_coef_mask(cls, mask_name, isBspline=True):
+        """ Return the fused B-spline mask or the bezier mask of the same cache
+        """
+        if isBspline:
+            return cls.get_bspline_mask(mask_name)
+        return cls.get_normalized_mask(mask_name)
+
+    @classmethod
+    def get_num_of_coef_per_patch(cls) -> int:
+        return (cls.deg_u + 1) * (cls.deg_v + 1)
+
+    @classmethod
+    def get_corner_mask(cls, mask_name):
+        """ Return the mask mapping the neighbor verts straight to the corner coords
+        """
+        key = (cls.name, mask_name)
+        if key not in corner_masks:
+            corner_masks[key] = cls.get_normalized_mask(mask_name)[cls.get_corner_ids(mask_name)]
+        return corner_masks[key]
+
+    @staticmethod
+    def get_bicubic_corner_ids(num_of_patches) -> list:
+        """ Corners 0, 3, 12 and 15 of each 16 coef block
+        """
+        return [16 * i + c for i in range(num_of_patches) for c in (0, 3, 12, 15)]
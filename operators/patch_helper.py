@@ -3,8 +3,6 @@ from dataclasses import dataclass
 from .bezier_bspline_converter import BezierBsplineConverter
 import numpy as np
 from .helper import Helper
-from .csv_reader import Reader
-from .patch_tracker import PatchTracker
 import time
 
 from .patch import BezierPatch, BsplinePatch
@@ -30,6 +28,17 @@ class PatchWrapper:
         self.source = source
         self.neighbors = neighbors
 
+
+@dataclass
+class PatchBatch:
+    """ All vert/face seeds sharing one constructor and one mask (e.g. every eopSct5 vert)
+    """
+    constructor: type
+    mask_name: str
+    is_vert_based: bool
+    source_ids: np.ndarray      # N ids of the central verts/faces
+    neighbor_ids: np.ndarray    # N by k vert ids, the input of the mask
+
 class PatchHelper:
     # The algorithm using vert as center
     vert_based_patch_constructors: list = [
@@ -45,20 +54,30 @@ class PatchHelper:
         T2PatchConstructor,
         NGonPatchConstructor
     ]
+    patch_constructors_by_name: dict = {
+        pc.name: pc for pc in vert_based_patch_constructors + face_based_patch_constructors}
 
     @staticmethod
-    def getPatches(bMesh, isBSpline = True) -> list[PatchWrapper]:
+    def getPatches(bMesh, isBSpline = True, batched = False, patchBatches = None, batchCoefs = None) -> list[PatchWrapper]:
+        """ Construct all patches of the mesh. bMesh can be a BMesh or a HalfedgeMesh
+        With batched=True the masks are applied once per PatchBatch instead of once per seed
+        """
         patchWrappers = []
 
-        vertPatches = PatchHelper.getVertPatches(bMesh, isBSpline)
-        facePatches = PatchHelper.getFacePatches(bMesh, isBSpline)
+        if batched:
+            patchWrappers.extend(PatchHelper.getBatchedPatches(bMesh, isBSpline, patchBatches, batchCoefs))
+        else:
+            vertPatches = PatchHelper.getVertPatches(bMesh, isBSpline)
+            facePatches = PatchHelper.getFacePatches(bMesh, isBSpline)
 
-        patchWrappers.extend(vertPatches)
-        patchWrappers.extend(facePatches)
+            patchWrappers.extend(vertPatches)
+            patchWrappers.extend(facePatches)
 
         # harry addition
-        for patchWrapper in patchWrappers:
-            patchWrapper.patch.corner_coords = PatchHelper.calculate_corner_coords(PatchHelper, patchWrapper)
+        # The batched path already sliced the corners out of the batch coefs
+        if not batched:
+            for patchWrapper in patchWrappers:
+                patchWrapper.patch.corner_coords = PatchHelper.calculate_corner_coords(PatchHelper, patchWrapper)
 
 
         return patchWrappers
@@ -92,86 +111,98 @@ class PatchHelper:
                     bsplinePatches.append(patchWrapper)
         return bsplinePatches
 
+    @staticmethod
+    def getPatchBatches(bMesh) -> list[PatchBatch]:
+        """ Classify every vert/face and gather its neighbor vert ids, grouped by constructor and mask
+        """
+        groups = {}
+        seeds = [(bMesh.verts, PatchHelper.vert_based_patch_constructors, True),
+                 (bMesh.faces, PatchHelper.face_based_patch_constructors, False)]
+        for elems, constructors, is_vert_based in seeds:
+            for elem in elems:
+                for pc in constructors:
+                    if pc.is_same_type(elem):
+                        key = (pc, pc.get_mask_name(elem), is_vert_based)
+                        source_ids, neighbor_ids = groups.setdefault(key, ([], []))
+                        source_ids.append(elem.index)
+                        neighbor_ids.append(Helper.get_verts_id(pc.get_neighbor_verts(elem)))
+
+        patchBatches = []
+        for (pc, mask_name, is_vert_based), (source_ids, neighbor_ids) in groups.items():
+            patchBatches.append(PatchBatch(
+                constructor=pc,
+                mask_name=mask_name,
+                is_vert_based=is_vert_based,
+                source_ids=np.array(source_ids, dtype=np.int64),
+                neighbor_ids=np.array(neighbor_ids, dtype=np.int64)
+            ))
+        return patchBatches
+
+    @staticmethod
+    def evaluatePatchBatch(patchBatch: PatchBatch, positions, isBSpline = True):
+        """ Return the coefs of every seed of the batch as N by rows by 3 matrix
+        The rows of a seed hold one or more patches, (deg_u + 1) * (deg_v + 1) rows each
+        """
+        mask = patchBatch.constructor.get_coef_mask(patchBatch.mask_name, isBSpline)
+        return Helper.apply_mask_on_neighbor_ids_batched(mask, positions, patchBatch.neighbor_ids)
+
+    @staticmethod
+    def getBatchCornerCoords(patchBatch: PatchBatch, positions, isBSpline = True, coefs = None):
+        """ Return the corner coords of every seed of the batch as N by corners by 3 matrix
+        Bezier coefs are sliced directly, for B-spline coefs only the corner rows of the mask are applied
+        """
+        pc = patchBatch.constructor
+        if not isBSpline and coefs is not None:
+            return coefs[:, pc.get_corner_ids(patchBatch.mask_name)]
+        corner_mask = pc.get_corner_mask(patchBatch.mask_name)
+        return Helper.apply_mask_on_neighbor_ids_batched(corner_mask, positions, patchBatch.neighbor_ids)
+
+    @staticmethod
+    def getBatchedPatches(bMesh, isBSpline = True, patchBatches = None, batchCoefs = None) -> list[PatchWrapper]:
+        """ Build the PatchWrappers batch by batch, reusing patchBatches if they are given
+        batchCoefs holds the already evaluated coefs of each batch (e.g. from ParallelPatchBuilder)
+        """
+        patchWrappers = []
+        positions = Helper.get_vert_positions(bMesh)
+        if patchBatches is None:
+            patchBatches = PatchHelper.getPatchBatches(bMesh)
+        for batch_id, patchBatch in enumerate(patchBatches):
+            pc = patchBatch.constructor
+            if batchCoefs is not None:
+                coefs = batchCoefs[batch_id]
+            else:
+                coefs = PatchHelper.evaluatePatchBatch(patchBatch, positions, isBSpline)
+            num_of_patches = coefs.shape[1] // pc.get_num_of_coef_per_patch()
+            corners = PatchHelper.getBatchCornerCoords(patchBatch, positions, isBSpline, coefs)
+            elems = bMesh.verts if patchBatch.is_vert_based else bMesh.faces
+            for source_id, neighbor_ids, seed_coefs, seed_corners in zip(
+                    patchBatch.source_ids, patchBatch.neighbor_ids, coefs, corners):
+                if isBSpline:
+                    patch = BsplinePatch(
+                        order_u=pc.deg_u + 1,
+                        order_v=pc.deg_v + 1,
+                        struct_name=pc.name,
+                        bspline_coefs=Helper.split_list(Helper.convert_verts_from_matrix_to_list(seed_coefs),
+                                                        num_of_patches)
+                    )
+                else:
+                    patch = BezierPatch(
+                        order_u=pc.deg_u + 1,
+                        order_v=pc.deg_v + 1,
+                        struct_name=pc.name,
+                        bezier_coefs=Helper.split_list(seed_coefs, num_of_patches)
+                    )
+                patch.corner_coords = list(seed_corners)
+                neighborVerts = [bMesh.verts[i] for i in neighbor_ids]
+                patchWrappers.append(PatchWrapper(patch, isBSpline, elems[source_id], neighborVerts))
+        return patchWrappers
+
     # harry addition
     @staticmethod
     def calculate_corner_coords(cls, patchWrapper: PatchWrapper) -> list:
         """
-        Calculate the corner coordinates of a patch using the mask
+        Calculate the corner coordinates of a patch with the cached corner rows of its mask
         """
-        corner_coords = []
-        if(patchWrapper.patch.struct_name == "Regular"):
-            # THIS ONE WORKS
-            nb_verts = patchWrapper.neighbors
-            corner_coords.append(np.mean(Helper.convert_verts_from_list_to_matrix([nb_verts[0], nb_verts[1], nb_verts[3], nb_verts[4]]), axis=0))   #Corner 0
-            corner_coords.append(np.mean(Helper.convert_verts_from_list_to_matrix([nb_verts[1], nb_verts[2], nb_verts[4], nb_verts[5]]), axis=0))   #Corner 1
-            corner_coords.append(np.mean(Helper.convert_verts_from_list_to_matrix([nb_verts[3], nb_verts[4], nb_verts[6], nb_verts[7]]), axis=0))   #Corner 2
-            corner_coords.append(np.mean(Helper.convert_verts_from_list_to_matrix([nb_verts[4], nb_verts[5], nb_verts[7], nb_verts[8]]), axis=0))   #Corner 3
-            # pass
-        elif (patchWrapper.patch.struct_name == "EOP"):
-            # THIS ONE WORKS
-            nb_verts = patchWrapper.neighbors
-            valence = len(patchWrapper.source.link_edges)
-            mask = Reader.csv_to_masks(["eopSct{}".format(valence)])["eopSct{}".format(valence)]
-            bezier_coefs = Helper.apply_mask_on_neighbor_verts(mask, nb_verts)
-            for coef in range(0, len(bezier_coefs)-16, 16):
-                corner_coords.append(bezier_coefs[coef])
-                corner_coords.append(bezier_coefs[coef+3])
-                corner_coords.append(bezier_coefs[coef+12])
-                corner_coords.append(bezier_coefs[coef+15])
-        elif(patchWrapper.patch.struct_name == "Polar"):
-            # THIS ONE WORKS
-            nb_verts = patchWrapper.neighbors
-            valence = len(patchWrapper.source.link_edges)
-            mask = Reader.csv_to_masks(["polarSct{}".format(valence)])["polarSct{}".format(valence)]
-            bezier_coefs = Helper.apply_mask_on_neighbor_verts(mask, nb_verts)
-            corner_coords.append(bezier_coefs[0])
-            for i in range(9, len(bezier_coefs), 12):
-                corner_coords.append(bezier_coefs[i])
-        elif(patchWrapper.patch.struct_name == "T0"):
-            # THIS ONE WORKS
-            nb_verts = patchWrapper.neighbors
-            mask = Reader.csv_to_masks(["T0"])["T0"]
-            bezier_coefs = Helper.apply_mask_on_neighbor_verts(mask, nb_verts)
-            for coef in range(0, len(bezier_coefs)-16, 16):
-                corner_coords.append(bezier_coefs[coef])
-                corner_coords.append(bezier_coefs[coef+3])
-                corner_coords.append(bezier_coefs[coef+12])
-                corner_coords.append(bezier_coefs[coef+15])
-        elif(patchWrapper.patch.struct_name == "T1"):
-            # THIS ONE WORKS
-            nb_verts = patchWrapper.neighbors
-            mask = Reader.csv_to_masks(["T1"])["T1"]
-            bezier_coefs = Helper.apply_mask_on_neighbor_verts(mask, nb_verts)
-            for coef in range(0, len(bezier_coefs)-16, 16):
-                corner_coords.append(bezier_coefs[coef])
-                corner_coords.append(bezier_coefs[coef+3])
-                corner_coords.append(bezier_coefs[coef+12])
-                corner_coords.append(bezier_coefs[coef+15])
-        elif(patchWrapper.patch.struct_name == "T2"):
-            # THIS ONE WORKS
-            nb_verts = patchWrapper.neighbors
-            mask = Reader.csv_to_masks(["T2"])["T2"]
-            bezier_coefs = Helper.apply_mask_on_neighbor_verts(mask, nb_verts)
-            for coef in range(0, len(bezier_coefs)-16, 16):
-                corner_coords.append(bezier_coefs[coef])
-                corner_coords.append(bezier_coefs[coef+3])
-                corner_coords.append(bezier_coefs[coef+12])
-                corner_coords.append(bezier_coefs[coef+15])
-        elif(patchWrapper.patch.struct_name == "n-gon"):
-            # THIS ONE WORKS
-            nb_verts = patchWrapper.neighbors
-            valence = Helper.edges_number_of_face(patchWrapper.source)
-            mask = Reader.csv_to_masks(["ngonSct{}".format(valence)])["ngonSct{}".format(valence)]
-            bezier_coefs = Helper.apply_mask_on_neighbor_verts(mask, nb_verts)
-            for coef in range(0, len(bezier_coefs)-1, 16):
-                corner_coords.append(bezier_coefs[coef])
-                corner_coords.append(bezier_coefs[coef+3])
-                corner_coords.append(bezier_coefs[coef+12])
-                corner_coords.append(bezier_coefs[coef+15])
-        elif(patchWrapper.patch.struct_name == "2T2Q"):
-            nb_verts = patchWrapper.neighbors
-            corner_coords.append(np.mean(Helper.convert_verts_from_list_to_matrix([nb_verts[0], nb_verts[1], nb_verts[3], nb_verts[4]]), axis=0))   #Corner 0
-            corner_coords.append(np.mean(Helper.convert_verts_from_list_to_matrix([nb_verts[1], nb_verts[2], nb_verts[4], nb_verts[5]]), axis=0))   #Corner 1
-            corner_coords.append(np.mean(Helper.convert_verts_from_list_to_matrix([nb_verts[3], nb_verts[4], nb_verts[6], nb_verts[7]]), axis=0))   #Corner 2
-            corner_coords.append(np.mean(Helper.convert_verts_from_list_to_matrix([nb_verts[4], nb_verts[5], nb_verts[7], nb_verts[8]]), axis=0))   #Corner 3
-        return corner_coords 
\ No newline at end of file
+        pc = PatchHelper.patch_constructors_by_name[patchWrapper.patch.struct_name]
+        corner_mask = pc.get_corner_mask(pc.get_mask_name(patchWrapper.source))
+        return list(Helper.apply_mask_on_neighbor_verts(corner_mask, patchWrapper.neighbors, is_normalized=True))
@@ -0,0 +1,245 @@
+import bpy
+import numpy as np
+from bpy_extras.io_utils import unpack_list
+from .helper import Helper
+from .patch_tracker import PatchTracker
+from collections import defaultdict
+
+
+class PatchOperator:
+    # Create patch with same order_u and order_u only once
+    # The following patch with same size with copy the first one as template
+    # patch_template[order_u][order_v] = "name of patch obj"
+    patch_templates: dict = defaultdict(dict)
+
+    @classmethod
+    def generate_single_patch_obj(cls, bspline_coefs, order_u, order_v, struct_name):
+
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+        template_patch_name = PatchOperator.get_patch_template_name(order_u, order_v)
+        patch_obj = 0
+
+        if not template_patch_name or template_patch_name not in bpy.data.objects:  # no template with wanted u v order
+            patch_obj = PatchOperator.init_patch_template(order_u, order_v)
+            PatchOperator.add_patch_name_to_dict(order_u, order_v, patch_obj.name)
+        else:
+            template_patch_obj = bpy.data.objects[template_patch_name]
+            patch_obj = template_patch_obj.copy()
+            patch_obj.data = template_patch_obj.data.copy()
+            bpy.context.collection.objects.link(patch_obj)
+
+        # Set different color for different structure
+        mat = bpy.data.materials.get(struct_name)
+        if mat is None:
+            mat = bpy.data.materials.new(name=struct_name)
+        patch_obj.active_material = mat
+
+        # Spline coef need an extra dimension "weighting"
+        bspline_coefs_4D = Helper.convert_3d_vectors_to_4d_coords(vecs=bspline_coefs, weighting=1)
+
+        # Assign the position of each control points of bspline
+        patch_obj.data.splines[0].points.foreach_set("co", unpack_list(bspline_coefs_4D))
+
+        return patch_obj.name
+
+    def generate_multiple_patch_obj(patch) -> list:
+        """
+        Input list of bezier coefs then generate multiple patche objects
+        Return list of names for patch objects
+        """
+        obj_names = []
+        for bc in patch.bspline_coefs:
+            obj_names.append(PatchOperator.generate_single_patch_obj(bc, patch.order_u,
+                                                                     patch.order_v, patch.struct_name))
+        return obj_names
+
+    @classmethod
+    def generate_packed_patch_obj(cls, bspline_coefs_list, order_u, order_v, struct_name):
+        """
+        Put every patch with the same orders and structure into one SURFACE object, one spline per patch
+        Return the name of the object, spline i holds bspline_coefs_list[i]
+        """
+        template_patch_name = cls.get_patch_template_name(order_u, order_v)
+        has_template = bool(template_patch_name) and template_patch_name in bpy.data.objects
+        patch_name = cls.generate_single_patch_obj(bspline_coefs_list[0], order_u, order_v, struct_name)
+        if not has_template:
+            # The new object is the template, pack into a copy so the template keeps a single spline
+            template_obj = bpy.data.objects[patch_name]
+            patch_name = cls.generate_single_patch_obj(bspline_coefs_list[0], order_u, order_v, struct_name)
+            bpy.data.objects.remove(template_obj)
+        patch_obj = bpy.data.objects[patch_name]
+        patch_obj.name = "SurfPatches.{}.{}x{}".format(struct_name, order_u, order_v)
+        curve = patch_obj.data
+
+        # There is no API to copy a surface spline, so the splines are duplicated in edit mode,
+        # doubling the count each time
+        bpy.context.view_layer.objects.active = patch_obj
+        num_of_patches = len(bspline_coefs_list)
+        num_of_splines = 1
+        while num_of_splines < num_of_patches:
+            num_to_copy = min(num_of_splines, num_of_patches - num_of_splines)
+            for i, spline in enumerate(curve.splines):
+                spline.points.foreach_set("select", [i < num_to_copy] * len(spline.points))
+            bpy.ops.object.mode_set(mode='EDIT')
+            bpy.ops.curve.duplicate()
+            bpy.ops.object.mode_set(mode='OBJECT')
+            num_of_splines += num_to_copy
+
+        for spline, bspline_coefs in zip(curve.splines, bspline_coefs_list):
+            bspline_coefs_4D = Helper.convert_3d_vectors_to_4d_coords(vecs=bspline_coefs, weighting=1)
+            spline.points.foreach_set("co", unpack_list(bspline_coefs_4D))
+
+        return patch_obj.name
+
+    @staticmethod
+    def update_patch_obj(patch_name, bspline_coefs):  # call after running get patch
+        """ Update a patch by name, wherever it lives (own object or a spline of a packed object)
+        """
+        obj_name, spline_index = PatchTracker.get_patch_spline(patch_name)
+        PatchOperator.update_patch_spline(obj_name, spline_index, bspline_coefs)
+
+    @staticmethod
+    def update_patch_spline(obj_name, spline_index, bspline_coefs):
+        bspline_coefs_4D = Helper.convert_3d_vectors_to_4d_coords(vecs=bspline_coefs, weighting=1)
+        curve = bpy.data.objects[obj_name].data
+        curve.splines[spline_index].points.foreach_set("co", unpack_list(bspline_coefs_4D))
+        curve.update_tag()
+
+    @staticmethod
+    def update_patch_splines(patch_splines, coefs_4d, coef_offsets):
+        """
+        Bulk update of many patches
+        patch_splines: (object name, spline index) of each patch
+        coefs_4d: flat float32 buffer of x, y, z, w, patch i uses the points coef_offsets[i]:coef_offsets[i + 1]
+        Every datablock is tagged for update once
+        """
+        curves = {}
+        for (obj_name, spline_index), start, end in zip(patch_splines, coef_offsets[:-1], coef_offsets[1:]):
+            curve = curves.get(obj_name)
+            if curve is None:
+                curve = curves[obj_name] = bpy.data.objects[obj_name].data
+            curve.splines[spline_index].points.foreach_set("co", coefs_4d[4 * start:4 * end])
+        for curve in curves.values():
+            curve.update_tag()
+
+    @staticmethod
+    def generate_tessellated_obj(name, tessellator):
+        """
+        Create one mesh object holding the tessellation of every patch
+        Return the name of the object
+        """
+        mesh_obj = bpy.data.objects.new(name, PatchOperator.new_tessellated_mesh(name, tessellator))
+        bpy.context.collection.objects.link(mesh_obj)
+        return mesh_obj.name
+
+    @staticmethod
+    def new_tessellated_mesh(name, tessellator):
+        mesh = bpy.data.meshes.new(name)
+        mesh.vertices.add(tessellator.num_verts)
+        mesh.loops.add(len(tessellator.face_indices))
+        mesh.polygons.add(tessellator.num_faces)
+        mesh.vertices.foreach_set("co", tessellator.get_positions().reshape(-1))
+        mesh.loops.foreach_set("vertex_index", tessellator.face_indices.astype(np.int32))
+        mesh.polygons.foreach_set("loop_start", tessellator.face_offsets[:-1].astype(np.int32))
+        if bpy.app.version < (4, 0, 0):
+            mesh.polygons.foreach_set("loop_total", np.diff(tessellator.face_offsets).astype(np.int32))
+        mesh.polygons.foreach_set("use_smooth", np.ones(tessellator.num_faces, dtype=bool))
+        mesh.update(calc_edges=True)
+        PatchOperator.set_tessellated_normals(mesh, tessellator)
+        return mesh
+
+    @staticmethod
+    def replace_tessellated_mesh(obj_name, tessellator):
+        """ Swap in a new mesh when the tessellation changed resolution, the old mesh is removed
+        """
+        mesh_obj = bpy.data.objects[obj_name]
+        old_mesh = mesh_obj.data
+        mesh_name = old_mesh.name
+        mesh_obj.data = PatchOperator.new_tessellated_mesh(mesh_name, tessellator)
+        for mat in old_mesh.materials:
+            mesh_obj.data.materials.append(mat)
+        bpy.data.meshes.remove(old_mesh)
+        mesh_obj.data.name = mesh_name
+
+    @staticmethod
+    def update_tessellated_obj(obj_name, tessellator):
+        """ Write the current vert positions and normals of the tessellation, the faces are unchanged
+        """
+        mesh = bpy.data.objects[obj_name].data
+        mesh.vertices.foreach_set("co", tessellator.get_positions().reshape(-1))
+        PatchOperator.set_tessellated_normals(mesh, tessellator)
+        mesh.update()
+
+    @staticmethod
+    def set_tessellated_normals(mesh, tessellator):
+        # Custom normals need auto smooth before Blender 4.1
+        if hasattr(mesh, "use_auto_smooth"):
+            mesh.use_auto_smooth = True
+        mesh.normals_split_custom_set_from_vertices(tessellator.get_normals())
+
+    @staticmethod
+    def init_patch_template(order_u, order_v):
+        bpy.ops.object.mode_set(mode='OBJECT')
+        bpy.ops.surface.primitive_nurbs_surface_surface_add(radius=1, enter_editmode=True, location=(0, 0, 0))
+
+        patch_obj = bpy.context.active_object
+
+        for p in patch_obj.data.splines[0].points:
+            p.select = False
+
+        if order_u == 3 and order_v == 3:
+            patch_obj.data.splines[0].points[3].select = True
+            patch_obj.data.splines[0].points[7].select = True
+            patch_obj.data.splines[0].points[11].select = True
+            patch_obj.data.splines[0].points[15].select = True
+            bpy.ops.curve.delete(type='VERT')
+            patch_obj.data.splines[0].points[0].select = True
+            patch_obj.data.splines[0].points[1].select = True
+            patch_obj.data.splines[0].points[2].select = True
+            bpy.ops.curve.delete(type='VERT')
+            patch_obj.data.splines[0].order_u = 3
+            patch_obj.data.splines[0].order_v = 3
+        elif order_u == 5 and order_v == 5:
+            patch_obj.data.splines[0].points[0].select = True
+            patch_obj.data.splines[0].points[1].select = True
+            patch_obj.data.splines[0].points[2].select = True
+            patch_obj.data.splines[0].points[3].select = True
+            bpy.ops.curve.extrude_move(CURVE_OT_extrude=None, TRANSFORM_OT_translate=None)
+            for p in patch_obj.data.splines[0].points:
+                p.select = False
+            patch_obj.data.splines[0].points[3].select = True
+            patch_obj.data.splines[0].points[7].select = True
+            patch_obj.data.splines[0].points[11].select = True
+            patch_obj.data.splines[0].points[15].select = True
+            patch_obj.data.splines[0].points[19].select = True
+            bpy.ops.curve.extrude_move(CURVE_OT_extrude=None, TRANSFORM_OT_translate=None)
+            patch_obj.data.splines[0].order_u = 5
+            patch_obj.data.splines[0].order_v = 5
+        elif order_u == 4 and order_v == 4:
+            patch_obj.data.splines[0].order_u = 4
+            patch_obj.data.splines[0].order_v = 4
+        elif order_u == 4 and order_v == 3:
+            patch_obj.data.splines[0].points[3].select = True
+            patch_obj.data.splines[0].points[7].select = True
+            patch_obj.data.splines[0].points[11].select = True
+            patch_obj.data.splines[0].points[15].select = True
+            bpy.ops.curve.delete(type='VERT')
+            patch_obj.data.splines[0].order_u = 3  # TODO: u v reflected problem here need to be fixed.
+            patch_obj.data.splines[0].order_v = 4
+        else:
+            print("patch order has not supported yet")
+
+        return patch_obj
+
+    @classmethod
+    def get_patch_template_name(cls, order_u, order_v):
+        if order_u not in cls.patch_templates:
+            return False
+        if order_v not in cls.patch_templates[order_u]:
+            return False
+        return cls.patch_templates[order_u][order_v]
+
+    @classmethod
+    def add_patch_name_to_dict(cls, order_u, order_v, patch_name):
+        cls.patch_templates[order_u][order_v] = patch_name
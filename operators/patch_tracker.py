@@ -1,79 +1,264 @@
-import bpy
 from dataclasses import dataclass
 
+import numpy as np
+
+from .helper import Helper
+
 
 @dataclass
 class PatchInfo:
     patch_name: str
-    central_obj: bpy.types.MeshVertex
+    central_obj: object  # bpy.types.MeshVertex
     neighbor_vert: list
 
 
 class PatchTracker:
+    """ Integer patch ids with a name table, and a CSR index from vert id to the ids
+    of all patches using the vert. Registration only appends to pending arrays,
+    the index is compacted once on the first lookup after new registrations
+    """
     patch_names: set = set() # keeps all the spline object name
-    vpatch_LUT: dict = {}  # vert to vert-based patch look up table
-    fpatch_LUT: dict = {}  # vert to face-based patch look up table
+
+    # Name table, patch_name_table[patch id] = "name of patch obj"
+    patch_name_table: list = []
+    patch_ids: dict = {}  # name of patch obj to patch id
+
+    # Patch to centre, one entry per patch id
+    patch_centre_ids: np.ndarray = np.zeros(0, dtype=np.int32)  # id of the central vert/face
+    patch_is_vert_based: np.ndarray = np.zeros(0, dtype=bool)
+
+    # Patch to spline, the patch is spline patch_spline_ids[i] of object object_name_table[patch_object_ids[i]]
+    # A patch with its own object is spline 0 of the object with the patch name
+    object_name_table: list = []
+    object_ids: dict = {}  # name of object to object id
+    patch_object_ids: np.ndarray = np.zeros(0, dtype=np.int32)
+    patch_spline_ids: np.ndarray = np.zeros(0, dtype=np.int32)
+
+    # Vert to patches (CSR)
+    # patches of vert v = vert_patch_indices[vert_patch_offsets[v]:vert_patch_offsets[v + 1]]
+    vert_patch_offsets: np.ndarray = np.zeros(1, dtype=np.int64)
+    vert_patch_indices: np.ndarray = np.zeros(0, dtype=np.int32)
+
+    # Registrations not compacted into the arrays yet
+    pending_centre_ids: list = []
+    pending_is_vert_based: list = []
+    pending_object_ids: list = []
+    pending_spline_ids: list = []
+    pending_verts: list = []
+    pending_patches: list = []
 
     # harry addition
     patch_to_corners: dict = {}  # patch name to corner verts
 
     @classmethod
-    def register_patch(cls, central_obj, neighbor_vert, patch_name):
-        cls.patch_names.add(patch_name)
-        if type(central_obj).__name__ == 'BMVert':
-            for nbv in neighbor_vert:
-                if nbv.index not in cls.vpatch_LUT:  # if index is not a key in dict
-                    cls.vpatch_LUT[nbv.index] = {"PatchObjNames": [], "CentralVertID": []}
-                cls.vpatch_LUT[nbv.index]["PatchObjNames"] = cls.vpatch_LUT[nbv.index]["PatchObjNames"] + [patch_name]
-                cls.vpatch_LUT[nbv.index]["CentralVertID"] = \
-                    cls.vpatch_LUT[nbv.index]["CentralVertID"] + [central_obj.index]
-        elif type(central_obj).__name__ == 'BMFace':
-            for nbv in neighbor_vert:
-                if nbv.index not in cls.fpatch_LUT:  # if index is not a key in dict
-                    cls.fpatch_LUT[nbv.index] = {"PatchObjNames": [], "CentralFaceID": []}
-                cls.fpatch_LUT[nbv.index]["PatchObjNames"] = cls.fpatch_LUT[nbv.index]["PatchObjNames"] + [patch_name]
-                cls.fpatch_LUT[nbv.index]["CentralFaceID"] = \
-                    cls.fpatch_LUT[nbv.index]["CentralFaceID"] + [central_obj.index]
+    def get_object_id(cls, obj_name) -> int:
+        if obj_name not in cls.object_ids:
+            cls.object_ids[obj_name] = len(cls.object_name_table)
+            cls.object_name_table.append(obj_name)
+        return cls.object_ids[obj_name]
+
+    @classmethod
+    def register_patch(cls, central_obj, neighbor_vert, patch_name, patch_spline=None):
+        """ patch_spline is the (object name, spline index) holding the patch, by default its own object
+        """
+        if type(central_obj).__name__ in ('BMVert', 'MeshVert'):
+            is_vert_based = True
+        elif type(central_obj).__name__ in ('BMFace', 'MeshFace'):
+            is_vert_based = False
         else:
             print("Input type does not match BMVert or BMFace.")
+            return
+
+        cls.patch_names.add(patch_name)
+        patch_id = len(cls.patch_name_table)
+        cls.patch_name_table.append(patch_name)
+        cls.patch_ids[patch_name] = patch_id
+        cls.pending_centre_ids.append(np.array([central_obj.index], dtype=np.int32))
+        cls.pending_is_vert_based.append(np.array([is_vert_based]))
+        obj_name, spline_index = patch_spline if patch_spline is not None else (patch_name, 0)
+        cls.pending_object_ids.append(np.array([cls.get_object_id(obj_name)], dtype=np.int32))
+        cls.pending_spline_ids.append(np.array([spline_index], dtype=np.int32))
+        vert_ids = np.fromiter((nbv.index for nbv in neighbor_vert), dtype=np.int32)
+        cls.pending_verts.append(vert_ids)
+        cls.pending_patches.append(np.full(len(vert_ids), patch_id, dtype=np.int32))
+
+    @classmethod
+    def register_multiple_patches(cls, central_obj, neighbor_vert, patch_names, patch_splines=None):
+        if patch_splines is None:
+            patch_splines = [None] * len(patch_names)
+        for pn, ps in zip(patch_names, patch_splines):
+            cls.register_patch(central_obj, neighbor_vert, pn, ps)
+
+    @classmethod
+    def register_patch_arrays(cls, patch_names, centre_ids, is_vert_based, neighbor_ids,
+                              obj_name=None, spline_ids=None):
+        """ Register many patches at once, neighbor_ids is a number of patches by k matrix of vert ids
+        The patches are the splines spline_ids of obj_name, or each has its own object if obj_name is None
+        """
+        first_id = len(cls.patch_name_table)
+        cls.patch_names.update(patch_names)
+        cls.patch_name_table.extend(patch_names)
+        cls.patch_ids.update(zip(patch_names, range(first_id, len(cls.patch_name_table))))
+        cls.pending_centre_ids.append(np.asarray(centre_ids, dtype=np.int32))
+        cls.pending_is_vert_based.append(np.broadcast_to(np.asarray(is_vert_based, dtype=bool), len(patch_names)))
+        if obj_name is None:
+            cls.pending_object_ids.append(np.array([cls.get_object_id(pn) for pn in patch_names], dtype=np.int32))
+            cls.pending_spline_ids.append(np.zeros(len(patch_names), dtype=np.int32))
+        else:
+            cls.pending_object_ids.append(np.full(len(patch_names), cls.get_object_id(obj_name), dtype=np.int32))
+            cls.pending_spline_ids.append(np.asarray(spline_ids, dtype=np.int32))
+        neighbor_ids = np.asarray(neighbor_ids, dtype=np.int32)
+        cls.pending_verts.append(neighbor_ids.reshape(-1))
+        cls.pending_patches.append(np.repeat(np.arange(first_id, len(cls.patch_name_table), dtype=np.int32),
+                                             neighbor_ids.shape[1]))
+
+    @classmethod
+    def register_stencil_index(cls, stencil_index):
+        """ Register every patch of the stencil index at once, with the names and splines of its set_patch_names
+        The vert to patch pairs are the CSR index of the stencil index, a vert is linked to the patches it feeds
+        """
+        first_id = len(cls.patch_name_table)
+        patch_names = stencil_index.patch_names
+        cls.patch_names.update(patch_names)
+        cls.patch_name_table.extend(patch_names)
+        cls.patch_ids.update(zip(patch_names, range(first_id, len(cls.patch_name_table))))
+
+        # Centre of every patch: the source of its seed, seeds are numbered batch after batch
+        batches = stencil_index.batches
+        seed_offsets = np.zeros(len(batches) + 1, dtype=np.int64)
+        seed_offsets[1:] = np.cumsum([len(b.source_ids) for b in batches])
+        source_ids = np.concatenate([b.source_ids for b in batches] + [np.zeros(0, dtype=np.int64)])
+        seed_ids = seed_offsets[stencil_index.patch_batch_ids] + stencil_index.patch_seed_rows
+        cls.pending_centre_ids.append(source_ids[seed_ids].astype(np.int32))
+        is_vert_based = np.array([b.is_vert_based for b in batches], dtype=bool)
+        cls.pending_is_vert_based.append(is_vert_based[stencil_index.patch_batch_ids])
+        cls.pending_object_ids.append(np.array([cls.get_object_id(obj_name)
+                                                for obj_name, _ in stencil_index.patch_splines], dtype=np.int32))
+        cls.pending_spline_ids.append(np.array([spline_index for _, spline_index in stencil_index.patch_splines],
+                                               dtype=np.int32))
+
+        offsets, indices = stencil_index.get_vert_patch_index()
+        cls.pending_verts.append(np.repeat(np.arange(len(offsets) - 1, dtype=np.int32), np.diff(offsets)))
+        cls.pending_patches.append((indices + first_id).astype(np.int32))
+
+    @classmethod
+    def build_index(cls):
+        """ Merge the pending registrations into the CSR arrays
+        """
+        if not cls.pending_centre_ids:
+            return
+        cls.patch_centre_ids = np.concatenate([cls.patch_centre_ids] + cls.pending_centre_ids)
+        cls.patch_is_vert_based = np.concatenate([cls.patch_is_vert_based] + cls.pending_is_vert_based)
+        cls.patch_object_ids = np.concatenate([cls.patch_object_ids] + cls.pending_object_ids)
+        cls.patch_spline_ids = np.concatenate([cls.patch_spline_ids] + cls.pending_spline_ids)
+
+        # Expand the current index back to (vert, patch) pairs and add the new ones
+        num_indexed_verts = len(cls.vert_patch_offsets) - 1
+        verts = [np.repeat(np.arange(num_indexed_verts, dtype=np.int32), np.diff(cls.vert_patch_offsets))]
+        verts.extend(cls.pending_verts)
+        patches = [cls.vert_patch_indices] + cls.pending_patches
+        verts = np.concatenate(verts)
+        patches = np.concatenate(patches)
+
+        # Patch ids only grow, so a stable sort by vert keeps each vert's patches in registration order
+        order = np.argsort(verts, kind="stable")
+        num_verts = max(num_indexed_verts, int(verts.max()) + 1 if len(verts) else 0)
+        cls.vert_patch_indices = patches[order]
+        cls.vert_patch_offsets = np.zeros(num_verts + 1, dtype=np.int64)
+        cls.vert_patch_offsets[1:] = np.cumsum(np.bincount(verts, minlength=num_verts))
+
+        cls.pending_centre_ids = []
+        cls.pending_is_vert_based = []
+        cls.pending_object_ids = []
+        cls.pending_spline_ids = []
+        cls.pending_verts = []
+        cls.pending_patches = []
+
+    @classmethod
+    def get_vert_patch_ids(cls, vert_id) -> np.ndarray:
+        """ Return the ids of all patches using the input vert id, in registration order
+        """
+        cls.build_index()
+        if vert_id >= len(cls.vert_patch_offsets) - 1:
+            return cls.vert_patch_indices[:0]
+        return cls.vert_patch_indices[cls.vert_patch_offsets[vert_id]:cls.vert_patch_offsets[vert_id + 1]]
 
     @classmethod
-    def register_multiple_patches(cls, central_obj, neighbor_vert, patch_names):
-        for pn in patch_names:
-            cls.register_patch(central_obj, neighbor_vert, pn)
+    def get_patch_ids(cls, vert_ids) -> np.ndarray:
+        """ Return the sorted unique ids of the patches using any of the input vert ids
+        """
+        cls.build_index()
+        vert_ids = np.asarray(vert_ids, dtype=np.int64)
+        vert_ids = vert_ids[vert_ids < len(cls.vert_patch_offsets) - 1]
+        starts = cls.vert_patch_offsets[vert_ids]
+        counts = cls.vert_patch_offsets[vert_ids + 1] - starts
+        # Position of every entry of the selected CSR rows, gathered without a python loop
+        entries = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        patch_ids = cls.vert_patch_indices[entries]
+        num_patches = len(cls.patch_name_table)
+        if len(patch_ids) * 16 < num_patches:
+            return Helper.get_unique_ids(patch_ids)
+        # Many moved verts: marking the patches is cheaper than sorting
+        is_affected = np.zeros(num_patches, dtype=bool)
+        is_affected[patch_ids] = True
+        return np.flatnonzero(is_affected)
+
+    @classmethod
+    def get_patch_spline(cls, patch_name) -> tuple:
+        """ Return the object name and spline index holding the patch
+        """
+        cls.build_index()
+        patch_id = cls.patch_ids[patch_name]
+        return cls.object_name_table[cls.patch_object_ids[patch_id]], int(cls.patch_spline_ids[patch_id])
+
+    @classmethod
+    def get_patch_names(cls, patch_ids) -> list:
+        return [cls.patch_name_table[i] for i in patch_ids]
 
     @classmethod
     def get_central_vert_ID(cls, vert) -> list:
         """ Return the belonging central vert for the input vert
         """
-        if vert.index in cls.vpatch_LUT:
-            return cls.vpatch_LUT[vert.index].get("CentralVertID")
-        else:
+        patch_ids = cls.get_vert_patch_ids(vert.index)
+        patch_ids = patch_ids[cls.patch_is_vert_based[patch_ids]]
+        if len(patch_ids) == 0:
             return False
+        return cls.patch_centre_ids[patch_ids].tolist()
 
     @classmethod
     def get_central_face_ID(cls, vert) -> list:
         """ Return the belonging central face for the input vert
         """
-        if vert.index in cls.fpatch_LUT:
-            return cls.fpatch_LUT[vert.index].get("CentralFaceID")
-        else:
+        patch_ids = cls.get_vert_patch_ids(vert.index)
+        patch_ids = patch_ids[~cls.patch_is_vert_based[patch_ids]]
+        if len(patch_ids) == 0:
             return False
+        return cls.patch_centre_ids[patch_ids].tolist()
+
+    @classmethod
+    def get_patch_obj_names(cls, vert_id) -> list:
+        """ Return the names of all vert-based and face-based patch objs using the input vert id
+        """
+        patch_ids = cls.get_vert_patch_ids(vert_id)
+        is_vert_based = cls.patch_is_vert_based[patch_ids]
+        return cls.get_patch_names(patch_ids[is_vert_based]) + cls.get_patch_names(patch_ids[~is_vert_based])
 
     @classmethod
     def get_vert_based_patch_obj_name(cls, vert) -> list:
         """ Return the belonging patch obj name for the input vert
         """
-        if vert.index in cls.vpatch_LUT:
-            return cls.vpatch_LUT[vert.index].get("PatchObjNames")
-        else:
+        patch_ids = cls.get_vert_patch_ids(vert.index)
+        patch_ids = patch_ids[cls.patch_is_vert_based[patch_ids]]
+        if len(patch_ids) == 0:
             return False
+        return cls.get_patch_names(patch_ids)
 
     @classmethod
     def get_face_based_patch_obj_name(cls, vert) -> list:
         """ Return the belonging patch obj name for the input vert
         """
-        if vert.index in cls.fpatch_LUT:
-            return cls.fpatch_LUT[vert.index].get("PatchObjNames")
-        else:
+        patch_ids = cls.get_vert_patch_ids(vert.index)
+        patch_ids = patch_ids[~cls.patch_is_vert_based[patch_ids]]
+        if len(patch_ids) == 0:
             return False
+        return cls.get_patch_names(patch_ids)
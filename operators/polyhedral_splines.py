@@ -7,11 +7,18 @@ from .patch_helper import PatchHelper
 from .helper import Helper
 from .highlighter import Highlighter
 from .patch_tracker import PatchTracker
-from .patch import PatchOperator
+from .patch_operator import PatchOperator
 from .bivariateBBFunctions import bbFunctions
 from .moments import Moments
+from .halfedge_mesh import HalfedgeMesh
+from .stencil_index import StencilIndex
+from .parallel_patch_builder import ParallelPatchBuilder
+from .incremental_updater import IncrementalUpdater
+from .tessellator import Tessellator
+from .moment_accumulator import MomentAccumulator
 
 import math
+import functools
 
 # Debug
 import time
@@ -73,17 +80,42 @@ class PolyhedralSplines(bpy.types.Operator):
         obj = context.view_layer.objects.active
         control_mesh = obj.data
 
-        bm = bmesh.new()
-        bm.from_mesh(control_mesh)
-        bm.verts.ensure_lookup_table()
-        bm.faces.ensure_lookup_table() 
+        # Classify the topology once, interactive updates reuse the stencil index
+        mesh = HalfedgeMesh.from_mesh(control_mesh)
+        num_workers = context.scene.polyhedral_splines_workers
+        patchBatches, batchCoefs = ParallelPatchBuilder.build(mesh, num_workers=num_workers)
+        stencil_index = StencilIndex.build(mesh, patchBatches)
 
-        patchWrappers = PatchHelper.getPatches(bm)
+        patchWrappers = PatchHelper.getPatches(mesh, batched=True, patchBatches=patchBatches, batchCoefs=batchCoefs)
+        if context.scene.polyhedral_splines_tessellated:
+            PolyhedralSplines.generate_tessellated_obj(obj, stencil_index, mesh, patchWrappers)
+        else:
+            if context.scene.polyhedral_splines_packed:
+                allPatchNames, allPatchSplines = PolyhedralSplines.generate_packed_patch_objs(obj, patchWrappers)
+            else:
+                allPatchNames, allPatchSplines = PolyhedralSplines.generate_patch_objs(obj, patchWrappers), None
+            # Patch ids of the stencil index follow the order the patches were generated in
+            stencil_index.set_patch_names(allPatchNames, allPatchSplines)
+            PatchTracker.register_stencil_index(stencil_index)
+        StencilIndex.register(obj.name, stencil_index)
+        IncrementalUpdater.register(obj.name, IncrementalUpdater.from_mesh(stencil_index, mesh))
+
+        obj.select_set(True)
+        bpy.context.view_layer.objects.active = obj
+        Moments.execute(self, context)
+
+        PolyhedralSplines.full_verts, PolyhedralSplines.verts = PolyhedralSplines.get_verts()
+        bpy.app.handlers.depsgraph_update_post.append(edit_object_change_handler)
+                
+    def generate_patch_objs(obj, patchWrappers) -> list:
+        """ One object per patch, return the patch names in generation order
+        """
+        allPatchNames = []
         for patchWrapper in patchWrappers:
             start = time.process_time()
 
             patchNames = PatchOperator.generate_multiple_patch_obj(patchWrapper.patch)
-            PatchTracker.register_multiple_patches(patchWrapper.source, patchWrapper.neighbors, patchNames)
+            allPatchNames.extend(patchNames)
             for patch_name in patchNames:
                 bpy.context.scene.objects[patch_name].parent = obj
                 # save the corner coordinates of the patch
@@ -91,20 +123,71 @@ class PolyhedralSplines(bpy.types.Operator):
                 PolyhedralSplines.patch_to_corners.update({patch_name : (patchWrapper.patch.struct_name, patchWrapper.patch.corner_coords)})
 
             print("Generate patch obj time usage (sec): ", time.process_time() - start)
+        return allPatchNames
+
+    def generate_packed_patch_objs(obj, patchWrappers) -> tuple:
+        """ One object per (order_u, order_v, struct_name) holding one spline per patch
+        Return the patch names and (object name, spline index) of the patches in generation order,
+        a patch is named after its object and spline index
+        """
+        start = time.process_time()
+
+        # Group the patches, remembering where each one of each wrapper goes
+        groups = {}
+        patchSlots = []
+        for patchWrapper in patchWrappers:
+            patch = patchWrapper.patch
+            group = groups.setdefault((patch.order_u, patch.order_v, patch.struct_name), [])
+            slots = []
+            for bc in patch.bspline_coefs:
+                slots.append(((patch.order_u, patch.order_v, patch.struct_name), len(group)))
+                group.append(bc)
+            patchSlots.append(slots)
+
+        packedNames = {}
+        for (order_u, order_v, struct_name), bspline_coefs_list in groups.items():
+            packedNames[(order_u, order_v, struct_name)] = PatchOperator.generate_packed_patch_obj(
+                bspline_coefs_list, order_u, order_v, struct_name)
+            bpy.context.scene.objects[packedNames[(order_u, order_v, struct_name)]].parent = obj
+
+        allPatchNames = []
+        allPatchSplines = []
+        for patchWrapper, slots in zip(patchWrappers, patchSlots):
+            patchSplines = [(packedNames[key], spline_index) for key, spline_index in slots]
+            patchNames = ["{}[{}]".format(obj_name, spline_index) for obj_name, spline_index in patchSplines]
+            allPatchNames.extend(patchNames)
+            allPatchSplines.extend(patchSplines)
+            for patch_name in patchNames:
+                PolyhedralSplines.patch_to_corners.update(
+                    {patch_name: (patchWrapper.patch.struct_name, patchWrapper.patch.corner_coords)})
+
+        print("Generate packed patch objs time usage (sec): ", time.process_time() - start)
+        return allPatchNames, allPatchSplines
+
+    def generate_tessellated_obj(obj, stencil_index, mesh, patchWrappers) -> list:
+        """ One mesh object with every patch tessellated at its adaptive resolution, no spline objects
+        Return the patch names in generation order, a patch is named after the mesh object and its patch id
+        """
+        start = time.process_time()
+
+        resolutions = get_tessellation_resolutions(bpy.context.scene, stencil_index, mesh.positions)
+        tessellator = Tessellator(stencil_index, mesh.positions, resolutions)
+        tessellator.obj_name = PatchOperator.generate_tessellated_obj("SurfMesh." + obj.name, tessellator)
+        bpy.context.scene.objects[tessellator.obj_name].parent = obj
+        Tessellator.register(obj.name, tessellator)
+
+        allPatchNames = []
+        for patchWrapper in patchWrappers:
+            for _ in patchWrapper.patch.bspline_coefs:
+                patch_name = "{}[{}]".format(tessellator.obj_name, len(allPatchNames))
+                allPatchNames.append(patch_name)
+                PolyhedralSplines.patch_to_corners.update(
+                    {patch_name: (patchWrapper.patch.struct_name, patchWrapper.patch.corner_coords)})
+        stencil_index.set_patch_names(allPatchNames, [(tessellator.obj_name, i) for i in range(len(allPatchNames))])
+
+        print("Generate tessellated obj time usage (sec): ", time.process_time() - start)
+        return allPatchNames
 
-        obj.select_set(True)
-        bpy.context.view_layer.objects.active = obj
-        Moments.execute(self, context)
-        # Finish up, write the bmesh back to the mesh
-        if control_mesh.is_editmode:
-            bmesh.update_edit_mesh(control_mesh)
-        else:
-            bm.to_mesh(control_mesh)
-            control_mesh.update()
-        
-        PolyhedralSplines.full_verts, PolyhedralSplines.verts = PolyhedralSplines.get_verts()
-        bpy.app.handlers.depsgraph_update_post.append(edit_object_change_handler)
-                
     def get_verts(): 
         # if input("full test? (y/n): ") != 'n':
         for parent, val in PolyhedralSplines.patch_to_corners.items():
@@ -240,6 +323,12 @@ def update_surface(context, obj, updated_control_verts=None):
     if obj is None or obj.type != 'MESH':
         return
 
+    # Same topology as at generation (counts and loops): only the patches fed by moved verts are re-evaluated
+    updater = IncrementalUpdater.get(obj.name, obj.data)
+    if updater is not None:
+        update_surface_incrementally(obj, updater, updated_control_verts)
+        return
+
     # Create a BMesh from the control mesh data
     bm = bmesh.new()
     bm.from_mesh(obj.data)
@@ -283,6 +372,93 @@ def update_surface(context, obj, updated_control_verts=None):
 
     bm.free()
 
+
+def update_surface_incrementally(obj, updater, updated_control_verts=None):
+    """Find the moved verts by comparing positions and update the dirty patches in one batch."""
+    changed_vert_ids = None if updated_control_verts is None else list(updated_control_verts)
+    patch_ids, coefs = updater.update(obj.data, changed_vert_ids)
+    accumulator = MomentAccumulator.get(obj.name, updater.stencil_index)
+    if accumulator is not None:
+        update_moments(obj, accumulator, updater.positions, patch_ids)
+    tessellator = Tessellator.get(obj.name)
+    if tessellator is not None:
+        update_tessellation_preview(obj, updater, tessellator, patch_ids, coefs)
+        return
+    patch_ids, coefs_4d, coef_offsets = updater.get_changed_coefs(patch_ids, coefs)
+    patch_splines = [updater.stencil_index.patch_splines[patch_id] for patch_id in patch_ids]
+    PatchOperator.update_patch_splines(patch_splines, coefs_4d, coef_offsets)
+
+
+def update_moments(obj, accumulator, positions, patch_ids):
+    """Replace the moments of the dirty patches and refresh the values shown in the panel."""
+    accumulator.update(positions, patch_ids)
+    volume, center_of_mass, second_moments = accumulator.get_mass_properties()
+    center_of_mass = center_of_mass + numpy.array(obj.location)
+    Moments.setValues(volume, center_of_mass, second_moments)
+    if Moments.CenterOfMassObj is not None and Moments.CurrentSelection == obj:
+        Moments.CenterOfMassObj.location = center_of_mass
+    if bpy.context.screen is not None:
+        for area in bpy.context.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+
+def get_tessellation_resolutions(scene, stencil_index, positions):
+    """Per patch resolution from the flatness tolerance, relative to the size of the control mesh."""
+    positions = numpy.asarray(positions).reshape(-1, 3)
+    size = numpy.linalg.norm(positions.max(axis=0) - positions.min(axis=0)) if len(positions) else 0.0
+    return Tessellator.get_patch_resolutions(stencil_index, positions, scene.polyhedral_splines_tolerance * size,
+                                             max_resolution=scene.polyhedral_splines_resolution)
+
+
+def update_tessellation_preview(obj, updater, tessellator, patch_ids, coefs):
+    """Show a coarse uniform tessellation while dragging, refine_tessellation restores the adaptive one."""
+    start = time.perf_counter()
+    preview = Tessellator.get_preview(obj.name)
+    if preview is None:
+        # First event of the edit: the preview is built from the current positions, no update needed
+        preview = Tessellator(updater.stencil_index, updater.positions,
+                              bpy.context.scene.polyhedral_splines_preview_resolution)
+        preview.obj_name = tessellator.obj_name
+        Tessellator.previews[obj.name] = preview
+        PatchOperator.replace_tessellated_mesh(preview.obj_name, preview)
+    else:
+        preview.update(patch_ids, coefs)
+        PatchOperator.update_tessellated_obj(preview.obj_name, preview)
+    if bpy.context.scene.polyhedral_splines_debug_timings:
+        print("Preview update: %d patches, %d verts, %.2f ms" % (
+            len(patch_ids), preview.num_verts, (time.perf_counter() - start) * 1000))
+
+    # Refine once no update came for settle_time seconds
+    Tessellator.edit_times[obj.name] = time.perf_counter()
+    if obj.name not in Tessellator.pending_refines:
+        Tessellator.pending_refines.add(obj.name)
+        bpy.app.timers.register(functools.partial(refine_tessellation, obj.name),
+                                first_interval=Tessellator.settle_time)
+
+
+def refine_tessellation(obj_name):
+    """Timer callback, rebuild the adaptive tessellation from the settled positions."""
+    waited = time.perf_counter() - Tessellator.edit_times.get(obj_name, 0.0)
+    if waited < Tessellator.settle_time:
+        return Tessellator.settle_time - waited
+    Tessellator.pending_refines.discard(obj_name)
+    preview = Tessellator.previews.pop(obj_name, None)
+    updater = IncrementalUpdater.get(obj_name)
+    if preview is None or updater is None or preview.obj_name not in bpy.data.objects:
+        return None
+
+    start = time.perf_counter()
+    resolutions = get_tessellation_resolutions(bpy.context.scene, updater.stencil_index, updater.positions)
+    tessellator = Tessellator(updater.stencil_index, updater.positions, resolutions)
+    tessellator.obj_name = preview.obj_name
+    Tessellator.register(obj_name, tessellator)
+    PatchOperator.replace_tessellated_mesh(tessellator.obj_name, tessellator)
+    if bpy.context.scene.polyhedral_splines_debug_timings:
+        print("Refined tessellation: %d verts (preview %d), %.2f ms" % (
+            tessellator.num_verts, preview.num_verts, (time.perf_counter() - start) * 1000))
+    return None
+
 # def update_surface(context, obj):
 #     bm = bmesh.from_edit_mesh(obj.data)
 #     selected_verts = [v for v in bm.verts if v.select]
@@ -332,6 +508,22 @@ def update_surface(context, obj, updated_control_verts=None):
 bpy.app.handlers.depsgraph_update_post.append(edit_object_change_handler)
 bpy.types.Scene.polyhedral_splines_finished = bpy.props.BoolProperty(default=False)
 bpy.types.Scene.previous_object = bpy.props.PointerProperty(type=bpy.types.Object)
+# Worker processes used to build and export the patches and sum their moments.
+# 1 works in this process, more fork the Blender process
+bpy.types.Scene.polyhedral_splines_workers = bpy.props.IntProperty(default=1, min=1, max=64)
+# Pack the patches into one multi-spline surface object per (order_u, order_v, struct_name)
+bpy.types.Scene.polyhedral_splines_packed = bpy.props.BoolProperty(default=False)
+# Show the patches as one tessellated mesh instead of NURBS surface objects.
+# Only this mode has adaptive resolution and the coarse drag preview, the surface objects keep Blender's own resolution
+bpy.types.Scene.polyhedral_splines_tessellated = bpy.props.BoolProperty(default=False)
+# Largest number of samples per patch side of the tessellated mesh
+bpy.types.Scene.polyhedral_splines_resolution = bpy.props.IntProperty(default=17, min=2, max=65)
+# Largest distance of the tessellated mesh to the patches, relative to the size of the control mesh
+bpy.types.Scene.polyhedral_splines_tolerance = bpy.props.FloatProperty(default=1e-3, min=1e-6, max=1.0)
+# Samples per patch side of the tessellated mesh while the control mesh is dragged
+bpy.types.Scene.polyhedral_splines_preview_resolution = bpy.props.IntProperty(default=3, min=2, max=65)
+# Print the vert counts and latency of every preview update and refinement, tessellationBenchmark reports them headless
+bpy.types.Scene.polyhedral_splines_debug_timings = bpy.props.BoolProperty(default=False)
 # old
 # @persistent
 # def edit_object_change_handler(context):
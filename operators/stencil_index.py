@@ -0,0 +1,191 @@
+import numpy as np
+
+from .helper import Helper
+from .patch_helper import PatchHelper, PatchBatch
+
+"""
+The stencil index is built once per mesh topology. It records, for every
+patch, which constructor and mask produce it and which neighbor verts feed
+the mask. While only vert positions change, a patch is re-evaluated by a
+gather from the current positions plus one fused matrix product, without
+running is_same_type or walking halfedges again.
+"""
+
+
+class StencilIndex:
+    # Stencil index of each control mesh, stencil_indices["object name"] = StencilIndex
+    stencil_indices: dict = {}
+
+    constructors: list = PatchHelper.vert_based_patch_constructors + PatchHelper.face_based_patch_constructors
+
+    def __init__(self, patchBatches: list[PatchBatch], topology_key):
+        self.batches = patchBatches
+        self.topology_key = topology_key
+
+        # Per batch: constructor id, mask id and number of patches per seed
+        self.mask_names = [(b.constructor.name, b.mask_name) for b in patchBatches]
+        self.batch_constructor_ids = np.array(
+            [StencilIndex.constructors.index(b.constructor) for b in patchBatches], dtype=np.int64)
+        self.batch_patches_per_seed = np.array(
+            [len(b.constructor.get_normalized_mask(b.mask_name)) // b.constructor.get_num_of_coef_per_patch()
+             for b in patchBatches], dtype=np.int64)
+        batch_sizes = np.array([len(b.source_ids) for b in patchBatches], dtype=np.int64)
+        num_patches_per_batch = batch_sizes * self.batch_patches_per_seed
+        self.batch_patch_offsets = np.zeros(len(patchBatches) + 1, dtype=np.int64)
+        self.batch_patch_offsets[1:] = np.cumsum(num_patches_per_batch)
+
+        # Per patch: batch (= mask id), row of its seed inside the batch and sub patch of the seed
+        self.patch_batch_ids = np.repeat(np.arange(len(patchBatches)), num_patches_per_batch)
+        self.patch_seed_rows = np.concatenate(
+            [np.repeat(np.arange(n), s) for n, s in zip(batch_sizes, self.batch_patches_per_seed)]
+            + [np.zeros(0, dtype=np.int64)])
+        self.patch_sub_ids = np.concatenate(
+            [np.tile(np.arange(s), n) for n, s in zip(batch_sizes, self.batch_patches_per_seed)]
+            + [np.zeros(0, dtype=np.int64)])
+        self.patch_constructor_ids = self.batch_constructor_ids[self.patch_batch_ids]
+        self.patch_mask_ids = self.patch_batch_ids
+
+        # Coefs of patch i are rows patch_coef_offsets[i]:patch_coef_offsets[i + 1] of all coefs in patch id order
+        batch_coefs_per_patch = np.array([b.constructor.get_num_of_coef_per_patch() for b in patchBatches],
+                                         dtype=np.int64)
+        self.patch_coef_offsets = np.zeros(self.num_patches + 1, dtype=np.int64)
+        self.patch_coef_offsets[1:] = np.cumsum(batch_coefs_per_patch[self.patch_batch_ids])
+
+        # Filled in once the patch objects exist
+        self.patch_names = []
+        self.patch_ids_by_name = {}
+        self.patch_splines = []  # (object name, spline index) of each patch
+
+        # Vert to patch index (CSR), built on first use
+        self.vert_patch_offsets = None
+        self.vert_patch_indices = None
+
+    @classmethod
+    def build(cls, mesh, patchBatches=None):
+        """ Classify the HalfedgeMesh once and gather the neighbor vert ids of every patch
+        """
+        if patchBatches is None:
+            patchBatches = PatchHelper.getPatchBatches(mesh)
+        return cls(patchBatches, cls.get_topology_key(mesh))
+
+    @staticmethod
+    def get_topology_key(mesh):
+        """ Key which changes whenever verts or faces are added, removed or reconnected
+        mesh can be a HalfedgeMesh or a Blender mesh datablock
+        """
+        if hasattr(mesh, "face_indices"):
+            return (mesh.num_verts, mesh.face_offsets.tobytes(), mesh.face_indices.tobytes())
+        loop_total = np.empty(len(mesh.polygons), dtype=np.int64)
+        mesh.polygons.foreach_get("loop_total", loop_total)
+        face_offsets = np.zeros(len(loop_total) + 1, dtype=np.int64)
+        face_offsets[1:] = np.cumsum(loop_total)
+        loop_start = np.empty(len(mesh.polygons), dtype=np.int64)
+        mesh.polygons.foreach_get("loop_start", loop_start)
+        loop_verts = np.empty(len(mesh.loops), dtype=np.int64)
+        mesh.loops.foreach_get("vertex_index", loop_verts)
+        loop_ids = np.repeat(loop_start - face_offsets[:-1], loop_total) + np.arange(face_offsets[-1])
+        return (len(mesh.vertices), face_offsets.tobytes(), loop_verts[loop_ids].tobytes())
+
+    @classmethod
+    def register(cls, obj_name, stencil_index):
+        cls.stencil_indices[obj_name] = stencil_index
+
+    @classmethod
+    def get(cls, obj_name, mesh=None):
+        """ Return the stencil index of the object, or None if there is none or its topology changed
+        """
+        stencil_index = cls.stencil_indices.get(obj_name)
+        if stencil_index is None:
+            return None
+        if mesh is not None and stencil_index.topology_key != cls.get_topology_key(mesh):
+            del cls.stencil_indices[obj_name]
+            return None
+        return stencil_index
+
+    @property
+    def num_patches(self) -> int:
+        return int(self.batch_patch_offsets[-1])
+
+    def set_patch_names(self, patch_names, patch_splines=None):
+        """ Patch names in patch id order (batch by batch, seed by seed, sub patch by sub patch)
+        patch_splines gives the (object name, spline index) of each patch, by default spline 0 of its own object
+        """
+        self.patch_names = list(patch_names)
+        self.patch_ids_by_name = {name: i for i, name in enumerate(self.patch_names)}
+        if patch_splines is None:
+            patch_splines = [(name, 0) for name in self.patch_names]
+        self.patch_splines = list(patch_splines)
+
+    @property
+    def num_verts(self) -> int:
+        return self.topology_key[0]
+
+    def get_vert_patch_index(self):
+        """ Return the CSR offsets and patch ids of the patches each vert feeds
+        A vert is only linked to the patches whose mask rows give it a non zero weight
+        """
+        if self.vert_patch_offsets is None:
+            verts = [np.zeros(0, dtype=np.int64)]
+            patches = [np.zeros(0, dtype=np.int64)]
+            for b, batch in enumerate(self.batches):
+                mask = batch.constructor.get_normalized_mask(batch.mask_name)
+                num_of_coef_per_patch = batch.constructor.get_num_of_coef_per_patch()
+                patches_per_seed = self.batch_patches_per_seed[b]
+                seed_patch_ids = self.batch_patch_offsets[b] + np.arange(len(batch.source_ids)) * patches_per_seed
+                for sub_id in range(patches_per_seed):
+                    rows = mask[sub_id * num_of_coef_per_patch:(sub_id + 1) * num_of_coef_per_patch]
+                    cols = np.flatnonzero(np.any(rows != 0, axis=0))
+                    verts.append(batch.neighbor_ids[:, cols].reshape(-1))
+                    patches.append(np.repeat(seed_patch_ids + sub_id, len(cols)))
+
+            # Sorting the (vert, patch) keys groups the patches by vert and drops duplicates
+            num_patches = np.int64(max(self.num_patches, 1))
+            keys = Helper.get_unique_ids(np.concatenate(verts) * num_patches + np.concatenate(patches))
+            self.vert_patch_indices = keys % num_patches
+            self.vert_patch_offsets = np.zeros(self.num_verts + 1, dtype=np.int64)
+            self.vert_patch_offsets[1:] = np.cumsum(np.bincount(keys // num_patches, minlength=self.num_verts))
+        return self.vert_patch_offsets, self.vert_patch_indices
+
+    def get_dirty_patches(self, vert_ids):
+        """ Return the sorted unique ids of the patches fed by any of the verts
+        """
+        offsets, indices = self.get_vert_patch_index()
+        vert_ids = np.asarray(vert_ids, dtype=np.int64)
+        starts = offsets[vert_ids]
+        counts = offsets[vert_ids + 1] - starts
+        # Position of every entry of the selected CSR rows, gathered without a python loop
+        entries = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return Helper.get_unique_ids(indices[entries])
+
+    def get_patch_order(self, patch_id):
+        batch = self.batches[self.patch_batch_ids[patch_id]]
+        return batch.constructor.deg_u + 1, batch.constructor.deg_v + 1
+
+    def evaluate(self, positions, isBSpline=True) -> list:
+        """ Evaluate every patch. Return one N by patches_per_seed by coefs_per_patch by 3 array per batch
+        """
+        coefs = []
+        for batch in self.batches:
+            seed_coefs = PatchHelper.evaluatePatchBatch(batch, positions, isBSpline)
+            num_of_coef_per_patch = batch.constructor.get_num_of_coef_per_patch()
+            coefs.append(seed_coefs.reshape(len(batch.source_ids), -1, num_of_coef_per_patch, 3))
+        return coefs
+
+    def evaluate_patches(self, positions, patch_ids, isBSpline=True):
+        """ Re-evaluate only the given patches. Each seed is evaluated once even if several
+        of its patches are requested. Return the unique patch ids and a list of their coefs
+        """
+        patch_ids = np.unique(np.asarray(patch_ids, dtype=np.int64))
+        coefs = [None] * len(patch_ids)
+        batch_ids = self.patch_batch_ids[patch_ids]
+        for b in np.unique(batch_ids):
+            batch = self.batches[b]
+            in_batch = np.flatnonzero(batch_ids == b)
+            seed_rows, seed_inverse = np.unique(self.patch_seed_rows[patch_ids[in_batch]], return_inverse=True)
+            mask = batch.constructor.get_coef_mask(batch.mask_name, isBSpline)
+            seed_coefs = Helper.apply_mask_on_neighbor_ids_batched(mask, positions, batch.neighbor_ids[seed_rows])
+            seed_coefs = seed_coefs.reshape(len(seed_rows), -1, batch.constructor.get_num_of_coef_per_patch(), 3)
+            sub_ids = self.patch_sub_ids[patch_ids[in_batch]]
+            for k, c in zip(in_batch, seed_coefs[seed_inverse.reshape(-1), sub_ids]):
+                coefs[k] = c
+        return patch_ids, coefs
@@ -1,6 +1,5 @@
 from .patch_constructor import PatchConstructor
 from .halfedge import Halfedge
-from .bezier_bspline_converter import BezierBsplineConverter
 from .patch import BezierPatch, BsplinePatch
 from .helper import Helper
 from .csv_reader import Reader
@@ -8,6 +7,8 @@ from .csv_reader import Reader
 
 class T2PatchConstructor(PatchConstructor):
     name: str = "T2"
+    deg_u: int = 3
+    deg_v: int = 3
     mask_file_names = ["T2"]
     masks = Reader.csv_to_masks(mask_file_names)
 
@@ -87,36 +88,44 @@ class T2PatchConstructor(PatchConstructor):
 
 
 
+    @classmethod
+    def get_mask_name(cls, face) -> str:
+        return cls.name
+
+    @classmethod
+    def get_corner_ids(cls, mask_name) -> list:
+        return cls.get_bicubic_corner_ids(len(cls.masks[mask_name]) // 16)
+
     @classmethod
     def get_patch(cls, face, isBspline = True ) -> list:
 
-        deg_u = 3
-        deg_v = 3
+        deg_u = cls.deg_u
+        deg_v = cls.deg_v
         order_u = deg_u + 1
         order_v = deg_v + 1
 
         nb_verts = cls.get_neighbor_verts(face)
 
-        bezier_coefs = Helper.apply_mask_on_neighbor_verts(cls.masks[cls.name], nb_verts)
-        bspline_coefs = BezierBsplineConverter.bezier_to_bspline(bezier_coefs, deg_u, deg_v)
-        bspline_coefs = Helper.convert_verts_from_matrix_to_list(bspline_coefs)
+        # The B-spline mask already includes the bezier to B-spline conversion
+        coefs = Helper.apply_mask_on_neighbor_verts(
+            cls.get_coef_mask(cls.get_mask_name(face), isBspline), nb_verts, is_normalized=True)
 
         # The table output coef for multiple patches so we need to figure out
         # how many patches are generated.
         # The number of patches = # of rows / # of coef per patch
         num_of_coef_per_patch = (deg_u + 1) * (deg_v + 1)
-        num_of_patches = len(bspline_coefs) / num_of_coef_per_patch
+        num_of_patches = len(coefs) / num_of_coef_per_patch
         if(isBspline):
             return BsplinePatch(
                 order_u=order_u,
                 order_v=order_v,
                 struct_name=cls.name,
-                bspline_coefs=Helper.split_list(bspline_coefs, int(num_of_patches))
+                bspline_coefs=Helper.split_list(Helper.convert_verts_from_matrix_to_list(coefs), int(num_of_patches))
             )
         else:
             return BezierPatch(
                 order_u=order_u,
                 order_v=order_v,
                 struct_name=cls.name,
-                bezier_coefs=Helper.split_list(bezier_coefs, int(num_of_patches))
+                bezier_coefs=Helper.split_list(coefs, int(num_of_patches))
             )
\ No newline at end of file
@@ -0,0 +1,622 @@
+import numpy as np
+from math import comb
+
+from .bezier_bspline_converter import BezierBsplineConverter
+from .helper import Helper
+
+"""
+Tessellation of every patch of a control mesh into one render mesh.
+
+The Bernstein basis and its derivative are tabulated once per degree and
+resolution, so a batch of patches of the same degree is evaluated on its
+(u, v) grid with two matrix products. B-spline coefs are handled by folding
+the B-spline to Bezier transform into the basis. The samples of all patches
+are welded along the seams once, the weld and the faces are then reused
+while only positions change. Normals come from the cross product of the
+partial derivatives, averaged over the samples welded into a vert.
+
+The resolution can differ per patch. get_patch_resolutions picks it from
+the flatness of the Bezier net against a world-space tolerance, rounded up
+to 2 ** k + 1 samples per side so a coarser neighbor's samples are a
+subset of a finer one's along their common edge.
+
+Where the samples of the two sides of an edge differ, at a finer neighbor
+or at a T-junction where an edge meets several patches, get_seams finds the
+edge before the weld. Its samples are snapped to their neighbors' and the
+samples of the other side are inserted into the faces along the edge, so
+the render mesh has no cracks.
+"""
+
+
+class Tessellator:
+    # Tessellator of each control mesh, tessellators["object name"] = Tessellator
+    tessellators: dict = {}
+
+    # basis_matrices[(deg, resolution, isBSpline)] = (values, derivatives), each resolution by deg + 1
+    basis_matrices: dict = {}
+
+    # Coarse tessellation shown while the control mesh is dragged, previews["object name"] = Tessellator
+    previews: dict = {}
+
+    # Seconds without an edit before the preview is replaced by the adaptive tessellation
+    settle_time: float = 0.3
+    # Last edit (time.perf_counter()) and pending refinement of each object
+    edit_times: dict = {}
+    pending_refines: set = set()
+
+    # Samples closer than weld_tolerance times the bounding box diagonal become one vert
+    weld_tolerance: float = 1e-6
+
+    # Boundary curves hashed per chunk when looking for seams, bounds the memory of their samples
+    chunk_curves: int = 1 << 16
+    # A sample is projected onto a boundary curve from the closest of projection_samples uniform params
+    # by newton_steps Newton steps
+    projection_samples: int = 17
+    newton_steps: int = 8
+
+    def __init__(self, stencil_index, positions, resolution=8):
+        """ resolution is the number of samples per patch side, one for all patches or one per patch
+        """
+        self.stencil_index = stencil_index
+        self.patch_resolutions = np.broadcast_to(np.asarray(resolution, dtype=np.int64),
+                                                 stencil_index.num_patches).copy()
+
+        # Sample s of patch p is row patch_sample_offsets[p] + s, with s = i * resolution + j at (u_i, v_j)
+        self.patch_sample_offsets = np.zeros(stencil_index.num_patches + 1, dtype=np.int64)
+        self.patch_sample_offsets[1:] = np.cumsum(self.patch_resolutions ** 2)
+        self.sample_points = np.zeros((self.num_samples, 3))
+        self.sample_normals = np.zeros((self.num_samples, 3))
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        curves = []
+        for b, coefs in enumerate(stencil_index.evaluate(positions, isBSpline=False)):
+            patch_ids = np.arange(stencil_index.batch_patch_offsets[b], stencil_index.batch_patch_offsets[b + 1])
+            self.__set_samples__(patch_ids, coefs.reshape(len(patch_ids), -1, 3), b, isBSpline=False)
+            constructor = stencil_index.batches[b].constructor
+            nets = coefs.reshape(len(patch_ids), constructor.deg_u + 1, constructor.deg_v + 1, 3)
+            curves += [(4 * patch_ids + e, edge) for e, edge in enumerate(Tessellator.get_edges(nets))]
+
+        # Snap the samples of the seams before the weld, so both sides of a seam weld into the same verts.
+        # Each snapped sample takes the point of its source sample, update() snaps them again
+        extent = np.linalg.norm(self.sample_points.max(axis=0) - self.sample_points.min(axis=0)) \
+            if self.num_samples else 0.0
+        (curve_ids, samples, _, source_curve_ids, source_samples), inserted = Tessellator.get_seams(
+            curves, np.repeat(self.patch_resolutions, 4), max(extent * Tessellator.weld_tolerance, 1e-300))
+        self.snapped_rows = self.get_curve_sample_rows(curve_ids, samples)
+        self.snapped_source_rows = self.get_curve_sample_rows(source_curve_ids, source_samples)
+        self.snapped_patch_ids = curve_ids // 4
+        self.snapped_source_patch_ids = source_curve_ids // 4
+        self.sample_points[self.snapped_rows] = self.sample_points[self.snapped_source_rows]
+
+        self.vert_ids, self.vert_sample_ids = Tessellator.weld_points(self.sample_points, Tessellator.weld_tolerance,
+                                                                      extent)
+        self.face_offsets, self.face_indices, self.face_patch_ids = self.__build_faces__(inserted)
+
+        # Vert to samples (CSR), samples of vert v = vert_samples[vert_sample_offsets[v]:vert_sample_offsets[v + 1]]
+        self.vert_samples = np.argsort(self.vert_ids, kind="stable")
+        self.vert_sample_offsets = np.zeros(self.num_verts + 1, dtype=np.int64)
+        self.vert_sample_offsets[1:] = np.cumsum(np.bincount(self.vert_ids, minlength=self.num_verts))
+
+        # Blender stores vert coords and normals as float32, they are kept ready to be written
+        self.positions = np.zeros((self.num_verts, 3), dtype=np.float32)
+        self.normals = np.zeros((self.num_verts, 3), dtype=np.float32)
+        self.__update_verts__(np.arange(self.num_verts))
+
+        # Name of the render mesh object, set once it exists
+        self.obj_name = None
+
+    @classmethod
+    def register(cls, obj_name, tessellator):
+        cls.tessellators[obj_name] = tessellator
+
+    @classmethod
+    def get(cls, obj_name):
+        return cls.tessellators.get(obj_name)
+
+    @classmethod
+    def get_preview(cls, obj_name):
+        return cls.previews.get(obj_name)
+
+    @property
+    def num_samples(self) -> int:
+        return int(self.patch_sample_offsets[-1])
+
+    @property
+    def num_verts(self) -> int:
+        return len(self.vert_sample_ids)
+
+    @property
+    def num_faces(self) -> int:
+        return len(self.face_offsets) - 1
+
+    @classmethod
+    def get_basis(cls, deg, resolution, isBSpline=False):
+        """ Return the Bernstein basis of the degree and its derivative at resolution uniform parameters,
+        both resolution by deg + 1. For B-spline coefs the basis includes the B-spline to Bezier transform
+        """
+        key = (deg, resolution, isBSpline)
+        if key not in cls.basis_matrices:
+            t = np.linspace(0.0, 1.0, resolution)[:, None]
+            i = np.arange(deg + 1)[None, :]
+            binomials = np.array([comb(deg, k) for k in range(deg + 1)], dtype=np.float64)
+            values = binomials * t ** i * (1 - t) ** (deg - i)
+            # d/dt B_i^deg = deg * (B_{i-1}^{deg-1} - B_i^{deg-1})
+            lower = np.zeros((resolution, deg + 2))
+            lower[:, 1:-1] = np.array([comb(deg - 1, k) for k in range(deg)]) \
+                * t ** i[:, :-1] * (1 - t) ** (deg - 1 - i[:, :-1])
+            derivatives = deg * (lower[:, :-1] - lower[:, 1:])
+            if isBSpline:
+                to_bezier = BezierBsplineConverter.bb2b_mask_selector(deg, invert=True)
+                values, derivatives = values @ to_bezier, derivatives @ to_bezier
+            cls.basis_matrices[key] = (values, derivatives)
+        return cls.basis_matrices[key]
+
+    @classmethod
+    def evaluate_patches(cls, coefs, deg_u, deg_v, resolution, isBSpline=False):
+        """ Evaluate P patches of the same degree, coefs is P by (deg_u+1)*(deg_v+1) by 3 with v running fastest
+        Return the points and unit normals, both P by resolution by resolution by 3.
+        The normal is zero where the surface is degenerate
+        """
+        basis_u, d_basis_u = cls.get_basis(deg_u, resolution, isBSpline)
+        basis_v, d_basis_v = cls.get_basis(deg_v, resolution, isBSpline)
+        num_of_patches = len(coefs)
+        coefs = np.asarray(coefs, dtype=np.float64).reshape(num_of_patches, deg_u + 1, (deg_v + 1) * 3)
+
+        # Contract u first, each result is P by resolution by deg_v + 1 by 3, then v
+        along_u = np.matmul(basis_u, coefs).reshape(num_of_patches, resolution, deg_v + 1, 3)
+        d_along_u = np.matmul(d_basis_u, coefs).reshape(num_of_patches, resolution, deg_v + 1, 3)
+        points = np.matmul(basis_v, along_u)
+        tangents_u = np.matmul(basis_v, d_along_u)
+        tangents_v = np.matmul(d_basis_v, along_u)
+
+        normals = np.cross(tangents_u, tangents_v)
+        lengths = np.linalg.norm(normals, axis=-1, keepdims=True)
+        # Compared to the largest normal of the patch, round-off at a collapsed edge does not count as a normal
+        scale = lengths.max(axis=(1, 2), keepdims=True)
+        is_regular = lengths > 1e-8 * np.maximum(scale, 1e-300)
+        normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=is_regular)
+        return points, normals
+
+    @staticmethod
+    def weld_points(points, tolerance, extent=None):
+        """ Merge points which fall into the same cell of a grid of the given size (relative to extent, by default
+        the diagonal of the bounding box). Return the vert id of every point and the first point of every vert,
+        verts are in order of first use
+        """
+        if len(points) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        if extent is None:
+            extent = np.linalg.norm(points.max(axis=0) - points.min(axis=0))
+        cells = np.round(points / max(extent * tolerance, 1e-300)).astype(np.int64)
+        order = np.lexsort(cells.T[::-1])
+        sorted_cells = cells[order]
+        is_first = np.ones(len(points), dtype=bool)
+        is_first[1:] = np.any(sorted_cells[1:] != sorted_cells[:-1], axis=1)
+
+        # Number the cells by their first point rather than by cell coords, keeping patches together
+        vert_sample_ids = np.minimum.reduceat(order, np.flatnonzero(is_first))
+        first_order = np.argsort(vert_sample_ids)
+        cell_to_vert = np.empty(len(first_order), dtype=np.int64)
+        cell_to_vert[first_order] = np.arange(len(first_order))
+        vert_ids = np.empty(len(points), dtype=np.int64)
+        vert_ids[order] = cell_to_vert[np.cumsum(is_first) - 1]
+        return vert_ids, vert_sample_ids[first_order]
+
+    @staticmethod
+    def get_edges(coefs) -> list:
+        """ Bezier coefs of the four boundary curves of N patches (N by order_u by order_v by 3), in the order
+        of the sides of a grid cell: v = 0 and u = 1 forward, v = 1 and u = 0 backward, each N by order by 3
+        """
+        return [coefs[:, :, 0], coefs[:, -1, :], coefs[:, :, -1], coefs[:, 0, :]]
+
+    @staticmethod
+    def get_edge_samples(edges, samples, resolutions) -> np.ndarray:
+        """ Grid sample i * resolution + j of sample t of boundary curve e (as get_edges) of a patch
+        """
+        i = np.where(edges == 1, resolutions - 1, np.where(edges == 3, 0, samples))
+        j = np.where(edges == 0, 0, np.where(edges == 2, resolutions - 1, samples))
+        return i * resolutions + j
+
+    @staticmethod
+    def get_bernstein(deg, t):
+        """ Bernstein basis of the degree and its first two derivatives at the params t, each len(t) by deg + 1
+        """
+        t = np.asarray(t, dtype=np.float64)[:, None]
+
+        def basis(k):
+            i = np.arange(max(k + 1, 0))
+            return np.array([comb(k, m) for m in i], dtype=np.float64) * t ** i * (1 - t) ** (k - i)
+
+        # d/dt B_i^deg = deg * (B_{i-1}^{deg-1} - B_i^{deg-1}), the second derivative likewise
+        first = -deg * np.diff(np.pad(basis(deg - 1), ((0, 0), (1, 1))), axis=1)
+        second = deg * (deg - 1) * np.diff(np.pad(basis(deg - 2), ((0, 0), (2, 2))), n=2, axis=1)
+        return basis(deg), first, second
+
+    @classmethod
+    def project(cls, coefs, points):
+        """ Param of the point of E curves (E by order by 3 Bezier coefs) closest to E points, and the distance
+        """
+        deg = coefs.shape[1] - 1
+        samples = np.matmul(cls.get_basis(deg, cls.projection_samples)[0], coefs)
+        closest = np.argmin(np.linalg.norm(samples - points[:, None], axis=2), axis=1)
+        params = closest / (cls.projection_samples - 1)
+        for _ in range(cls.newton_steps):
+            values, first, second = cls.get_bernstein(deg, params)
+            offsets = np.einsum("ek,ekd->ed", values, coefs) - points
+            tangents = np.einsum("ek,ekd->ed", first, coefs)
+            # Newton step on the derivative of half the squared distance
+            slopes = np.einsum("ed,ed->e", offsets, tangents)
+            curvatures = np.einsum("ed,ed->e", tangents, tangents) \
+                + np.einsum("ed,ed->e", offsets, np.einsum("ek,ekd->ed", second, coefs))
+            steps = np.divide(slopes, curvatures, out=np.zeros_like(slopes), where=curvatures > 0)
+            params = np.clip(params - steps, 0.0, 1.0)
+        values = cls.get_bernstein(deg, params)[0]
+        return params, np.linalg.norm(np.einsum("ek,ekd->ed", values, coefs) - points, axis=1)
+
+    @staticmethod
+    def get_clusters(points, tolerance) -> np.ndarray:
+        """ Label of every point, the lowest index of the points joined to it by steps shorter than tolerance
+        """
+        cells = np.floor(points / max(tolerance, 1e-300)).astype(np.int64)
+        # One cell of margin on every side, so the neighbor of a cell is an offset of its key
+        cells -= cells.min(axis=0) - 1
+        dims = cells.max(axis=0) + 2
+        keys = np.ravel_multi_index(tuple(cells.T), tuple(dims))
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+
+        pairs = []
+        for di, dj, dk in np.indices((3, 3, 3)).reshape(3, -1).T - 1:
+            neighbor_keys = keys + (di * dims[1] + dj) * dims[2] + dk
+            starts = np.searchsorted(sorted_keys, neighbor_keys, side="left")
+            counts = np.searchsorted(sorted_keys, neighbor_keys, side="right") - starts
+            first = np.repeat(np.arange(len(points)), counts)
+            second = order[np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+            is_close = (first < second) & (np.linalg.norm(points[first] - points[second], axis=1) <= tolerance)
+            pairs.append((first[is_close], second[is_close]))
+        first = np.concatenate([p[0] for p in pairs])
+        second = np.concatenate([p[1] for p in pairs])
+
+        # Spread the lowest label over the pairs until it settles
+        labels = np.arange(len(points))
+        while True:
+            lowest = np.minimum(labels[first], labels[second])
+            spread = labels.copy()
+            np.minimum.at(spread, first, lowest)
+            np.minimum.at(spread, second, lowest)
+            spread = spread[spread]
+            if np.array_equal(spread, labels):
+                return labels
+            labels = spread
+
+    @classmethod
+    def get_seams(cls, curves, resolutions, tolerance, origin=0.0):
+        """ Seams among the boundary curves of the patches. curves is a list of (ids, coefs), the ids of E curves
+        and their E by order by 3 Bezier coefs, the curve of side e (as get_edges) of patch p has id 4 * p + e.
+        Curve c is sampled at resolutions[c] uniform params. A curve is a seam unless another curve has the same
+        samples (in the weld cells of size tolerance from origin) forwards or backwards, i.e. at a T-junction or
+        between patches of different resolutions.
+        The samples of the seams and the ends of all curves closer than tolerance are snapped to one point, the
+        sample of the lowest entry of their cluster, and every seam sample of another patch lying on a seam (closer
+        than tolerance) is inserted into it.
+        Return the snapped samples as (curve ids, sample indices, points, source curve ids, source sample indices)
+        and the inserted samples as (curve ids, params, points, source curve ids, source sample indices), both in
+        order of curve
+        """
+        num_curves = len(resolutions)
+        mix = [np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB)]
+
+        def get_hashes(cells):
+            hashes = np.full(len(cells), 0x9E3779B97F4A7C15, dtype=np.uint64)
+            for column in cells.T.astype(np.uint64):
+                # splitmix64 finalizer of the running hash and the next cell coord
+                hashes = hashes ^ column
+                hashes = (hashes ^ (hashes >> np.uint64(30))) * mix[0]
+                hashes = (hashes ^ (hashes >> np.uint64(27))) * mix[1]
+                hashes = hashes ^ (hashes >> np.uint64(31))
+            return hashes
+
+        # A curve matches another with the same hash of its sample cells, taken in the lower of both directions
+        hashes = np.zeros(num_curves, dtype=np.uint64)
+        is_collapsed = np.ones(num_curves, dtype=bool)
+        for ids, coefs in curves:
+            for start in range(0, len(ids), cls.chunk_curves):
+                chunk_ids = ids[start:start + cls.chunk_curves]
+                chunk_coefs = coefs[start:start + cls.chunk_curves]
+                for r in np.unique(resolutions[chunk_ids]):
+                    has_resolution = resolutions[chunk_ids] == r
+                    points = np.matmul(cls.get_basis(chunk_coefs.shape[1] - 1, int(r))[0], chunk_coefs[has_resolution])
+                    cells = np.rint((points - origin) / max(tolerance, 1e-300)).astype(np.int64)
+                    hashes[chunk_ids[has_resolution]] = np.minimum(get_hashes(cells.reshape(len(cells), -1)),
+                                                                   get_hashes(cells[:, ::-1].reshape(len(cells), -1)))
+                    is_collapsed[chunk_ids[has_resolution]] = np.all(np.abs(points - points[:, :1]) <= tolerance,
+                                                                     axis=(1, 2))
+        _, inverse, counts = np.unique(hashes, return_inverse=True, return_counts=True)
+        is_seam = (counts[inverse] == 1) & ~is_collapsed
+
+        no_ids = np.zeros(0, dtype=np.int64)
+        if not np.any(is_seam):
+            no_points = np.zeros((0, 3))
+            return (no_ids, no_ids, no_points, no_ids, no_ids), (no_ids, np.zeros(0), no_points, no_ids, no_ids)
+
+        # Samples of the seams, then the two ends of every curve
+        seam_coefs = []
+        entry_curves = []
+        entry_samples = []
+        entry_points = []
+        for ids, coefs in curves:
+            is_group_seam = is_seam[ids]
+            seam_ids = ids[is_group_seam]
+            for r in np.unique(resolutions[seam_ids]):
+                has_resolution = resolutions[seam_ids] == r
+                seam_coefs.append((seam_ids[has_resolution], coefs[is_group_seam][has_resolution]))
+                points = np.matmul(cls.get_basis(coefs.shape[1] - 1, int(r))[0], seam_coefs[-1][1])
+                entry_curves.append(np.repeat(seam_ids[has_resolution], r))
+                entry_samples.append(np.tile(np.arange(r), len(points)))
+                entry_points.append(points.reshape(-1, 3))
+        num_seam_entries = sum(len(c) for c in entry_curves)
+        for ids, coefs in curves:
+            entry_curves.append(np.repeat(ids, 2))
+            entry_samples.append(np.stack([np.zeros_like(ids), resolutions[ids] - 1], axis=1).reshape(-1))
+            entry_points.append(coefs[:, [0, -1]].reshape(-1, 3))
+        entry_curves = np.concatenate(entry_curves)
+        entry_samples = np.concatenate(entry_samples)
+        entry_points = np.concatenate(entry_points)
+        labels = cls.get_clusters(entry_points, tolerance)
+        snapped_points = entry_points[labels]
+
+        # All seam samples are snapped, so their copies inserted elsewhere are the same points
+        is_snapped = np.arange(len(labels)) < num_seam_entries
+        is_snapped |= np.any(snapped_points != entry_points, axis=1)
+        order = np.argsort(entry_curves[is_snapped], kind="stable")
+        snapped = (entry_curves[is_snapped][order], entry_samples[is_snapped][order],
+                   snapped_points[is_snapped][order], entry_curves[labels[is_snapped]][order],
+                   entry_samples[labels[is_snapped]][order])
+
+        # One candidate per cluster of seam samples, looked up in a grid of cells as large as the largest seam
+        seam_labels = labels[:num_seam_entries]
+        candidates = np.unique(seam_labels, return_index=True)[1]
+        candidate_points = snapped_points[candidates]
+        seam_ids = np.concatenate([ids for ids, _ in seam_coefs])
+        lower = np.concatenate([coefs.min(axis=1) for _, coefs in seam_coefs]) - tolerance
+        upper = np.concatenate([coefs.max(axis=1) for _, coefs in seam_coefs]) + tolerance
+        origin = lower.min(axis=0)
+        size = max((upper - lower).max(), tolerance, 1e-300)
+        dims = tuple(np.floor((upper.max(axis=0) - origin) / size).astype(np.int64) + 2)
+        candidate_cells = np.clip(np.floor((candidate_points - origin) / size).astype(np.int64), 0, np.array(dims) - 1)
+        candidate_keys = np.ravel_multi_index(tuple(candidate_cells.T), dims)
+        candidate_order = np.argsort(candidate_keys, kind="stable")
+        sorted_keys = candidate_keys[candidate_order]
+
+        # A seam spans at most two cells along each axis
+        lower_cells = np.floor((lower - origin) / size).astype(np.int64)
+        upper_cells = np.floor((upper - origin) / size).astype(np.int64)
+        pair_seams = []
+        pair_candidates = []
+        for offset in np.indices((2, 2, 2)).reshape(3, -1).T:
+            cells = lower_cells + offset
+            is_spanned = np.flatnonzero(np.all(cells <= upper_cells, axis=1))
+            keys = np.ravel_multi_index(tuple(cells[is_spanned].T), dims)
+            starts = np.searchsorted(sorted_keys, keys, side="left")
+            counts = np.searchsorted(sorted_keys, keys, side="right") - starts
+            pair_seams.append(np.repeat(is_spanned, counts))
+            pair_candidates.append(candidate_order[np.repeat(starts - np.cumsum(counts) + counts, counts)
+                                                   + np.arange(counts.sum())])
+        pair_seams = np.concatenate(pair_seams)
+        pair_candidates = np.concatenate(pair_candidates)
+
+        # Inside the box of the Bezier coefs, from another patch and no sample of the seam itself
+        sources = candidates[pair_candidates]
+        seam_indices = np.full(num_curves, -1, dtype=np.int64)
+        seam_indices[seam_ids] = np.arange(len(seam_ids))
+        seam_label_keys = np.unique(seam_indices[entry_curves[:num_seam_entries]] * len(labels) + seam_labels)
+        points = candidate_points[pair_candidates]
+        is_pair = np.all((points >= lower[pair_seams]) & (points <= upper[pair_seams]), axis=1)
+        is_pair &= entry_curves[sources] // 4 != seam_ids[pair_seams] // 4
+        is_pair &= ~np.isin(pair_seams * len(labels) + labels[sources], seam_label_keys)
+        pair_seams, sources = pair_seams[is_pair], sources[is_pair]
+
+        inserted = [[], [], [], [], []]
+        seam_offsets = np.cumsum([0] + [len(ids) for ids, _ in seam_coefs])
+        for g, (_, coefs) in enumerate(seam_coefs):
+            in_group = np.flatnonzero((pair_seams >= seam_offsets[g]) & (pair_seams < seam_offsets[g + 1]))
+            params, distances = cls.project(coefs[pair_seams[in_group] - seam_offsets[g]],
+                                            snapped_points[sources[in_group]])
+            is_on = distances <= tolerance
+            for values, column in zip((seam_ids[pair_seams[in_group]], params, snapped_points[sources[in_group]],
+                                       entry_curves[sources[in_group]], entry_samples[sources[in_group]]), inserted):
+                column.append(values[is_on])
+        inserted = [np.concatenate(column) for column in inserted]
+        order = np.lexsort((inserted[1], inserted[0]))
+        return snapped, tuple(column[order] for column in inserted)
+
+    @staticmethod
+    def get_inserted_cells(curve_ids, params, resolutions):
+        """ Grid cell (i * (resolution - 1) + j) of the side of the curve at param t in the patch of the curve, and
+        the key ordering the sample among the corners of the cell, a number between the keys 0 to 3 of the corners
+        before and after it. resolutions are the ones of the patches
+        """
+        patch_ids, edges = np.divmod(curve_ids, 4)
+        r = resolutions[patch_ids]
+        steps = params * (r - 1)
+        k = np.minimum(np.floor(steps).astype(np.int64), r - 2)
+        # The curves of sides 2 and 3 run backwards around the cell
+        fractions = np.clip(steps - k, 1e-9, 1 - 1e-9)
+        i = np.where(edges == 1, r - 2, np.where(edges == 3, 0, k))
+        j = np.where(edges == 0, 0, np.where(edges == 2, r - 2, k))
+        return patch_ids, i * (r - 1) + j, edges + np.where(edges >= 2, 1 - fractions, fractions)
+
+    @staticmethod
+    def get_loops(quads, face_ids, keys, corners, vert_ids):
+        """ Loops of the quads (F by 4 corners) with the extra corners inserted into faces face_ids, each after the
+        corner floor(key) of its quad in order of key. A corner of the same vert as the next one is dropped, and so
+        is a loop left with less than three. Return the offsets (CSR) and corners of the loops and their faces
+        """
+        ids = vert_ids[quads]
+        is_kept = ids != np.roll(ids, -1, axis=1)
+        sizes = is_kept.sum(axis=1)
+
+        # Only the faces with inserted corners are sorted, their quad corners come first among equal keys
+        touched = np.unique(face_ids)
+        entry_faces = np.concatenate([np.repeat(touched, 4), face_ids])
+        order = np.lexsort((np.concatenate([np.tile(np.arange(4.0), len(touched)), keys]), entry_faces))
+        entry_faces = entry_faces[order]
+        entry_corners = np.concatenate([quads[touched].reshape(-1), corners])[order]
+        next_entries = np.arange(len(entry_faces)) + 1
+        if len(touched):
+            starts = np.searchsorted(entry_faces, touched)
+            next_entries[np.append(starts[1:], len(entry_faces)) - 1] = starts
+        entry_ids = vert_ids[entry_corners]
+        is_entry_kept = entry_ids != entry_ids[next_entries]
+        sizes[touched] = np.bincount(entry_faces[is_entry_kept], minlength=len(quads))[touched]
+        is_kept[touched] = False
+
+        sizes[sizes < 3] = 0
+        offsets = np.zeros(len(quads) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(sizes)
+        # The sorted faces go to their offsets, the kept quad corners fill the rest in order
+        is_face = sizes > 0
+        is_entry_kept &= is_face[entry_faces]
+        kept_faces = entry_faces[is_entry_kept]
+        entry_rows = offsets[kept_faces] + np.arange(len(kept_faces)) - np.searchsorted(kept_faces, kept_faces)
+        loops = np.empty(offsets[-1], dtype=np.int64)
+        is_quad_row = np.ones(len(loops), dtype=bool)
+        is_quad_row[entry_rows] = False
+        loops[is_quad_row] = quads[is_kept & is_face[:, None]]
+        loops[entry_rows] = entry_corners[is_entry_kept]
+        return np.append(offsets[:-1][is_face], offsets[-1]), loops, np.flatnonzero(is_face)
+
+    @classmethod
+    def get_patch_resolutions(cls, stencil_index, positions, tolerance, min_resolution=2, max_resolution=17):
+        """ Samples per side of each patch so its grid stays within tolerance (world space) of the patch
+        A degree d Bezier curve is within d * (d - 1) / 8 * max |second difference of its coefs| / n ** 2
+        of its polyline through n + 1 uniform samples. n is rounded up to a power of two
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        segments = []
+        for batch, coefs in zip(stencil_index.batches, stencil_index.evaluate(positions, isBSpline=False)):
+            deg_u, deg_v = batch.constructor.deg_u, batch.constructor.deg_v
+            net = coefs.reshape(-1, deg_u + 1, deg_v + 1, 3)
+            curvature_u = np.linalg.norm(net[:, 2:] - 2 * net[:, 1:-1] + net[:, :-2], axis=-1).max(axis=(1, 2))
+            curvature_v = np.linalg.norm(net[:, :, 2:] - 2 * net[:, :, 1:-1] + net[:, :, :-2], axis=-1).max(axis=(1, 2))
+            error = np.maximum(deg_u * (deg_u - 1) * curvature_u, deg_v * (deg_v - 1) * curvature_v) / 8
+            segments.append(np.sqrt(error / max(tolerance, 1e-300)))
+        segments = np.concatenate(segments + [np.zeros(0)])
+        powers = np.ceil(np.log2(np.maximum(segments, 1)))
+        return np.clip(2 ** powers.astype(np.int64) + 1, min_resolution, max_resolution)
+
+    def get_curve_sample_rows(self, curve_ids, samples) -> np.ndarray:
+        """ Rows of the samples of boundary curves, curve 4 * p + e is side e (as get_edges) of patch p
+        """
+        patch_ids, edges = np.divmod(curve_ids, 4)
+        resolutions = self.patch_resolutions[patch_ids]
+        return self.patch_sample_offsets[patch_ids] + Tessellator.get_edge_samples(edges, samples, resolutions)
+
+    def get_sample_rows(self, patch_ids) -> np.ndarray:
+        """ Rows of all samples of the patches, patch by patch
+        """
+        starts = self.patch_sample_offsets[patch_ids]
+        counts = self.patch_sample_offsets[patch_ids + 1] - starts
+        return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+    def __set_samples__(self, patch_ids, coefs, batch_id, isBSpline):
+        constructor = self.stencil_index.batches[batch_id].constructor
+        resolutions = self.patch_resolutions[patch_ids]
+        for resolution in np.unique(resolutions):
+            has_resolution = resolutions == resolution
+            points, normals = Tessellator.evaluate_patches(coefs[has_resolution], constructor.deg_u, constructor.deg_v,
+                                                           int(resolution), isBSpline)
+            rows = self.get_sample_rows(patch_ids[has_resolution])
+            self.sample_points[rows] = points.reshape(-1, 3)
+            self.sample_normals[rows] = normals.reshape(-1, 3)
+
+    def __build_faces__(self, inserted):
+        """ One quad per grid cell of every patch, with the samples inserted along the seams (see get_seams)
+        between its corners. After welding a face loses the corners of its collapsed edges, one left with less
+        than three corners is dropped
+        """
+        # Cells patch by patch, cell i * (resolution - 1) + j of patch p is row cell_offsets[p] + it
+        cell_offsets = np.zeros(self.stencil_index.num_patches + 1, dtype=np.int64)
+        cell_offsets[1:] = np.cumsum((self.patch_resolutions - 1) ** 2)
+        quads = np.zeros((cell_offsets[-1], 4), dtype=np.int64)
+        for r in np.unique(self.patch_resolutions):
+            i, j = np.divmod(np.arange((r - 1) * (r - 1)), r - 1)
+            cell = i * r + j
+            corners = np.stack([cell, cell + r, cell + r + 1, cell + 1], axis=1)
+            patch_ids = np.flatnonzero(self.patch_resolutions == r)
+            quads[(cell_offsets[patch_ids][:, None] + np.arange(len(corners))).reshape(-1)] = \
+                (self.patch_sample_offsets[patch_ids][:, None, None] + corners[None]).reshape(-1, 4)
+
+        curve_ids, params, _, source_curve_ids, source_samples = inserted
+        patch_ids, cells, keys = Tessellator.get_inserted_cells(curve_ids, params, self.patch_resolutions)
+        face_offsets, loops, cells = Tessellator.get_loops(quads, cell_offsets[patch_ids] + cells, keys,
+                                                           self.get_curve_sample_rows(source_curve_ids, source_samples),
+                                                           self.vert_ids)
+        cell_patch_ids = np.repeat(np.arange(self.stencil_index.num_patches), np.diff(cell_offsets))
+        return face_offsets, self.vert_ids[loops], cell_patch_ids[cells]
+
+    def update(self, patch_ids, coefs, isBSpline=True):
+        """ Re-evaluate the samples of the given patches from their coefs (a list or array, one entry per patch)
+        and refresh the positions and normals of the verts they touch. The seam samples of the patches and of
+        their neighbors are snapped again, as when the tessellation was built
+        """
+        patch_ids = np.asarray(patch_ids, dtype=np.int64)
+        if len(patch_ids) == 0:
+            return
+        batch_ids = self.stencil_index.patch_batch_ids[patch_ids]
+        for b in np.unique(batch_ids):
+            in_batch = np.flatnonzero(batch_ids == b)
+            self.__set_samples__(patch_ids[in_batch], np.stack([coefs[k] for k in in_batch]), b, isBSpline)
+
+        is_dirty = np.zeros(self.stencil_index.num_patches, dtype=bool)
+        is_dirty[patch_ids] = True
+        is_resnapped = is_dirty[self.snapped_patch_ids] | is_dirty[self.snapped_source_patch_ids]
+        resnapped_rows = self.snapped_rows[is_resnapped]
+        self.sample_points[resnapped_rows] = self.sample_points[self.snapped_source_rows[is_resnapped]]
+        self.__update_verts__(Helper.get_unique_ids(np.concatenate([self.vert_ids[self.get_sample_rows(patch_ids)],
+                                                                    self.vert_ids[resnapped_rows]])))
+
+    def __update_verts__(self, vert_ids):
+        """ Position of a vert is its first sample, its normal is the sum of its sample normals, normalized.
+        Verts where every welded sample is degenerate (e.g. a pole) use the area weighted face normals instead
+        """
+        self.positions[vert_ids] = self.sample_points[self.vert_sample_ids[vert_ids]]
+
+        # Gather the samples of the verts from the vert to sample CSR
+        starts = self.vert_sample_offsets[vert_ids]
+        counts = self.vert_sample_offsets[vert_ids + 1] - starts
+        entries = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        normals = np.add.reduceat(self.sample_normals[self.vert_samples[entries]], np.cumsum(counts) - counts)
+
+        lengths = np.linalg.norm(normals, axis=1)
+        is_degenerate = lengths < 1e-6
+        if np.any(is_degenerate):
+            face_normals = self.get_face_normals(self.positions.astype(np.float64))
+            loop_normals = np.repeat(face_normals, np.diff(self.face_offsets), axis=0)
+            for axis in range(3):
+                normals[is_degenerate, axis] = np.bincount(self.face_indices, loop_normals[:, axis],
+                                                           minlength=self.num_verts)[vert_ids[is_degenerate]]
+            lengths = np.linalg.norm(normals, axis=1)
+        self.normals[vert_ids] = np.divide(normals, lengths[:, None], out=np.zeros_like(normals),
+                                           where=lengths[:, None] > 0)
+
+    def get_positions(self) -> np.ndarray:
+        """ Vert positions, num_verts by 3 float32
+        """
+        return self.positions
+
+    def get_normals(self) -> np.ndarray:
+        """ Unit vert normals, num_verts by 3 float32
+        """
+        return self.normals
+
+    def get_face_normals(self, verts) -> np.ndarray:
+        """ Area weighted normals of the faces, half the sum of the cross products of consecutive corners
+        taken from the first corner
+        """
+        sizes = np.diff(self.face_offsets)
+        if len(sizes) == 0:
+            return np.zeros((0, 3))
+        corners = verts[self.face_indices] - np.repeat(verts[self.face_indices[self.face_offsets[:-1]]], sizes, axis=0)
+        next_loops = np.arange(len(self.face_indices)) + 1
+        next_loops[self.face_offsets[1:] - 1] = self.face_offsets[:-1]
+        return np.add.reduceat(np.cross(corners, corners[next_loops]), self.face_offsets[:-1], axis=0) * 0.5
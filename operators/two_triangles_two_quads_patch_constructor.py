@@ -1,6 +1,5 @@
 from .patch_constructor import PatchConstructor
 from .halfedge import Halfedge
-from .bezier_bspline_converter import BezierBsplineConverter
 from .patch import BezierPatch, BsplinePatch
 from .helper import Helper
 from .polar_patch_constructor import PolarPatchConstructor
@@ -22,6 +21,7 @@ class TwoTrianglesTwoQuadsPatchConstructor(PatchConstructor):
         [0, 0, 0, 0, 1, 0, 0, 1, 0],
         [0, 0, 0, 0, 1, 1, 0, 1, 1]
     )
+    masks: dict = {name: mask}
 
     @classmethod
     def is_same_type(cls, vert) -> bool:
@@ -82,30 +82,38 @@ class TwoTrianglesTwoQuadsPatchConstructor(PatchConstructor):
 
         return nb_verts
 
+    @classmethod
+    def get_mask_name(cls, vert) -> str:
+        return cls.name
+
+    @classmethod
+    def get_corner_ids(cls, mask_name) -> list:
+        return [0, 2, 6, 8]
+
     @classmethod
     def get_patch(cls, vert, isBspline = True) -> list:
         # Mask * nb_Verts = bezier coefs for single or multiple patches
         nb_verts = cls.get_neighbor_verts(vert)
-        bezier_coefs = Helper.apply_mask_on_neighbor_verts(cls.mask, nb_verts)
-        bspline_coefs = BezierBsplineConverter.bezier_to_bspline(bezier_coefs, cls.deg_u, cls.deg_v)
-        bspline_coefs = Helper.convert_verts_from_matrix_to_list(bspline_coefs)
+        # The B-spline mask already includes the bezier to B-spline conversion
+        coefs = Helper.apply_mask_on_neighbor_verts(
+            cls.get_coef_mask(cls.get_mask_name(vert), isBspline), nb_verts, is_normalized=True)
 
         # The table output coef for multiple patches so we need to figure out
         # how many patches are generated.
         # The number of patches = # of rows / # of coef per patch
         num_of_coef_per_patch = (cls.deg_u + 1) * (cls.deg_v + 1)
-        num_of_patches = len(bspline_coefs) / num_of_coef_per_patch
+        num_of_patches = len(coefs) / num_of_coef_per_patch
         if(isBspline):
             return BsplinePatch(
                 order_u=3,
                 order_v=3,
                 struct_name=cls.name,
-                bspline_coefs=Helper.split_list(bspline_coefs, int(num_of_patches))
+                bspline_coefs=Helper.split_list(Helper.convert_verts_from_matrix_to_list(coefs), int(num_of_patches))
             )
         else:
             return BezierPatch(
                 order_u=3,
                 order_v=3,
                 struct_name=cls.name,
-                bezier_coefs=Helper.split_list(bezier_coefs, int(num_of_patches))
+                bezier_coefs=Helper.split_list(coefs, int(num_of_patches))
             )
@@ -1,13 +1,14 @@
-import math
-
 import numpy as np
 from bpy_extras.io_utils import ExportHelper
-from bpy.props import StringProperty, BoolProperty, EnumProperty
+from bpy.props import StringProperty, BoolProperty, EnumProperty, IntProperty
 from bpy.types import Operator
 
-from .patch_tracker import PatchTracker
-from .patch_helper import PatchHelper
-from .bezier_bspline_converter import BezierBsplineConverter
+from .halfedge_mesh import HalfedgeMesh
+from .iges_writer import IGESWriter
+from .incremental_iges_writer import IncrementalIGESWriter
+from .mesh_writer import MeshWriter
+from .patch_archive import PatchArchive
+from .stencil_index import StencilIndex
 
 
 class IGSExporter(Operator, ExportHelper):
@@ -24,124 +25,183 @@ class IGSExporter(Operator, ExportHelper):
         maxlen=255,  # Max internal buffer length, longer would be clamped.
     )
 
-    patch_names = PatchTracker.patch_names # reference
+    # Re-exports of the same patches only rewrite the coordinates of the patches that moved
+    incremental: BoolProperty(
+        name="Update In Place",
+        description="Only rewrite the changed patches of an earlier export of the same patches to this file",
+        default=True,
+    )
 
     def menu_func_export(self, context):
         self.layout.operator(IGSExporter.bl_idname, text="IGES (.igs)")
 
     def execute(self, context):
-        self.__write_igs(context, self.filepath)
+        coefs, changed_names = IGSExporter.get_coefs(context)
+        IGSExporter.report_changed(self, changed_names)
+        if not coefs:
+            self.report({'ERROR'}, "No patches to export")
+            return {'CANCELLED'}
+        num_workers = context.scene.polyhedral_splines_workers
+        num_written = IncrementalIGESWriter.write(self.filepath, coefs, num_workers=num_workers,
+                                                  incremental=self.incremental)
+        if num_written is None:
+            self.report({'ERROR'}, "Too many patches for one IGES file")
+            return {'CANCELLED'}
+        self.report({'INFO'}, "%d of %d patches written" % (num_written, sum(len(c) for c in coefs)))
+        return {'FINISHED'}
+
+    @staticmethod
+    def get_control_meshes(context) -> list:
+        """ Control meshes in the scene: the ones with a stencil index and the ones parenting generated patches,
+        which have none after the file or the add-on was reloaded
+        """
+        objs = [context.scene.objects[obj_name] for obj_name in StencilIndex.stencil_indices
+                if obj_name in context.scene.objects]
+        for obj in context.scene.objects:
+            if obj.type != 'MESH' or obj.name in StencilIndex.stencil_indices:
+                continue
+            if any(child.type == 'SURFACE' or child.name.startswith("SurfMesh.") for child in obj.children):
+                objs.append(obj)
+        return objs
+
+    @staticmethod
+    def get_stencil_indices(context) -> tuple:
+        """ (object name, stencil index, current positions) of every control mesh in the scene, and the names of
+        the control meshes skipped because their topology changed since the patches were generated
+        """
+        stencil_indices = []
+        changed_names = []
+        for obj in IGSExporter.get_control_meshes(context):
+            if obj.mode == 'EDIT':
+                obj.update_from_editmode()
+            stencil_index = StencilIndex.stencil_indices.get(obj.name)
+            if stencil_index is None:
+                # Classify the topology again, the stencil index is not saved with the file
+                stencil_index = StencilIndex.build(HalfedgeMesh.from_mesh(obj.data))
+                StencilIndex.register(obj.name, stencil_index)
+            elif stencil_index.topology_key != StencilIndex.get_topology_key(obj.data):
+                # Kept registered, so the mesh is skipped until its patches are generated again
+                changed_names.append(obj.name)
+                continue
+            positions = np.empty(len(obj.data.vertices) * 3, dtype=np.float64)
+            obj.data.vertices.foreach_get("co", positions)
+            stencil_indices.append((obj.name, stencil_index, positions))
+        return stencil_indices, changed_names
+
+    @staticmethod
+    def get_coefs(context) -> tuple:
+        """ Bezier coefs of the patches of every control mesh in the scene, evaluated from its current positions,
+        and the names of the control meshes skipped because their topology changed
+        """
+        coefs = []
+        stencil_indices, changed_names = IGSExporter.get_stencil_indices(context)
+        for _, stencil_index, positions in stencil_indices:
+            coefs.extend(IGESWriter.get_coefs(stencil_index, positions))
+        return coefs, changed_names
+
+    @staticmethod
+    def report_changed(operator, changed_names):
+        if changed_names:
+            operator.report({'WARNING'}, "Skipped %s, the topology changed since the patches were generated"
+                            % ", ".join(changed_names))
+
+
+class MeshExporter(Operator, ExportHelper):
+    """Export the patches as one tessellated, welded mesh"""
+    bl_idname = "export.polyhedral_splines_mesh"
+    bl_label = "Export Patch Mesh"
+
+    # ExportHelper mixin class uses this
+    filename_ext = ".ply"
+
+    filter_glob: StringProperty(
+        default="*.ply;*.stl;*.obj",
+        options={'HIDDEN'},
+        maxlen=255,  # Max internal buffer length, longer would be clamped.
+    )
+
+    file_format: EnumProperty(
+        name="Format",
+        description="File format of the mesh, a file name with another extension gets the one of the format",
+        items=(('PLY', "PLY", "Binary PLY with polygon faces"),
+               ('STL', "STL", "Binary STL triangles"),
+               ('OBJ', "OBJ", "Wavefront OBJ with polygon faces")),
+        default='PLY',
+    )
+
+    resolution: IntProperty(
+        name="Resolution",
+        description="Samples per patch side",
+        default=8,
+        min=2,
+        max=64,
+    )
+
+    def menu_func_export(self, context):
+        self.layout.operator(MeshExporter.bl_idname, text="Polyhedral Spline Mesh (.ply/.stl/.obj)")
+
+    def execute(self, context):
+        coefs, changed_names = IGSExporter.get_coefs(context)
+        IGSExporter.report_changed(self, changed_names)
+        if not coefs:
+            self.report({'ERROR'}, "No patches to export")
+            return {'CANCELLED'}
+        filepath = self.filepath
+        if MeshWriter.get_format(filepath) != self.file_format:
+            filepath += "." + self.file_format.lower()
+        counts = MeshWriter.write(filepath, coefs, self.resolution, self.file_format)
+        if counts is None:
+            self.report({'ERROR'}, "Too many patches for one %s file" % self.file_format)
+            return {'CANCELLED'}
+        self.report({'INFO'}, "%d verts and %d faces written" % counts)
         return {'FINISHED'}
 
-    # write knots of bb-form in IGS
-    def __knots(self, a_Deg1, a_Bbase, a_Ffctr, f, a_PerLine):
-        for i in range(a_Deg1):
-            if i%a_PerLine == 0 and i != 0:
-                f.write("%8dP%7d\n" % (a_Ffctr, a_Bbase))
-                a_Bbase+=1
-            f.write("0.00000,")
-
-        for i in range(a_Deg1, 2*a_Deg1):
-            if i%a_PerLine==0:
-                f.write("%8dP%7d\n" % (a_Ffctr, a_Bbase))
-                a_Bbase+=1
-            f.write("1.00000,")
-
-        j = (2*a_Deg1) % a_PerLine
-        if j != 0:
-            j = a_PerLine - j
-            for i in range(j):
-              f.write("        ")
-
-        f.write("%8dP%7d\n" % (a_Ffctr, a_Bbase))
-
-        a_Bbase += 1
-
-        return a_Bbase
-
-    def __write_igs(self, context, filepath):
-
-        patches = []
-        for patch_name in self.patch_names:
-            spline = context.scene.objects[patch_name].data.splines[0]
-            patch = [list(pt.co)[:3] for pt in list(spline.points)]
-            np_patch = BezierBsplineConverter.bspline_to_bezier(np.array(patch), spline.order_v-1, spline.order_u-1)
-            np_patch.resize((spline.order_v, spline.order_u, 3))
-            patches.append({"coefs": np_patch.tolist(), "deg_u": spline.order_v-1,"deg_v": spline.order_u-1})
-
-        f = open(filepath, 'w', encoding='utf-8')
-
-        flen = [0 for _ in range(4)]
-        t_Bbctr, t_Ffctr = 1, 1
-
-        for patch in patches:
-            t_DegU = patch["deg_u"]
-            t_DegV = patch["deg_v"]
-            k = (t_DegU + 1) + (t_DegV + 1)
-            k1 = (k%8)==0 + math.trunc((k/8))# knots
-            w = (t_DegU + 1) * (t_DegV + 1)
-            w1 = (w%8)==0 + math.trunc((w/8))# weights
-
-            # deg-line, knots, weights, xyz location, param
-            rows = (1 + 2 * k1 + w1 + w + 1) # size of one block
-
-            f.write("     128%8d       0       1       0       0       0        00000000D%7d\n" % (t_Bbctr, t_Ffctr))
-            f.write("     128%8d       8      %d       2                NurbSurf       0D%7d\n" % (0, rows, t_Ffctr+1))
-
-            t_Bbctr += rows
-            t_Ffctr += 2
-
-        flen[0] = 1
-        flen[1] = 10
-
-        # data entries
-        t_Ffctr, t_Bbctr = 1, 1
-        for patch in patches:
-            t_DegU = patch["deg_u"]
-            t_DegV = patch["deg_v"]
-
-            # HEADER
-            f.write("128,%7d,%7d,%7d,%7d,0,0,1,0,0,%26dP%7d\n" % (t_DegV, t_DegU, t_DegV, t_DegU, t_Ffctr, t_Bbctr))
-            t_Bbctr += 1
-
-            # KNOTS
-            w = (t_DegU + 1) * (t_DegV + 1);
-            t_Bbctr = self.__knots(t_DegV + 1, t_Bbctr, t_Ffctr, f, 8);
-            t_Bbctr = self.__knots(t_DegU + 1, t_Bbctr, t_Ffctr, f, 8);
-
-            cols, col = 8, 0
-            for i in range(t_DegU + 1):
-                for j in range(t_DegV + 1):
-                    if col % cols == 0 and col != 0:
-                        f.write("%8dP%7d\n" % (t_Ffctr,t_Bbctr))
-                        t_Bbctr += 1
-                    h = 1
-                    f.write("%7.5f," % h)
-                    col += 1
-
-            # finish line
-            col = col % cols
-            if col != 0:
-                col = cols-col
-                for i in range(col):
-                    f.write("        ")
-
-            f.write("%8dP%7d\n" % (t_Ffctr, t_Bbctr))
-            t_Bbctr += 1
-
-            # the XYZ coordinates
-            for i in range(t_DegU + 1):
-                for j in range(t_DegV + 1):
-                    f.write("%20e,%20e,%20e,%9dP%7d\n" % (patch["coefs"][i][j][0], patch["coefs"][i][j][1], patch["coefs"][i][j][2], t_Ffctr,t_Bbctr))
-                    t_Bbctr += 1
-
-            f.write("0.00000,1.00000,0.00000,1.00000;%40dP%7d\n" % (t_Ffctr, t_Bbctr))
-            t_Bbctr += 1
-            t_Ffctr += 2
-
-        flen[2] = t_Ffctr
-        flen[3] = t_Bbctr
-
-        # structure of file
-        f.write("S%7dG%7dD%7dP%7d%40dT%7d\n" % (flen[0], flen[1], flen[2] - 1, flen[3] - 1, 1, 1))
-        f.close()
+
+class PatchArchiveExporter(Operator, ExportHelper):
+    """Export the patches as a compact binary archive with random access"""
+    bl_idname = "export.polyhedral_splines_archive"
+    bl_label = "Export Patch Archive"
+
+    # ExportHelper mixin class uses this
+    filename_ext = ".psa"
+
+    filter_glob: StringProperty(
+        default="*.psa",
+        options={'HIDDEN'},
+        maxlen=255,  # Max internal buffer length, longer would be clamped.
+    )
+
+    compression: EnumProperty(
+        name="Compression",
+        description="Lossless compression of the coefs, an uncompressed archive is read straight from a memory map",
+        items=(('NONE', "None", "Raw coefs"),
+               ('ZLIB', "zlib", "Fast compression"),
+               ('BZ2', "bz2", "Slower compression"),
+               ('LZMA', "LZMA", "Smallest file, slowest to write")),
+        default='NONE',
+    )
+
+    def menu_func_export(self, context):
+        self.layout.operator(PatchArchiveExporter.bl_idname, text="Polyhedral Spline Patch Archive (.psa)")
+
+    def execute(self, context):
+        coefs, struct_types, source_ids, sub_ids, meshes = [], [], [], [], []
+        stencil_indices, changed_names = IGSExporter.get_stencil_indices(context)
+        IGSExporter.report_changed(self, changed_names)
+        for obj_name, stencil_index, positions in stencil_indices:
+            coefs.extend(IGESWriter.get_coefs(stencil_index, positions))
+            columns = PatchArchive.get_columns(stencil_index)
+            struct_types.extend(columns[0])
+            source_ids.extend(columns[1])
+            sub_ids.extend(columns[2])
+            # Patch ids of the meshes follow each other, in this order
+            meshes.append([obj_name, stencil_index.num_patches])
+        if not coefs:
+            self.report({'ERROR'}, "No patches to export")
+            return {'CANCELLED'}
+        compression = None if self.compression == 'NONE' else self.compression.lower()
+        num_workers = context.scene.polyhedral_splines_workers
+        num_patches = PatchArchive.write(self.filepath, coefs, struct_types, source_ids, sub_ids, compression,
+                                         num_workers=num_workers, metadata={"meshes": meshes})
+        self.report({'INFO'}, "%d patches written" % num_patches)
+        return {'FINISHED'}
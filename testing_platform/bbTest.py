@@ -1,67 +1,118 @@
 import sys
-sys.path.append('../operators')
-from colorama import Fore
-from bivariateBBFunctions import bbFunctions
-import json
+sys.path.append('..')
+from operators.bivariateBBFunctions import bbFunctions
 import numpy
 import time
-with open("./computedTestData.json") as f:
-    testData = json.loads(f.read())
-    arrTimes = []
-    testsPassed = 0
-    for testCase in testData["testCases"]:
-        testCaseStartTime = time.process_time()
-        #Initialize running sums of all moments
-        runningVolume = 0
-        runningCOM = numpy.array([0,0,0])
-        runningMOI = numpy.array([
-            [0,0,0],
-            [0,0,0],
-            [0,0,0]
-        ])
-        totalCalcTime = 0
-        #Iterate through each surface and add its moments to our running moments
-        for surface in testCase["testSurfaces"]:
-            
-            xCoefs = numpy.array(surface["xCoefs"])
-            yCoefs = numpy.array(surface["yCoefs"])
-            zCoefs = numpy.array(surface["zCoefs"])
-            individualMomentCalcStartTime = time.process_time()
-            vol, com = bbFunctions.allMoments(xCoefs, yCoefs, zCoefs)
-            individualMomentCalcTime = time.process_time() - individualMomentCalcStartTime
-            runningVolume = runningVolume + vol
-            runningCOM = runningCOM + com
-            totalCalcTime = totalCalcTime + individualMomentCalcTime
-        #Normalize Center of Mass
-        runningCOM = runningCOM / runningVolume
-        for surface in testCase["testSurfaces"]:
-            xCoefs = numpy.array(surface["xCoefs"])
-            yCoefs = numpy.array(surface["yCoefs"])
-            zCoefs = numpy.array(surface["zCoefs"])
-            individualMomentCalcTime = time.process_time() - individualMomentCalcStartTime
-            moi = bbFunctions.secondMoment(xCoefs, yCoefs, zCoefs, runningCOM)
-            runningMOI = runningMOI + moi
-            totalCalcTime = totalCalcTime + individualMomentCalcTime
-        
-            
-        #TODO: perform EIGEN decomposition on the moment of inertia
-        if not numpy.allclose(runningVolume,testCase["testVol"]) or not numpy.allclose(runningCOM, numpy.array(testCase["testCOM"])):
-            print(Fore.RED +"test: ", testCase["testName"],  ": Failed")
-            print(Fore.YELLOW + "Calculated Volume: ", runningVolume)
-            print("Expected Volume: ",testCase["testVol"])
-            print("Calculated Center of Mass: ", runningCOM)
-            print("Expected Center of Mass: ", testCase["testCOM"])
-            print("Calculated Moment of Inertia: ", runningMOI)
-        else:
-            print(Fore.GREEN +"Test: ", testCase["testName"],  ": Passed")
-            testsPassed = testsPassed + 1
-        print(Fore.RESET + "Average Surface Moment Calculation Time: ", totalCalcTime / len(testCase["testSurfaces"]))
-        testTime = time.process_time() - testCaseStartTime
-        print("Test Time: ", testTime , "\n\n")
-        arrTimes = arrTimes + [str(testTime)]
-    #TODO: add command line options for this file to output to csv, have testing be verbose, print without color, etc...
-    print("Passed ", testsPassed, " out of ", len(testData["testCases"]))
-
-    
-
-        
\ No newline at end of file
+
+# Volume, centre of mass and second moments of the cuboids of computedTestData.npz
+# (written by testCaseGenerator.py), computed surface by surface and batched per
+# matrix shape. Every case is checked against its stored volume and centre of mass
+# and against the analytic second moments of a cuboid about its centre, a b c / 12
+# times (a^2, b^2, c^2) on the diagonal. Reports percentiles of the per-surface
+# times and the throughput of both modes:
+#   python bbTest.py [fixture.npz]
+
+
+def loadFixture(path):
+    """ Return the fixture arrays and the (coefs, case ids) stacks by matrix shape
+    """
+    fixture = numpy.load(path)
+    stacks = {}
+    for name in fixture.files:
+        if name.startswith("coefs_"):
+            key = name[len("coefs_"):]
+            stacks[key] = (fixture[name], fixture["cases_" + key])
+    return {name: fixture[name] for name in ("names", "volumes", "coms", "dimensions")}, stacks
+
+
+def getExpectedSecondMoments(volumes, dimensions):
+    return volumes[:, None, None] / 12 * numpy.eye(3) * (dimensions ** 2)[:, None, :]
+
+
+def runPerSurface(stacks, numCases):
+    """ One allMoments call per surface, then one secondMoment call per surface about its case's centre of mass
+    Return volumes, centres of mass, second moments and the time of every call
+    """
+    volumes = numpy.zeros(numCases)
+    firstMoments = numpy.zeros((numCases, 3))
+    secondMoments = numpy.zeros((numCases, 3, 3))
+    firstTimes = []
+    secondTimes = []
+    for coefs, caseIds in stacks.values():
+        for surface, caseId in zip(coefs, caseIds):
+            startTime = time.perf_counter()
+            volume, firstMoment = bbFunctions.allMoments(surface[0], surface[1], surface[2])
+            firstTimes.append(time.perf_counter() - startTime)
+            volumes[caseId] += volume
+            firstMoments[caseId] += firstMoment
+    coms = firstMoments / volumes[:, None]
+
+    for coefs, caseIds in stacks.values():
+        for surface, caseId in zip(coefs, caseIds):
+            startTime = time.perf_counter()
+            secondMoment = bbFunctions.secondMoment(surface[0], surface[1], surface[2], coms[caseId])
+            secondTimes.append(time.perf_counter() - startTime)
+            secondMoments[caseId] += secondMoment
+    return volumes, coms, secondMoments, numpy.array(firstTimes), numpy.array(secondTimes)
+
+
+def runBatched(stacks, numCases):
+    """ One allMoments and one secondMoment call per matrix shape, summed into the cases by case id
+    Return volumes, centres of mass, second moments and the time of each of the two passes
+    """
+    startTime = time.perf_counter()
+    volumes = numpy.zeros(numCases)
+    firstMoments = numpy.zeros((numCases, 3))
+    for coefs, caseIds in stacks.values():
+        volume, firstMoment = bbFunctions.allMoments(coefs[:, 0], coefs[:, 1], coefs[:, 2])
+        volumes += numpy.bincount(caseIds, volume, minlength=numCases)
+        numpy.add.at(firstMoments, caseIds, firstMoment)
+    coms = firstMoments / volumes[:, None]
+    firstTime = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    secondMoments = numpy.zeros((numCases, 3, 3))
+    for coefs, caseIds in stacks.values():
+        numpy.add.at(secondMoments, caseIds,
+                     bbFunctions.secondMoment(coefs[:, 0], coefs[:, 1], coefs[:, 2], coms[caseIds]))
+    secondTime = time.perf_counter() - startTime
+    return volumes, coms, secondMoments, firstTime, secondTime
+
+
+def checkCases(fixture, volumes, coms, secondMoments):
+    """ Return the ids of the cases whose volume, centre of mass or second moments are wrong
+    """
+    expectedSecondMoments = getExpectedSecondMoments(fixture["volumes"], fixture["dimensions"])
+    scale = numpy.abs(expectedSecondMoments).max(axis=(1, 2))
+    isPassed = numpy.isclose(volumes, fixture["volumes"]) \
+        & numpy.all(numpy.isclose(coms, fixture["coms"], atol=1e-6), axis=1) \
+        & numpy.all(numpy.abs(secondMoments - expectedSecondMoments) <= 1e-7 * scale[:, None, None], axis=(1, 2))
+    return numpy.flatnonzero(~isPassed)
+
+
+def report(mode, fixture, failed):
+    for caseId in failed[:10]:
+        print("%s test %s: Failed" % (mode, fixture["names"][caseId]))
+    print("%s: Passed %d out of %d" % (mode, len(fixture["names"]) - len(failed), len(fixture["names"])))
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else "computedTestData.npz"
+    fixture, stacks = loadFixture(path)
+    numCases = len(fixture["names"])
+    numSurfaces = sum(len(caseIds) for _, caseIds in stacks.values())
+    print("%d cases, %d surfaces, shapes %s" % (numCases, numSurfaces, ", ".join(stacks)))
+
+    volumes, coms, secondMoments, firstTimes, secondTimes = runPerSurface(stacks, numCases)
+    report("Per surface", fixture, checkCases(fixture, volumes, coms, secondMoments))
+    for name, times in [("allMoments", firstTimes), ("secondMoment", secondTimes)]:
+        p50, p90, p99 = numpy.percentile(times, [50, 90, 99]) * 1e6
+        print("  %s: p50 %.1f us, p90 %.1f us, p99 %.1f us, max %.1f us, %.0f patches/sec" % (
+            name, p50, p90, p99, times.max() * 1e6, len(times) / times.sum()))
+
+    volumes, coms, secondMoments, firstTime, secondTime = runBatched(stacks, numCases)
+    report("Batched", fixture, checkCases(fixture, volumes, coms, secondMoments))
+    for name, elapsed in [("allMoments", firstTime), ("secondMoment", secondTime)]:
+        print("  %s: %.4f sec, %.0f patches/sec (%.1fx per surface)" % (
+            name, elapsed, numSurfaces / elapsed,
+            (firstTimes if name == "allMoments" else secondTimes).sum() / elapsed))
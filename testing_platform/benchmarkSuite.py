@@ -0,0 +1,193 @@
+import sys
+sys.path.append('..')
+from operators.patch_helper import PatchHelper, PatchBatch
+from operators.helper import Helper
+from operators.iges_writer import IGESWriter
+from operators.bezier_bspline_converter import BezierBsplineConverter
+from operators.moment_tensors import MomentTensors
+from operators.stencil_index import StencilIndex
+from operators.tessellator import Tessellator
+from meshGenerators import makeMesh, meshNames
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import numpy
+import os
+import platform
+import tempfile
+import time
+
+
+# Headless benchmark of the patch pipeline on the synthetic meshes of meshGenerators.
+# Every stage is timed on its own: classification (is_same_type and mask names),
+# neighbor gathering, mask application (B-spline coefs), conversion to Bezier,
+# moments, tessellation and IGES export. The results are written to JSON and compared with a
+# baseline run, stages slower than the baseline by more than the tolerance fail:
+#   python benchmarkSuite.py --sizes 1000,10000 --output run.json --baseline benchmarkBaseline.json
+# benchmarkBaseline.json is a 1k and 10k face run on one core, regenerate it on the
+# machine the comparisons run on
+def classify(mesh):
+    """ Return {(constructor, mask name, is vert based): [elems]}, the constructors print when they match
+    """
+    groups = {}
+    seeds = [(mesh.verts, PatchHelper.vert_based_patch_constructors, True),
+             (mesh.faces, PatchHelper.face_based_patch_constructors, False)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for elems, constructors, isVertBased in seeds:
+            for elem in elems:
+                for pc in constructors:
+                    if pc.is_same_type(elem):
+                        groups.setdefault((pc, pc.get_mask_name(elem), isVertBased), []).append(elem)
+    return groups
+
+
+def gatherNeighbors(groups):
+    patchBatches = []
+    for (pc, maskName, isVertBased), elems in groups.items():
+        patchBatches.append(PatchBatch(
+            constructor=pc,
+            mask_name=maskName,
+            is_vert_based=isVertBased,
+            source_ids=numpy.array([elem.index for elem in elems], dtype=numpy.int64),
+            neighbor_ids=numpy.array([Helper.get_verts_id(pc.get_neighbor_verts(elem)) for elem in elems],
+                                     dtype=numpy.int64)
+        ))
+    return patchBatches
+
+
+def applyMasks(patchBatches, positions):
+    return [PatchHelper.evaluatePatchBatch(b, positions, isBSpline=True) for b in patchBatches]
+
+
+def convertToBezier(patchBatches, batchCoefs):
+    bezierCoefs = []
+    for b, coefs in zip(patchBatches, batchCoefs):
+        pc = b.constructor
+        bezier = BezierBsplineConverter.bspline_to_bezier(coefs.reshape(-1, 3), pc.deg_u, pc.deg_v)
+        bezierCoefs.append(bezier.reshape(-1, pc.deg_u + 1, pc.deg_v + 1, 3))
+    return bezierCoefs
+
+
+def computeMoments(patchBatches, bezierCoefs):
+    coefsByOrder = {}
+    for b, coefs in zip(patchBatches, bezierCoefs):
+        coefsByOrder.setdefault(coefs.shape[1:3], []).append(coefs)
+    volume = 0.0
+    for coefs in coefsByOrder.values():
+        coefs = numpy.concatenate(coefs)
+        volume += MomentTensors.moments(coefs[..., 0], coefs[..., 1], coefs[..., 2])[0].sum()
+    return volume
+
+
+def exportIges(bezierCoefs):
+    """ Write the patches to a temporary IGES file, return its size in bytes
+    """
+    path = os.path.join(tempfile.gettempdir(), "benchmarkSuite.igs")
+    IGESWriter.write(path, bezierCoefs)
+    size = os.path.getsize(path)
+    os.remove(path)
+    return size
+
+
+def runStages(mesh, resolution):
+    """ Return the seconds of every stage and the number of patches
+    """
+    times = {}
+    startTime = time.perf_counter()
+    groups = classify(mesh)
+    times["classification"] = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    patchBatches = gatherNeighbors(groups)
+    times["gathering"] = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    batchCoefs = applyMasks(patchBatches, mesh.positions)
+    times["masks"] = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    bezierCoefs = convertToBezier(patchBatches, batchCoefs)
+    times["conversion"] = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    computeMoments(patchBatches, bezierCoefs)
+    times["moments"] = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    stencilIndex = StencilIndex.build(mesh, patchBatches)
+    Tessellator(stencilIndex, mesh.positions, resolution)
+    times["tessellation"] = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    exportIges(bezierCoefs)
+    times["export"] = time.perf_counter() - startTime
+    return times, stencilIndex.num_patches
+
+
+def compareWithBaseline(results, baseline, tolerance, noiseFloor):
+    """ Print the ratio to the baseline of every stage, return the number of regressions
+    """
+    baselineTimes = {(r["mesh"], r["target_faces"]): r["stages"] for r in baseline["results"]}
+    numRegressions = 0
+    for result in results:
+        expected = baselineTimes.get((result["mesh"], result["target_faces"]))
+        if expected is None:
+            continue
+        ratios = []
+        for stage, seconds in result["stages"].items():
+            if stage not in expected:
+                continue
+            ratio = seconds / max(expected[stage], 1e-9)
+            isRegression = ratio > 1 + tolerance and seconds - expected[stage] > noiseFloor
+            numRegressions += isRegression
+            ratios.append("%s %.2fx%s" % (stage, ratio, " SLOWER" if isRegression else ""))
+        print("%s %d: %s" % (result["mesh"], result["target_faces"], ", ".join(ratios)))
+    return numRegressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Headless benchmark of the patch pipeline")
+    parser.add_argument("--sizes", default="1000,10000", help="target face counts, up to 1000000")
+    parser.add_argument("--meshes", default=",".join(meshNames), help="mesh kinds of meshGenerators")
+    parser.add_argument("--resolution", type=int, default=5, help="samples per patch side of the tessellation")
+    parser.add_argument("--repeats", type=int, default=1, help="runs per mesh, the fastest time of each stage is kept")
+    parser.add_argument("--output", default="benchmarkResults.json")
+    parser.add_argument("--baseline", default=None, help="JSON of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown per stage")
+    parser.add_argument("--noise-floor", type=float, default=0.01, help="slowdowns below this many seconds pass")
+    args = parser.parse_args()
+
+    # Untimed run so that the tensor and basis caches are built before the first measurement
+    for name in args.meshes.split(","):
+        runStages(makeMesh(name, 64), args.resolution)
+
+    results = []
+    for name in args.meshes.split(","):
+        for size in [int(s) for s in args.sizes.split(",")]:
+            startTime = time.perf_counter()
+            mesh = makeMesh(name, size)
+            generationTime = time.perf_counter() - startTime
+
+            stages = None
+            for repeat in range(args.repeats):
+                times, numPatches = runStages(mesh, args.resolution)
+                stages = times if stages is None else {k: min(stages[k], t) for k, t in times.items()}
+            results.append({"mesh": name, "target_faces": size, "faces": mesh.num_faces, "verts": mesh.num_verts,
+                            "patches": numPatches, "generation": generationTime, "stages": stages})
+            print("%s %d faces, %d patches: %s" % (name, mesh.num_faces, numPatches, ", ".join(
+                "%s %.3f" % (stage, seconds) for stage, seconds in stages.items())))
+
+    run = {"date": datetime.datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+           "numpy": numpy.__version__, "machine": platform.machine(), "results": results}
+    with open(args.output, "w") as f:
+        json.dump(run, f, indent=1)
+    print("Results written to", args.output)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        numRegressions = compareWithBaseline(results, baseline, args.tolerance, args.noise_floor)
+        print("Passed" if numRegressions == 0 else "Failed: %d slower stages" % numRegressions)
+        sys.exit(1 if numRegressions else 0)
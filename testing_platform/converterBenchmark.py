@@ -0,0 +1,64 @@
+import sys
+sys.path.append('../operators')
+from bezier_bspline_converter import BezierBsplineConverter
+import numpy
+import time
+
+
+# Times BezierBsplineConverter on a stack of random patches. The batched result
+# is checked against a copy of the per-patch loop it replaced, run on the first
+# patches, and bezier_to_bspline(bspline_to_bezier(coefs)) must give the coefs back
+def baselineTransform(coefs_mat, deg_u, deg_v, trans_type="BB2B"):
+    """ base_transform before it was batched, kept as the reference
+    """
+    total_coefs, vert_dim = coefs_mat.shape
+    bezier_coef_per_patch = (deg_u + 1) * (deg_v + 1)
+
+    invert = trans_type == "B2BB"
+
+    # horizatal direction (v direction)
+    mask_v = BezierBsplineConverter.bb2b_mask_selector(deg_v, invert=invert)
+    order_v = deg_v + 1
+    temp_coef = numpy.zeros((total_coefs, vert_dim))
+    for i in range(0, total_coefs, order_v):
+        for j in range(order_v):
+            temp_coef[i + j, :] = numpy.dot(mask_v[j, :], coefs_mat[i:i + order_v, :])
+
+    # vertical direction (u direction)
+    mask_u = BezierBsplineConverter.bb2b_mask_selector(deg_u, invert=invert)
+    order_u = deg_u + 1
+    coefs = numpy.zeros((total_coefs, vert_dim))
+
+    for k in range(0, total_coefs, bezier_coef_per_patch):
+        for i in range(order_u):
+            for j in range(order_v):
+                coefs[k + i * order_v + j] = numpy.dot(mask_u[i, :],
+                                                       temp_coef[k + j:k + bezier_coef_per_patch:order_v, :])
+
+    return coefs
+
+
+numPatches = 100000
+numReferencePatches = 1000
+if len(sys.argv) > 1:
+    numPatches = int(sys.argv[1])
+
+rng = numpy.random.default_rng(0)
+for degU, degV in [(2, 2), (3, 2), (3, 3), (4, 4)]:
+    coefsPerPatch = (degU + 1) * (degV + 1)
+    for transType in ["BB2B", "B2BB"]:
+        coefs = rng.standard_normal((numPatches * coefsPerPatch, 3))
+
+        startTime = time.perf_counter()
+        transformed = BezierBsplineConverter.base_transform(coefs, degU, degV, trans_type=transType)
+        elapsed = time.perf_counter() - startTime
+
+        numChecked = min(numPatches, numReferencePatches) * coefsPerPatch
+        expected = baselineTransform(coefs[:numChecked], degU, degV, trans_type=transType)
+        passed = numpy.allclose(transformed[:numChecked], expected)
+        inverseType = "B2BB" if transType == "BB2B" else "BB2B"
+        roundTrip = BezierBsplineConverter.base_transform(transformed, degU, degV, trans_type=inverseType)
+        passed = passed and numpy.allclose(roundTrip, coefs)
+
+        print("deg %d x %d %s: %d patches in %.4f sec (%.0f patches/sec) %s" % (
+            degU, degV, transType, numPatches, elapsed, numPatches / elapsed, "Passed" if passed else "Failed"))
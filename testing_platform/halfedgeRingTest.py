@@ -0,0 +1,61 @@
+import sys
+sys.path.append('..')
+from operators.extraordinary_patch_constructor import ExtraordinaryPatchConstructor
+from operators.two_triangles_two_quads_patch_constructor import TwoTrianglesTwoQuadsPatchConstructor
+from meshGenerators import makeMesh, meshNames
+import contextlib
+import io
+
+
+# Checks that MeshVert.link_loops and link_faces of HalfedgeMesh run around the
+# vert like the disk cycle of a BMesh: every loop is the radial neighbor of the
+# previous loop of the one before it, so consecutive faces share an edge. The
+# constructors start their sector at link_loops[0] and 2T2Q compares link_faces[0]
+# with link_faces[2], so patches only match BMesh with this order.
+# Every vert of every synthetic mesh is checked, the EOP verts of the cubes and
+# the 2T2Q verts are counted separately:
+#   python halfedgeRingTest.py [faces]
+def isRing(vert):
+    """ Consecutive loops share an edge, a closed ring wraps around, an open one starts at the boundary
+    """
+    loops = vert.link_loops
+    faces = vert.link_faces
+    if len(loops) != len(faces) or any(loop.face != face for loop, face in zip(loops, faces)):
+        return False
+    for prev, loop in zip(loops, loops[1:]):
+        radial = prev.link_loop_prev.link_loop_radial_next
+        if radial == prev.link_loop_prev or radial != loop:
+            return False
+    if vert.is_boundary:
+        return loops[0].link_loop_radial_next == loops[0]
+    return loops[-1].link_loop_prev.link_loop_radial_next == loops[0]
+
+
+def isAlternating(vert):
+    """ The two quads around a 2T2Q vert follow each other
+    """
+    sizes = [len(face.verts) for face in vert.link_faces]
+    return any(sizes[i] == sizes[(i + 1) % 4] == 4 for i in range(4)) and sizes.count(4) == 2
+
+
+if __name__ == '__main__':
+    size = 300
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+
+    for name in meshNames:
+        mesh = makeMesh(name, size)
+        rings = [isRing(vert) for vert in mesh.verts]
+        results = ["%d of %d verts" % (sum(rings), len(rings))]
+        passed = all(rings)
+        # The patch constructors print every match
+        with contextlib.redirect_stdout(io.StringIO()):
+            eops = [v for v in mesh.verts if ExtraordinaryPatchConstructor.is_same_type(v)]
+            twoTwos = [v for v in mesh.verts if TwoTrianglesTwoQuadsPatchConstructor.is_same_type(v)]
+        if eops:
+            results.append("%d EOP verts" % len(eops))
+            passed = passed and all(isRing(v) for v in eops)
+        if twoTwos or name == "2T2Q":
+            results.append("%d 2T2Q verts" % len(twoTwos))
+            passed = passed and len(twoTwos) > 0 and all(isRing(v) and isAlternating(v) for v in twoTwos)
+        print("%s: %s %s" % (name, ", ".join(results), "Passed" if passed else "Failed"))
@@ -0,0 +1,112 @@
+import sys
+sys.path.append('..')
+from operators.iges_writer import IGESWriter
+from operators.stencil_index import StencilIndex
+from meshGenerators import makeMesh, meshNames
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+
+# Writes the patches of every synthetic mesh of meshGenerators with IGESWriter and
+# with a number by number writer laid out as the old IGSExporter.__write_igs, the
+# files must be byte-identical. Then times IGESWriter on a torus of the given number
+# of faces:
+#   python igesExportBenchmark.py [faces]
+def writeKnots(f, order, sequenceNumber, directoryPointer):
+    for i in range(2 * order):
+        if i % 8 == 0 and i != 0:
+            f.write("%8dP%7d\n" % (directoryPointer, sequenceNumber))
+            sequenceNumber += 1
+        f.write("0.00000," if i < order else "1.00000,")
+    f.write("        " * (-2 * order % 8))
+    f.write("%8dP%7d\n" % (directoryPointer, sequenceNumber))
+    return sequenceNumber + 1
+
+
+def writeReference(filepath, coefsList):
+    patches = [patch for coefs in coefsList for patch in coefs]
+    with open(filepath, 'w', encoding='utf-8', newline='\n') as f:
+        paramPointer = 1
+        for i, patch in enumerate(patches):
+            rows, cols = patch.shape[:2]
+            numLines = IGESWriter.get_param_line_count(rows, cols)
+            f.write("     128%8d       0       1       0       0       0        00000000D%7d\n" % (
+                paramPointer, 2 * i + 1))
+            f.write("     128%8d       8%8d       2                NurbSurf       0D%7d\n" % (
+                0, numLines, 2 * i + 2))
+            paramPointer += numLines
+
+        sequenceNumber = 1
+        for i, patch in enumerate(patches):
+            rows, cols = patch.shape[:2]
+            directoryPointer = 2 * i + 1
+            f.write("128,%7d,%7d,%7d,%7d,0,0,1,0,0,%26dP%7d\n" % (
+                cols - 1, rows - 1, cols - 1, rows - 1, directoryPointer, sequenceNumber))
+            sequenceNumber += 1
+            sequenceNumber = writeKnots(f, cols, sequenceNumber, directoryPointer)
+            sequenceNumber = writeKnots(f, rows, sequenceNumber, directoryPointer)
+            for k in range(rows * cols):
+                if k % 8 == 0 and k != 0:
+                    f.write("%8dP%7d\n" % (directoryPointer, sequenceNumber))
+                    sequenceNumber += 1
+                f.write("%7.5f," % 1)
+            f.write("        " * (-rows * cols % 8))
+            f.write("%8dP%7d\n" % (directoryPointer, sequenceNumber))
+            sequenceNumber += 1
+            for point in patch.reshape(-1, 3):
+                f.write("%20e,%20e,%20e,%9dP%7d\n" % (point[0], point[1], point[2], directoryPointer, sequenceNumber))
+                sequenceNumber += 1
+            f.write("0.00000,1.00000,0.00000,1.00000;%40dP%7d\n" % (directoryPointer, sequenceNumber))
+            sequenceNumber += 1
+        f.write("S%7dG%7dD%7dP%7d%40dT%7d\n" % (1, 10, 2 * len(patches), sequenceNumber - 1, 1, 1))
+
+
+def readBytes(filepath):
+    with open(filepath, 'rb') as f:
+        return f.read()
+
+
+if __name__ == '__main__':
+    size = 100000
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "patches.igs")
+    referencePath = os.path.join(directory, "reference.igs")
+    for name in meshNames:
+        mesh = makeMesh(name, 500)
+        # The patch constructors print every match
+        with contextlib.redirect_stdout(io.StringIO()):
+            stencilIndex = StencilIndex.build(mesh)
+        coefsList = IGESWriter.get_coefs(stencilIndex, mesh.positions)
+        IGESWriter.write(path, coefsList)
+        writeReference(referencePath, coefsList)
+        orders = sorted({coefs.shape[1:3] for coefs in coefsList})
+        print("%s %d patches, orders %s: %s" % (name, sum(len(coefs) for coefs in coefsList), orders,
+                                                "Passed" if readBytes(path) == readBytes(referencePath) else "Failed"))
+
+    mesh = makeMesh("torus", size)
+    stencilIndex = StencilIndex.build(mesh)
+    startTime = time.perf_counter()
+    coefsList = IGESWriter.get_coefs(stencilIndex, mesh.positions)
+    coefsTime = time.perf_counter() - startTime
+    startTime = time.perf_counter()
+    IGESWriter.write(path, coefsList)
+    writeTime = time.perf_counter() - startTime
+    print("torus %d patches: Bezier coefs %.3f sec, write %.3f sec (%.0f patches/sec, %.1f MB)" % (
+        stencilIndex.num_patches, coefsTime, writeTime, stencilIndex.num_patches / writeTime,
+        os.path.getsize(path) / 1e6))
+
+    sample = [coefs[:2000] for coefs in coefsList]
+    startTime = time.perf_counter()
+    writeReference(referencePath, sample)
+    referenceTime = (time.perf_counter() - startTime) * stencilIndex.num_patches / sum(len(c) for c in sample)
+    print("number by number writer: %.3f sec estimated from 2000 patches (%.1fx)" % (
+        referenceTime, referenceTime / writeTime))
+    os.remove(path)
+    os.remove(referencePath)
+    os.rmdir(directory)
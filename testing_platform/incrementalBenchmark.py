@@ -0,0 +1,81 @@
+import sys
+sys.path.append('..')
+from operators.stencil_index import StencilIndex
+from operators.incremental_updater import IncrementalUpdater
+from operators.parallel_patch_builder import ParallelPatchBuilder
+from parallelBenchmark import makeTorus
+from meshGenerators import toMesh
+import numpy
+import time
+
+
+# Moves a block of verts of a quad torus frame after frame and times the
+# incremental update (change detection, dirty patches, batched re-evaluation and
+# packing of the moved patches into one spline point buffer).
+# The updated coefs are checked against evaluating every patch.
+# Then rotates one edge, which keeps the vert, face and loop counts: the updater
+# must be dropped for the rotated mesh and kept for the original one
+def rotateEdge(mesh):
+    """ Mesh of quads with the edge between the second and third vert of face 0 rotated,
+    the hexagon of the two faces of the edge is split along another diagonal
+    """
+    faces = mesh.face_indices.reshape(-1, 4).tolist()
+    a, b, c, d = faces[0]
+    g = next(i for i, face in enumerate(faces) if i > 0 and c in face and face[(face.index(c) + 1) % 4] == b)
+    k = faces[g].index(c)
+    _, _, x, y = faces[g][k:] + faces[g][:k]
+    faces[0], faces[g] = [a, b, x, y], [y, c, d, a]
+    return toMesh(mesh.positions, faces)
+
+
+if __name__ == '__main__':
+    size = 316
+    numMoved = 1000
+    numFrames = 20
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        numMoved = int(sys.argv[2])
+
+    mesh = makeTorus(size, size)
+    startTime = time.perf_counter()
+    patchBatches, batchCoefs = ParallelPatchBuilder.build(mesh)
+    stencilIndex = StencilIndex.build(mesh, patchBatches)
+    startTime2 = time.perf_counter()
+    updater = IncrementalUpdater.from_mesh(stencilIndex, mesh)
+    print("%d faces, %d patches, build %.3f sec, vert to patch index %.3f sec" % (
+        mesh.num_faces, stencilIndex.num_patches, startTime2 - startTime, time.perf_counter() - startTime2))
+
+    rng = numpy.random.default_rng(0)
+    movedIds = numpy.arange(numMoved) + mesh.num_verts // 2
+    positions = updater.positions.copy()
+    frameTimes = []
+    numDirty = 0
+    for frame in range(numFrames):
+        positions.reshape(-1, 3)[movedIds] += rng.standard_normal((numMoved, 3)).astype(numpy.float32) * 0.001
+        startTime = time.perf_counter()
+        patchIds, coefs = updater.update_positions(positions)
+        patchIds, coefs4D, coefOffsets = updater.get_changed_coefs(patchIds, coefs)
+        frameTimes.append(time.perf_counter() - startTime)
+        numDirty = len(patchIds)
+
+    allCoefs = stencilIndex.evaluate(positions.reshape(-1, 3))
+    expected = numpy.concatenate([c.reshape(-1, c.shape[-2], 3) for c in allCoefs])
+    coefs4D = coefs4D.reshape(-1, 4)
+    passed = numpy.allclose(coefs4D[:, :3], expected[patchIds].reshape(-1, 3), atol=1e-5) \
+        and numpy.all(coefs4D[:, 3] == 1) \
+        and numpy.allclose(updater.coefs_4d[:, :3], expected.reshape(-1, 3), atol=1e-5)
+    frameTimes = numpy.array(frameTimes) * 1000
+    print("%d moved verts, %d dirty patches per frame: median %.2f ms, p95 %.2f ms %s" % (
+        numMoved, numDirty, numpy.median(frameTimes), numpy.percentile(frameTimes, 95),
+        "Passed" if passed else "Failed"))
+
+    IncrementalUpdater.register("torus", updater)
+    rotatedMesh = rotateEdge(mesh)
+    sameCounts = IncrementalUpdater.get_counts(rotatedMesh) == IncrementalUpdater.get_counts(mesh)
+    startTime = time.perf_counter()
+    kept = IncrementalUpdater.get("torus", mesh) is updater
+    checkTime = time.perf_counter() - startTime
+    dropped = IncrementalUpdater.get("torus", rotatedMesh) is None and "torus" not in IncrementalUpdater.updaters
+    print("rotated edge with the same counts: topology check %.2f ms %s" % (
+        checkTime * 1000, "Passed" if sameCounts and kept and dropped else "Failed"))
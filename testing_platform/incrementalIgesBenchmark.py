@@ -0,0 +1,86 @@
+import sys
+sys.path.append('..')
+from operators.iges_writer import IGESWriter
+from operators.incremental_iges_writer import IncrementalIGESWriter
+from operators.stencil_index import StencilIndex
+from meshGenerators import makeMesh
+import contextlib
+import io
+import numpy
+import os
+import tempfile
+import time
+
+
+# Exports a mesh to IGES, moves a few verts and re-exports in place. After every
+# re-export the file must be byte-identical to a fresh IGESWriter.write of the moved
+# patches. A topology change and a file changed behind the index must fall back to
+# a full rewrite:
+#   python incrementalIgesBenchmark.py [faces] [moved verts]
+def readBytes(filepath):
+    with open(filepath, 'rb') as f:
+        return f.read()
+
+
+def getCoefs(mesh, positions):
+    # The patch constructors print every match
+    with contextlib.redirect_stdout(io.StringIO()):
+        stencilIndex = StencilIndex.build(mesh)
+    return IGESWriter.get_coefs(stencilIndex, positions)
+
+
+def check(label, path, expectedPath, coefsList, numWritten, elapsed):
+    IGESWriter.write(expectedPath, coefsList)
+    print("%s: %d patches written in %.4f sec %s" % (
+        label, numWritten, elapsed, "Passed" if readBytes(path) == readBytes(expectedPath) else "Failed"))
+
+
+if __name__ == '__main__':
+    size = 100000
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+    numMoved = 10
+    if len(sys.argv) > 2:
+        numMoved = int(sys.argv[2])
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "patches.igs")
+    expectedPath = os.path.join(directory, "expected.igs")
+    mesh = makeMesh("T1", size)
+    positions = mesh.positions.copy()
+    coefsList = getCoefs(mesh, positions)
+
+    startTime = time.perf_counter()
+    numWritten = IncrementalIGESWriter.write(path, coefsList, num_workers=1)
+    check("full export", path, expectedPath, coefsList, numWritten, time.perf_counter() - startTime)
+
+    startTime = time.perf_counter()
+    numWritten = IncrementalIGESWriter.write(path, coefsList, num_workers=1)
+    check("unchanged re-export", path, expectedPath, coefsList, numWritten, time.perf_counter() - startTime)
+
+    random = numpy.random.default_rng(0)
+    for tweak in range(3):
+        positions[random.choice(len(positions), numMoved, replace=False)] += random.normal(0, 0.01, (numMoved, 3))
+        coefsList = getCoefs(mesh, positions)
+        startTime = time.perf_counter()
+        numWritten = IncrementalIGESWriter.write(path, coefsList, num_workers=1)
+        check("%d verts moved" % numMoved, path, expectedPath, coefsList, numWritten, time.perf_counter() - startTime)
+
+    # The index no longer matches the file
+    with open(path, 'ab') as f:
+        f.write(b"\n")
+    positions[0] += 0.01
+    coefsList = getCoefs(mesh, positions)
+    startTime = time.perf_counter()
+    numWritten = IncrementalIGESWriter.write(path, coefsList, num_workers=1)
+    check("file changed behind the index", path, expectedPath, coefsList, numWritten, time.perf_counter() - startTime)
+
+    mesh = makeMesh("T1", size // 2)
+    coefsList = getCoefs(mesh, mesh.positions)
+    startTime = time.perf_counter()
+    numWritten = IncrementalIGESWriter.write(path, coefsList, num_workers=1)
+    check("topology change", path, expectedPath, coefsList, numWritten, time.perf_counter() - startTime)
+
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
@@ -0,0 +1,188 @@
+import sys
+sys.path.append('..')
+from operators.incremental_updater import IncrementalUpdater
+from operators.iges_writer import IGESWriter
+from operators.mesh_writer import MeshWriter
+from operators.stencil_index import StencilIndex
+from operators.tessellator import Tessellator
+from meshGenerators import makeMesh, meshNames
+import contextlib
+import io
+import numpy
+import os
+import tempfile
+import time
+import tracemalloc
+
+
+# Writes the patches of every synthetic mesh of meshGenerators as PLY, STL and OBJ
+# with MeshWriter and reads the files back. The counts must match the ones
+# returned, every edge of a closed mesh must be used once in each direction (STL
+# triangles are welded by their exact coords) and the Euler characteristic must be
+# the one of the control mesh, also at T-junctions where the patches meet their
+# neighbors at a 3 to 2 ratio of their parameters. The same holds for a
+# Tessellator of the same resolution, whose verts must be the ones written.
+# The Tessellator must stay closed once a few control verts moved and the dirty
+# patches were updated: the seam samples are snapped again to their source sample
+# and no sample drifts a weld cell away from its vert.
+# Then times the export of a torus of the given number of faces and reports the
+# peak memory of the export, which is bounded by the chunk size:
+#   python meshExportBenchmark.py [faces] [resolution]
+def readPly(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    headerEnd = data.index(b"end_header\n") + len(b"end_header\n")
+    counts = {line.split()[1]: int(line.split()[2]) for line in data[:headerEnd].decode("ascii").splitlines()
+              if line.startswith("element")}
+    verts = numpy.frombuffer(data, dtype="<f4", count=3 * counts["vertex"], offset=headerEnd).reshape(-1, 3)
+    faces = []
+    offset = headerEnd + verts.nbytes
+    for _ in range(counts["face"]):
+        size = data[offset]
+        faces.append(numpy.frombuffer(data, dtype="<i4", count=size, offset=offset + 1))
+        offset += 1 + 4 * size
+    return verts, faces
+
+
+def readStl(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    numTriangles = numpy.frombuffer(data, dtype="<u4", count=1, offset=80)[0]
+    triangles = numpy.frombuffer(data, dtype=MeshWriter.stl_triangle, offset=84)
+    assert len(triangles) == numTriangles
+    # Weld by exact coords
+    verts, ids = numpy.unique(triangles["verts"].reshape(-1, 3), axis=0, return_inverse=True)
+    return verts, list(ids.reshape(-1, 3))
+
+
+def readObj(path):
+    verts, faces = [], []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if fields[0] == "v":
+                verts.append([float(x) for x in fields[1:]])
+            elif fields[0] == "f":
+                faces.append(numpy.array([int(i) - 1 for i in fields[1:]]))
+    return numpy.array(verts), faces
+
+
+def getEdges(faces):
+    """ Directed edges of the faces, E by 2
+    """
+    sizes = numpy.array([len(face) for face in faces])
+    loops = numpy.concatenate(faces).astype(numpy.int64)
+    nextLoops = numpy.arange(len(loops)) + 1
+    ends = numpy.cumsum(sizes)
+    nextLoops[ends - 1] = ends - sizes
+    return numpy.stack([loops, loops[nextLoops]], axis=1)
+
+
+def getOpenEdgeCount(edges):
+    """ Number of directed edges whose opposite is missing or repeated
+    """
+    keys = edges[:, 0] * (edges.max() + 1) + edges[:, 1]
+    opposites = edges[:, 1] * (edges.max() + 1) + edges[:, 0]
+    uniqueKeys, counts = numpy.unique(keys, return_counts=True)
+    isPaired = numpy.isin(opposites, uniqueKeys[counts == 1]) & numpy.isin(keys, uniqueKeys[counts == 1])
+    return numpy.count_nonzero(~isPaired)
+
+
+def getEulerCharacteristic(numVerts, edges, numFaces):
+    return numVerts - len(numpy.unique(numpy.sort(edges, axis=1), axis=0)) + numFaces
+
+
+def getSeamGap(tessellator):
+    """ Largest distance of a sample to the vert it is welded into, in weld cells
+    """
+    points = tessellator.sample_points
+    extent = numpy.linalg.norm(numpy.ptp(points, axis=0))
+    gaps = numpy.linalg.norm(points - points[tessellator.vert_sample_ids[tessellator.vert_ids]], axis=1)
+    return gaps.max() / max(extent * Tessellator.weld_tolerance, 1e-300)
+
+
+def isUpdateClosed(tessellator, mesh, expectedEuler, rng, numMoved=20):
+    """ Move a few control verts, update the dirty patches of the Tessellator and check it is still closed
+    """
+    updater = IncrementalUpdater.from_mesh(tessellator.stencil_index, mesh)
+    movedPositions = updater.positions.copy()
+    movedIds = rng.choice(mesh.num_verts, min(numMoved, mesh.num_verts), replace=False)
+    size = numpy.linalg.norm(numpy.ptp(mesh.positions, axis=0))
+    movedPositions.reshape(-1, 3)[movedIds] += rng.standard_normal((len(movedIds), 3)) * 0.01 * size
+    patchIds, coefs = updater.update_positions(movedPositions)
+    tessellator.update(patchIds, coefs)
+    edges = getEdges(numpy.split(tessellator.face_indices, tessellator.face_offsets[1:-1]))
+    passed = getEulerCharacteristic(tessellator.num_verts, edges, tessellator.num_faces) == expectedEuler
+    # The boundary of an open control mesh stays open
+    passed = passed and (getOpenEdgeCount(edges) == 0 or numpy.any(mesh.is_boundary))
+    passed = passed and numpy.array_equal(tessellator.sample_points[tessellator.snapped_rows],
+                                          tessellator.sample_points[tessellator.snapped_source_rows])
+    return passed and getSeamGap(tessellator) < 1.0
+
+
+if __name__ == '__main__':
+    size = 100000
+    resolution = 8
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        resolution = int(sys.argv[2])
+
+    directory = tempfile.mkdtemp()
+    rng = numpy.random.default_rng(0)
+    readers = {"PLY": readPly, "STL": readStl, "OBJ": readObj}
+    for name in meshNames:
+        mesh = makeMesh(name, 300)
+        # The patch constructors print every match
+        with contextlib.redirect_stdout(io.StringIO()):
+            stencilIndex = StencilIndex.build(mesh)
+        tessellator = Tessellator(stencilIndex, mesh.positions, resolution)
+        coefsList = IGESWriter.get_coefs(stencilIndex, mesh.positions)
+        expectedEuler = mesh.num_verts - len(mesh.edge_verts) + mesh.num_faces
+        tessellatorEdges = getEdges(numpy.split(tessellator.face_indices, tessellator.face_offsets[1:-1]))
+        tessellatorOpenEdges = getOpenEdgeCount(tessellatorEdges)
+        tessellatorPassed = (tessellatorOpenEdges == 0 or name == "grid") and getEulerCharacteristic(
+            tessellator.num_verts, tessellatorEdges, tessellator.num_faces) == expectedEuler
+        results = []
+        for extension, fileFormat in MeshWriter.formats.items():
+            path = os.path.join(directory, "patches" + extension)
+            numVerts, numFaces = MeshWriter.write(path, coefsList, resolution)
+            verts, faces = readers[fileFormat](path)
+            os.remove(path)
+            edges = getEdges(faces)
+            openEdges = getOpenEdgeCount(edges)
+            euler = getEulerCharacteristic(len(verts), edges, len(faces))
+            passed = numFaces == len(faces) and euler == expectedEuler and (openEdges == 0 or name == "grid")
+            if fileFormat == "STL":
+                passed = passed and len(verts) <= numVerts
+            else:
+                passed = passed and numVerts == len(verts)
+            # The Tessellator snaps and inserts the same samples
+            passed = passed and numVerts == tessellator.num_verts
+            if len(verts) == tessellator.num_verts:
+                passed = passed and numpy.allclose(numpy.sort(verts, axis=0),
+                                                   numpy.sort(tessellator.get_positions(), axis=0), atol=1e-5)
+            results.append("%s %d verts %d open edges %s" % (fileFormat, len(verts), openEdges,
+                                                             "Passed" if passed else "Failed"))
+        passed = isUpdateClosed(tessellator, mesh, expectedEuler, rng)
+        results.append("Tessellator update %s" % ("Passed" if passed else "Failed"))
+        print("%s %d patches, Tessellator %d verts %d open edges %s: %s" % (
+            name, stencilIndex.num_patches, tessellator.num_verts, tessellatorOpenEdges,
+            "Passed" if tessellatorPassed else "Failed", ", ".join(results)))
+
+    mesh = makeMesh("torus", size)
+    stencilIndex = StencilIndex.build(mesh)
+    coefsList = IGESWriter.get_coefs(stencilIndex, mesh.positions)
+    for extension, fileFormat in MeshWriter.formats.items():
+        path = os.path.join(directory, "patches" + extension)
+        tracemalloc.start()
+        startTime = time.perf_counter()
+        numVerts, numFaces = MeshWriter.write(path, coefsList, resolution)
+        elapsed = time.perf_counter() - startTime
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("torus %d patches as %s: %d verts, %d faces in %.3f sec (%.0f patches/sec), %.1f MB file, "
+              "peak memory %.1f MB" % (stencilIndex.num_patches, fileFormat, numVerts, numFaces, elapsed,
+                                       stencilIndex.num_patches / elapsed, os.path.getsize(path) / 1e6, peak / 1e6))
+        os.remove(path)
+    os.rmdir(directory)
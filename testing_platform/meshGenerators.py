@@ -0,0 +1,314 @@
+import sys
+sys.path.append('..')
+from operators.halfedge_mesh import HalfedgeMesh
+import numpy
+
+
+# Synthetic control meshes for the headless benchmarks. Every generator returns
+# a HalfedgeMesh and is scaled by its own parameters, makeMesh picks them from a
+# name and a target number of faces:
+#   grid, torus        regular quads (open / closed)
+#   cubeN              closed quads with two valence N extraordinary points and 2N valence 3 ones
+#   polarN             sphere with valence N triangle fans at the poles (polar and 2T2Q patches)
+#   2T2Q               small spheres of two rings with valence 6 poles, every ring vert is a 2T2Q vert
+#   T0, T1, T2         quad torus with T-junction structures every few cells
+#   ngonN              closed pillows with an N-gon on each side
+def toMesh(verts, faces):
+    """ HalfedgeMesh of a face list, or of a F by n array when every face has n verts
+    """
+    if isinstance(faces, numpy.ndarray):
+        faceOffsets = numpy.arange(len(faces) + 1, dtype=numpy.int64) * faces.shape[1]
+        return HalfedgeMesh(verts, faceOffsets, faces.reshape(-1))
+    return HalfedgeMesh.from_pydata(verts, faces)
+
+
+def gridPydata(n, m, wrap=False):
+    """ n by m quads, face (i, j) = [v(i, j), v(i + 1, j), v(i + 1, j + 1), v(i, j + 1)] with v(i, j) = i * cols + j
+    With wrap the last row and col are joined to the first ones (torus layout of parallelBenchmark.makeTorus)
+    """
+    rows, cols = (n, m) if wrap else (n + 1, m + 1)
+    i, j = numpy.meshgrid(numpy.arange(n), numpy.arange(m), indexing="ij")
+    i, j = i.reshape(-1), j.reshape(-1)
+    nextI, nextJ = (i + 1) % rows, (j + 1) % cols
+    faces = numpy.stack([i * cols + j, nextI * cols + j, nextI * cols + nextJ, i * cols + nextJ], axis=1)
+    return rows, cols, faces
+
+
+def makeGrid(n, m):
+    rows, cols, faces = gridPydata(n, m)
+    x, y = numpy.meshgrid(numpy.arange(rows, dtype=numpy.float64), numpy.arange(cols, dtype=numpy.float64),
+                          indexing="ij")
+    return toMesh(numpy.stack([x.reshape(-1), y.reshape(-1), numpy.zeros(rows * cols)], axis=1), faces)
+
+
+def torusPydata(n, m, R=2.0, r=0.5):
+    rows, cols, faces = gridPydata(n, m, wrap=True)
+    u = numpy.repeat(numpy.linspace(0, 2 * numpy.pi, n, endpoint=False), m)
+    v = numpy.tile(numpy.linspace(0, 2 * numpy.pi, m, endpoint=False), n)
+    verts = numpy.stack([(R + r * numpy.cos(v)) * numpy.cos(u), (R + r * numpy.cos(v)) * numpy.sin(u),
+                         r * numpy.sin(v)], axis=1)
+    return verts, faces
+
+
+def makeTorus(n, m):
+    return toMesh(*torusPydata(n, m))
+
+
+def refineQuads(verts, faces, k):
+    """ Split every quad into k by k quads, the verts of a shared edge are shared
+    Edge verts are numbered from the lower end of the edge so both faces agree on them
+    """
+    verts = numpy.asarray(verts, dtype=numpy.float64)
+    faces = numpy.asarray(faces, dtype=numpy.int64)
+    numVerts, numFaces = len(verts), len(faces)
+    if k == 1:
+        return verts, faces
+
+    ends = numpy.roll(faces, -1, axis=1)
+    edgeKeys, edgeIds = numpy.unique(numpy.minimum(faces, ends) * numVerts + numpy.maximum(faces, ends),
+                                     return_inverse=True)
+    edgeIds = edgeIds.reshape(numFaces, 4)
+    edgeLo, edgeHi = edgeKeys // numVerts, edgeKeys % numVerts
+    edgeBase = numVerts
+    faceBase = numVerts + len(edgeKeys) * (k - 1)
+
+    # ids[f, b, a] = vert at a / k along the c0 c1 side and b / k along the c0 c3 side of face f
+    ids = numpy.empty((numFaces, k + 1, k + 1), dtype=numpy.int64)
+    ids[:, 0, 0], ids[:, 0, k], ids[:, k, k], ids[:, k, 0] = faces.T
+    t = numpy.arange(1, k)
+    # (rows, cols) of the samples t / k from the start of each side, sides start at c0, c1, c2, c3
+    sides = [(numpy.zeros_like(t), t), (t, numpy.full_like(t, k)), (numpy.full_like(t, k), k - t),
+             (k - t, numpy.zeros_like(t))]
+    for s, (b, a) in enumerate(sides):
+        isForward = faces[:, s] == edgeLo[edgeIds[:, s]]
+        param = numpy.where(isForward[:, None], t, k - t)
+        ids[:, b, a] = edgeBase + edgeIds[:, s, None] * (k - 1) + param - 1
+    ids[:, 1:k, 1:k] = faceBase + numpy.arange(numFaces)[:, None, None] * (k - 1) ** 2 \
+        + numpy.arange((k - 1) ** 2).reshape(k - 1, k - 1)
+
+    s = (t / k)[None, :, None]
+    edgeVerts = verts[edgeLo][:, None] + s * (verts[edgeHi] - verts[edgeLo])[:, None]
+    r, s = numpy.meshgrid(t / k, t / k, indexing="ij")
+    corners = verts[faces]
+    faceVerts = ((1 - s) * (1 - r))[None, :, :, None] * corners[:, None, None, 0] \
+        + (s * (1 - r))[None, :, :, None] * corners[:, None, None, 1] \
+        + (s * r)[None, :, :, None] * corners[:, None, None, 2] \
+        + ((1 - s) * r)[None, :, :, None] * corners[:, None, None, 3]
+    newVerts = numpy.concatenate([verts, edgeVerts.reshape(-1, 3), faceVerts.reshape(-1, 3)])
+
+    newFaces = numpy.stack([ids[:, :-1, :-1], ids[:, :-1, 1:], ids[:, 1:, 1:], ids[:, 1:, :-1]], axis=-1)
+    return newVerts, newFaces.reshape(-1, 4)
+
+
+def makeExtraordinaryCube(valence, k):
+    """ Closed quad mesh like a cube: two caps of valence quads around a valence N pole, a band of
+    2 * valence quads between them, every quad split k by k. The cap corners are valence 3
+    """
+    angles = numpy.arange(2 * valence) * numpy.pi / valence
+    ring = numpy.stack([numpy.cos(angles), numpy.sin(angles)], axis=1)
+    # Top ring 0 .. 2 * valence - 1 (corners at even ids), bottom ring after it, then the two poles
+    verts = numpy.concatenate([numpy.column_stack([ring, numpy.ones(2 * valence)]),
+                               numpy.column_stack([ring, -numpy.ones(2 * valence)]), [[0, 0, 1.2], [0, 0, -1.2]]])
+
+    def top(i):
+        return i % (2 * valence)
+
+    def bottom(i):
+        return 2 * valence + i % (2 * valence)
+
+    topPole, bottomPole = 4 * valence, 4 * valence + 1
+    faces = []
+    for i in range(valence):
+        c = 2 * i
+        faces.append([topPole, top(c - 1), top(c), top(c + 1)])
+        faces.append([bottomPole, bottom(c + 1), bottom(c), bottom(c - 1)])
+    for i in range(2 * valence):
+        faces.append([top(i), bottom(i), bottom(i + 1), top(i + 1)])
+    return toMesh(*refineQuads(verts, faces, k))
+
+
+def polarSpherePydata(valence, rings):
+    """ Sphere of rings bands, triangle fans of valence triangles at the poles and quads between
+    """
+    theta = numpy.pi * numpy.arange(1, rings) / rings
+    phi = 2 * numpy.pi * numpy.arange(valence) / valence
+    theta, phi = numpy.repeat(theta, valence), numpy.tile(phi, rings - 1)
+    verts = numpy.concatenate([[[0, 0, 1.0]], numpy.stack([numpy.sin(theta) * numpy.cos(phi),
+                              numpy.sin(theta) * numpy.sin(phi), numpy.cos(theta)], axis=1), [[0, 0, -1.0]]])
+    southPole = len(verts) - 1
+    i = numpy.arange(valence)
+
+    def ringVert(r, i):
+        return 1 + (r - 1) * valence + i % valence
+
+    faces = [[0, a, b] for a, b in zip(ringVert(1, i), ringVert(1, i + 1))]
+    for r in range(1, rings - 1):
+        faces += numpy.stack([ringVert(r, i), ringVert(r + 1, i), ringVert(r + 1, i + 1), ringVert(r, i + 1)],
+                             axis=1).tolist()
+    faces += [[southPole, a, b] for a, b in zip(ringVert(rings - 1, i + 1), ringVert(rings - 1, i))]
+    return verts, faces
+
+
+def makePolarSphere(valence, rings):
+    return toMesh(*polarSpherePydata(valence, rings))
+
+
+def makeTwoTrianglesTwoQuadsSpheres(valence, copies):
+    """ Spheres side by side of three bands: the pole fans and one band of quads. Every ring vert has
+    two triangles and two quads around it and a polar neighbor, so it seeds a 2T2Q patch
+    """
+    verts, faces = polarSpherePydata(valence, 3)
+    width = int(numpy.ceil(numpy.sqrt(copies)))
+    offsets = numpy.stack([numpy.arange(copies) % width, numpy.arange(copies) // width, numpy.zeros(copies)], axis=1)
+    allVerts = (verts[None] + 3.0 * offsets[:, None]).reshape(-1, 3)
+    allFaces = [[x + c * len(verts) for x in face] for c in range(copies) for face in faces]
+    return toMesh(allVerts, allFaces)
+
+
+def insertVert(face, u, w, x):
+    """ Insert vert x into the face between its consecutive verts u and w
+    """
+    for p in range(len(face)):
+        if {face[p], face[(p + 1) % len(face)]} == {u, w}:
+            face.insert(p + 1, x)
+            return
+    raise ValueError("Edge not in face")
+
+
+def makeTJunctionTorus(n, m, kind, spacing=8):
+    """ Quad torus with a T0, T1 or T2 structure every spacing cells in both directions
+    T1: one quad split in two, the quads on both sides of the split become pentagons
+    T2: two split quads around one quad, which becomes a hexagon with two T-junctions
+    T0: a column of quads starting and ending in a triangle inserted between two columns
+    """
+    verts, faces = torusPydata(n, m)
+    verts = list(verts)
+    faces = faces.tolist()
+
+    def v(i, j):
+        return (i % n) * m + j % m
+
+    def f(i, j):
+        return (i % n) * m + j % m
+
+    def addVert(position):
+        verts.append(position)
+        return len(verts) - 1
+
+    def splitAlongI(i, j):
+        # New verts on the two sides of face (i, j) running along j
+        a = addVert((verts[v(i, j)] + verts[v(i + 1, j)]) / 2)
+        b = addVert((verts[v(i, j + 1)] + verts[v(i + 1, j + 1)]) / 2)
+        insertVert(faces[f(i, j - 1)], v(i, j), v(i + 1, j), a)
+        insertVert(faces[f(i, j + 1)], v(i, j + 1), v(i + 1, j + 1), b)
+        faces[f(i, j)] = [v(i, j), a, b, v(i, j + 1)]
+        faces.append([a, v(i + 1, j), v(i + 1, j + 1), b])
+
+    def splitAlongJ(i, j):
+        c = addVert((verts[v(i, j)] + verts[v(i, j + 1)]) / 2)
+        d = addVert((verts[v(i + 1, j)] + verts[v(i + 1, j + 1)]) / 2)
+        insertVert(faces[f(i - 1, j)], v(i, j), v(i, j + 1), c)
+        insertVert(faces[f(i + 1, j)], v(i + 1, j), v(i + 1, j + 1), d)
+        faces[f(i, j)] = [v(i, j), v(i + 1, j), d, c]
+        faces.append([c, d, v(i + 1, j + 1), v(i, j + 1)])
+
+    def insertColumn(i, j, length):
+        # Cut along the verts v(i, j) .. v(i + length, j), the inner ones get a copy on the side of column j
+        left = [v(i + k, j) for k in range(1, length)]
+        right = []
+        for k in range(1, length):
+            position = verts[v(i + k, j)].copy()
+            verts[v(i + k, j)] = position + (verts[v(i + k, j - 1)] - position) / 4
+            right.append(addVert(position + (verts[v(i + k, j + 1)] - position) / 4))
+        for k in range(length):
+            faces[f(i + k, j)] = [right[left.index(x)] if x in left else x for x in faces[f(i + k, j)]]
+        faces.append([v(i, j), left[0], right[0]])
+        for k in range(length - 2):
+            faces.append([left[k], left[k + 1], right[k + 1], right[k]])
+        faces.append([left[-1], v(i + length, j), right[-1]])
+
+    for i in range(0, n - spacing + 1, spacing):
+        for j in range(0, m - spacing + 1, spacing):
+            if kind == "T1":
+                splitAlongI(i + 2, j + 2)
+            elif kind == "T2":
+                splitAlongI(i + 2, j + 2)
+                splitAlongJ(i + 3, j + 3)
+            elif kind == "T0":
+                insertColumn(i + 2, j + 2, 4)
+            else:
+                raise ValueError("Unknown T-junction kind " + kind)
+    return toMesh(numpy.array(verts), faces)
+
+
+def makeNGonPillows(sides, copies):
+    """ Closed pillows side by side, each with an n-gon of 4-valent verts in a ring of 2n quads on top
+    and at the bottom, the two rings joined by a band of quads
+    """
+    angles = 2 * numpy.pi * numpy.arange(sides) / sides
+    delta = numpy.pi / (2 * sides)
+
+    def circle(a, radius, z):
+        return numpy.stack([radius * numpy.cos(a), radius * numpy.sin(a), numpy.full_like(a, z)], axis=1)
+
+    # n-gon verts, then P, Q, C of each side of the ring
+    top = numpy.concatenate([circle(angles, 1.0, 1.0), numpy.stack([circle(angles - delta, 2.0, 0.8),
+                            circle(angles + delta, 2.0, 0.8), circle(angles, 2.5, 0.5)], axis=1).reshape(-1, 3)])
+    half = len(top)
+    pillow = numpy.concatenate([top, top * [1, 1, -1]])
+
+    def V(i):
+        return i % sides
+
+    def P(i):
+        return sides + 3 * (i % sides)
+
+    def Q(i):
+        return sides + 3 * (i % sides) + 1
+
+    def C(i):
+        return sides + 3 * (i % sides) + 2
+
+    cap = [list(range(sides))]
+    for i in range(sides):
+        cap.append([V(i + 1), V(i), Q(i), P(i + 1)])
+        cap.append([V(i), P(i), C(i), Q(i)])
+    pillowFaces = cap + [[x + half for x in reversed(face)] for face in cap]
+    boundary = [x for i in range(sides) for x in (P(i), C(i), Q(i))]
+    for x, y in zip(boundary, boundary[1:] + boundary[:1]):
+        pillowFaces.append([y, x, x + half, y + half])
+
+    width = int(numpy.ceil(numpy.sqrt(copies)))
+    offsets = numpy.stack([numpy.arange(copies) % width, numpy.arange(copies) // width, numpy.zeros(copies)], axis=1)
+    verts = (pillow[None] + 6.0 * offsets[:, None]).reshape(-1, 3)
+    faces = [[x + c * len(pillow) for x in face] for c in range(copies) for face in pillowFaces]
+    return toMesh(verts, faces)
+
+
+def makeMesh(name, numFaces):
+    """ Mesh of the named kind with about numFaces faces
+    """
+    side = max(int(round(numpy.sqrt(numFaces))), 4)
+    if name == "grid":
+        return makeGrid(side, side)
+    if name == "torus":
+        return makeTorus(side, side)
+    if name.startswith("cube"):
+        valence = int(name[4:])
+        return makeExtraordinaryCube(valence, max(int(round(numpy.sqrt(numFaces / (4 * valence)))), 2))
+    if name.startswith("polar"):
+        valence = int(name[5:])
+        return makePolarSphere(valence, max(numFaces // valence, 3))
+    if name == "2T2Q":
+        return makeTwoTrianglesTwoQuadsSpheres(6, max(numFaces // 18, 1))
+    if name in ("T0", "T1", "T2"):
+        side = max(-(-side // 8) * 8, 16)
+        return makeTJunctionTorus(side, side, name)
+    if name.startswith("ngon"):
+        sides = int(name[4:])
+        return makeNGonPillows(sides, max(numFaces // (7 * sides + 2), 1))
+    raise ValueError("Unknown mesh " + name)
+
+
+meshNames = ["grid", "torus"] + ["cube%d" % v for v in range(3, 9)] + ["polar%d" % v for v in range(3, 9)] + ["2T2Q"] \
+    + ["T0", "T1", "T2"] + ["ngon%d" % n for n in (3, 5, 6, 7, 8)]
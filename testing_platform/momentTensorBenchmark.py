@@ -0,0 +1,90 @@
+import sys
+sys.path.append('..')
+from operators.bivariateBBFunctions import bbFunctions
+from operators.moment_tensors import MomentTensors
+from operators.patch_helper import PatchHelper
+from operators.stencil_index import StencilIndex
+from operators.helper import Helper
+from operators.incremental_updater import IncrementalUpdater
+from operators.moment_accumulator import MomentAccumulator
+from parallelBenchmark import makeTorus
+import numpy
+import time
+
+# Computes volume, centre of mass terms and second moments of a stack of random
+# patches per degree with the precomputed moment tensors and checks them against
+# bbFunctions.allMoments and bbFunctions.secondMoment.
+# Then computes the mass properties of a torus in one pass with the parallel-axis
+# theorem and checks them against the two passes over the patches, then drags a
+# block of verts and checks the incrementally updated moments against a full pass
+numPatches = 10000
+if len(sys.argv) > 1:
+    numPatches = int(sys.argv[1])
+
+rng = numpy.random.default_rng(0)
+for rows, cols in [(3, 3), (3, 4), (4, 3), (4, 4)]:
+    xCoefs, yCoefs, zCoefs = [rng.standard_normal((numPatches, rows, cols)) for _ in range(3)]
+    offset = rng.standard_normal(3)
+
+    startTime = time.perf_counter()
+    MomentTensors.get_tensors(rows, cols)
+    tensorTime = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    volume, com = MomentTensors.all_moments(xCoefs, yCoefs, zCoefs)
+    inertia = MomentTensors.second_moment(xCoefs, yCoefs, zCoefs, offset)
+    elapsed = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    expectedVolume, expectedCom = bbFunctions.allMoments(xCoefs, yCoefs, zCoefs)
+    expectedInertia = bbFunctions.secondMoment(xCoefs, yCoefs, zCoefs, offset)
+    bbElapsed = time.perf_counter() - startTime
+
+    passed = numpy.allclose(volume, expectedVolume) and numpy.allclose(com, expectedCom) \
+        and numpy.allclose(inertia, expectedInertia)
+    print("%d x %d: tensors %.3f sec, %d patches in %.4f sec (%.0f patches/sec), bbFunctions %.4f sec %s" % (
+        rows, cols, tensorTime, numPatches, elapsed, numPatches / elapsed, bbElapsed,
+        "Passed" if passed else "Failed"))
+
+mesh = makeTorus(20, 20)
+startTime = time.perf_counter()
+volume, firstMoment = 0, numpy.zeros(3)
+for patchWrapper in PatchHelper.getPatches(mesh, False):
+    for bp in patchWrapper.patch.bezier_coefs:
+        pieceVolume, pieceFirst = bbFunctions.allMoments(*Helper.list_to_npmatrices(
+            bp, patchWrapper.patch.order_u, patchWrapper.patch.order_v))
+        volume, firstMoment = volume + pieceVolume, firstMoment + pieceFirst
+expectedCom = firstMoment / volume
+expectedInertia = numpy.zeros((3, 3))
+for patchWrapper in PatchHelper.getPatches(mesh, False):
+    for bp in patchWrapper.patch.bezier_coefs:
+        expectedInertia += bbFunctions.secondMoment(*Helper.list_to_npmatrices(
+            bp, patchWrapper.patch.order_u, patchWrapper.patch.order_v), offset=expectedCom)
+twoPassTime = time.perf_counter() - startTime
+
+startTime = time.perf_counter()
+stencilIndex = StencilIndex.build(mesh)
+_, volumes, firsts, seconds = MomentTensors.get_patch_moments(stencilIndex, mesh.positions)
+_, com, inertia = MomentTensors.get_mass_properties(volumes.sum(), firsts.sum(axis=0), seconds.sum(axis=0))
+onePassTime = time.perf_counter() - startTime
+
+passed = numpy.allclose(com, expectedCom) and numpy.allclose(inertia, expectedInertia)
+print("torus %d patches: two passes %.3f sec, one pass %.3f sec %s" % (
+    len(volumes), twoPassTime, onePassTime, "Passed" if passed else "Failed"))
+
+updater = IncrementalUpdater.from_mesh(stencilIndex, mesh)
+accumulator = MomentAccumulator(stencilIndex, updater.positions)
+movedPositions = updater.positions.copy()
+movedIds = numpy.arange(20) + mesh.num_verts // 2
+frameTimes = []
+for frame in range(10):
+    movedPositions.reshape(-1, 3)[movedIds] += rng.standard_normal((len(movedIds), 3)).astype(numpy.float32) * 0.01
+    startTime = time.perf_counter()
+    patchIds, coefs = updater.update_positions(movedPositions)
+    accumulator.update(updater.positions, patchIds)
+    volume, com, inertia = accumulator.get_mass_properties()
+    frameTimes.append(time.perf_counter() - startTime)
+expected = MomentAccumulator(stencilIndex, updater.positions).get_mass_properties()
+passed = all(numpy.allclose(a, b) for a, b in zip((volume, com, inertia), expected))
+print("drag %d dirty patches: median update %.2f ms %s" % (
+    len(patchIds), numpy.median(frameTimes) * 1000, "Passed" if passed else "Failed"))
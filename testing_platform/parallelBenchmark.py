@@ -0,0 +1,51 @@
+import sys
+sys.path.append('..')
+from operators.halfedge_mesh import HalfedgeMesh
+from operators.parallel_patch_builder import ParallelPatchBuilder
+from operators.patch_helper import PatchHelper
+from operators.helper import Helper
+import numpy
+import os
+import time
+
+
+# Times ParallelPatchBuilder on a quad torus from 1 worker up to every core and
+# checks every run against the serial PatchHelper batches
+def makeTorus(n, m, R=2.0, r=0.5):
+    u = numpy.repeat(numpy.linspace(0, 2 * numpy.pi, n, endpoint=False), m)
+    v = numpy.tile(numpy.linspace(0, 2 * numpy.pi, m, endpoint=False), n)
+    verts = numpy.stack([(R + r * numpy.cos(v)) * numpy.cos(u), (R + r * numpy.cos(v)) * numpy.sin(u),
+                         r * numpy.sin(v)], axis=1)
+    faces = [[i * m + j, ((i + 1) % n) * m + j, ((i + 1) % n) * m + (j + 1) % m, i * m + (j + 1) % m]
+             for i in range(n) for j in range(m)]
+    return HalfedgeMesh.from_pydata(verts, faces)
+
+
+if __name__ == '__main__':
+    size = 200
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+    maxWorkers = os.cpu_count() or 1
+    if len(sys.argv) > 2:
+        maxWorkers = int(sys.argv[2])
+
+    mesh = makeTorus(size, size)
+    startTime = time.perf_counter()
+    expectedBatches = PatchHelper.getPatchBatches(mesh)
+    positions = Helper.get_vert_positions(mesh)
+    expectedCoefs = [PatchHelper.evaluatePatchBatch(b, positions) for b in expectedBatches]
+    serialTime = time.perf_counter() - startTime
+    print("%d faces, serial PatchHelper: %.3f sec" % (mesh.num_faces, serialTime))
+
+    for numWorkers in range(1, maxWorkers + 1):
+        startTime = time.perf_counter()
+        patchBatches, batchCoefs = ParallelPatchBuilder.build(mesh, num_workers=numWorkers)
+        elapsed = time.perf_counter() - startTime
+
+        passed = len(patchBatches) == len(expectedBatches) and all(
+            b.constructor is e.constructor and b.mask_name == e.mask_name
+            and numpy.array_equal(b.source_ids, e.source_ids) and numpy.array_equal(b.neighbor_ids, e.neighbor_ids)
+            and numpy.allclose(c, ec)
+            for b, e, c, ec in zip(patchBatches, expectedBatches, batchCoefs, expectedCoefs))
+        print("%d workers: %.3f sec (speedup %.2f) %s" % (
+            numWorkers, elapsed, serialTime / elapsed, "Passed" if passed else "Failed"))
@@ -0,0 +1,65 @@
+import sys
+sys.path.append('..')
+from operators.iges_writer import IGESWriter
+from operators.parallel_iges_writer import ParallelIGESWriter
+from operators.stencil_index import StencilIndex
+from meshGenerators import makeMesh
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+
+# Times the IGES export of a mesh from 1 worker up to every core. Every file must be
+# byte-identical to the serial IGESWriter.write, which is checked on mixed orders
+# and blocks smaller than the arrays:
+#   python parallelIgesBenchmark.py [faces] [max workers] [mesh kind]
+def readBytes(filepath):
+    with open(filepath, 'rb') as f:
+        return f.read()
+
+
+if __name__ == '__main__':
+    size = 200000
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+    maxWorkers = os.cpu_count() or 1
+    if len(sys.argv) > 2:
+        maxWorkers = int(sys.argv[2])
+    name = "T2"
+    if len(sys.argv) > 3:
+        name = sys.argv[3]
+
+    mesh = makeMesh(name, size)
+    # The patch constructors print every match
+    with contextlib.redirect_stdout(io.StringIO()):
+        stencilIndex = StencilIndex.build(mesh)
+    coefsList = IGESWriter.get_coefs(stencilIndex, mesh.positions)
+    directory = tempfile.mkdtemp()
+    expectedPath = os.path.join(directory, "serial.igs")
+    path = os.path.join(directory, "parallel.igs")
+
+    startTime = time.perf_counter()
+    IGESWriter.write(expectedPath, coefsList)
+    serialTime = time.perf_counter() - startTime
+    expected = readBytes(expectedPath)
+    print("%s %d patches in %d arrays, serial IGESWriter: %.3f sec (%.1f MB)" % (
+        name, stencilIndex.num_patches, len(coefsList), serialTime, len(expected) / 1e6))
+
+    for numWorkers in range(1, maxWorkers + 1):
+        startTime = time.perf_counter()
+        ParallelIGESWriter.write(path, coefsList, num_workers=numWorkers)
+        elapsed = time.perf_counter() - startTime
+        print("%d workers: %.3f sec (speedup %.2f, %.0f patches/sec) %s" % (
+            numWorkers, elapsed, serialTime / elapsed, stencilIndex.num_patches / elapsed,
+            "Passed" if readBytes(path) == expected else "Failed"))
+
+    # Blocks much smaller than the arrays, and a forced pool even on one core
+    ParallelIGESWriter.block_size = 1000
+    ParallelIGESWriter.write(path, coefsList, num_workers=max(maxWorkers, 2))
+    print("%d workers, blocks of 1000 patches: %s" % (max(maxWorkers, 2),
+                                                      "Passed" if readBytes(path) == expected else "Failed"))
+    os.remove(path)
+    os.remove(expectedPath)
+    os.rmdir(directory)
@@ -0,0 +1,44 @@
+import sys
+sys.path.append('..')
+from operators.stencil_index import StencilIndex
+from operators.moment_tensors import MomentTensors
+from operators.parallel_moments import ParallelMoments
+from parallelBenchmark import makeTorus
+import numpy
+import os
+import time
+
+
+# Times the moments of every patch of a quad torus from 1 worker up to every core.
+# The totals of every run must be bit-identical to the 1 worker run and match
+# the serial MomentTensors.get_patch_moments
+if __name__ == '__main__':
+    size = 300
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+    maxWorkers = os.cpu_count() or 1
+    if len(sys.argv) > 2:
+        maxWorkers = int(sys.argv[2])
+
+    mesh = makeTorus(size, size)
+    stencilIndex = StencilIndex.build(mesh)
+    startTime = time.perf_counter()
+    _, volumes, firsts, seconds = MomentTensors.get_patch_moments(stencilIndex, mesh.positions)
+    expected = (volumes.sum(), firsts.sum(axis=0), seconds.sum(axis=0))
+    serialTime = time.perf_counter() - startTime
+    print("%d patches, serial MomentTensors: %.3f sec" % (stencilIndex.num_patches, serialTime))
+
+    reference = None
+    for numWorkers in range(1, maxWorkers + 1):
+        startTime = time.perf_counter()
+        totals = ParallelMoments.get_totals(
+            *ParallelMoments.get_patch_moments(stencilIndex, mesh.positions, num_workers=numWorkers)[1:])
+        elapsed = time.perf_counter() - startTime
+        if reference is None:
+            reference = totals
+
+        identical = all(numpy.array_equal(t, r) for t, r in zip(totals, reference))
+        passed = identical and all(numpy.allclose(t, e) for t, e in zip(totals, expected))
+        print("%d workers: %.3f sec (speedup %.2f, %.0f patches/sec), bit-identical to 1 worker: %s %s" % (
+            numWorkers, elapsed, serialTime / elapsed, stencilIndex.num_patches / elapsed, identical,
+            "Passed" if passed else "Failed"))
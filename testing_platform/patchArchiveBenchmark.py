@@ -0,0 +1,107 @@
+import sys
+sys.path.append('..')
+from operators.iges_writer import IGESWriter
+from operators.patch_archive import PatchArchive
+from operators.stencil_index import StencilIndex
+from meshGenerators import makeMesh, meshNames
+import contextlib
+import io
+import numpy
+import os
+import tempfile
+import time
+
+
+# Writes the patches of every synthetic mesh of meshGenerators as a PatchArchive,
+# without and with each compression, and reads them back. Every patch must come
+# back bit for bit from a full read, from random patch ranges (with a chunk size
+# small enough that the ranges cross chunks and groups) and from random patch
+# ids, with the struct type, source and sub patch of its StencilIndex.
+# Then writes a torus of the given number of faces and reports the size, the
+# write time, the time to open the archive and the time to read random ranges:
+#   python patchArchiveBenchmark.py [faces] [patches per range]
+def getExpected(stencilIndex, coefsList):
+    """ Coefs of every patch as one list, and the struct type of every patch
+    """
+    structTypes, _, _ = PatchArchive.get_columns(stencilIndex)
+    coefs = [c for batchCoefs in coefsList for c in batchCoefs]
+    return coefs, [structTypes[b] for b in stencilIndex.patch_batch_ids]
+
+
+def checkArchive(archive, stencilIndex, coefs, structTypes, rng):
+    _, sourceIds, subIds = PatchArchive.get_columns(stencilIndex)
+    passed = archive.num_patches == len(coefs)
+    passed = passed and numpy.array_equal(archive.source_ids, numpy.concatenate(sourceIds))
+    passed = passed and numpy.array_equal(archive.sub_ids, numpy.concatenate(subIds))
+    passed = passed and [archive.struct_types[i] for i in archive.struct_type_ids] == structTypes
+
+    for _ in range(20):
+        start = int(rng.integers(0, len(coefs)))
+        end = int(rng.integers(start, len(coefs) + 1))
+        seen = numpy.zeros(len(coefs), dtype=bool)
+        for patchIds, rangeCoefs in archive.read(start, end):
+            passed = passed and all(numpy.array_equal(coefs[i], c) for i, c in zip(patchIds, rangeCoefs))
+            seen[patchIds] = True
+        passed = passed and seen.sum() == end - start and seen[start:end].all()
+
+    patchIds, patchCoefs = archive.get_patches(rng.integers(0, len(coefs), 50))
+    return passed and all(numpy.array_equal(coefs[i], c) for i, c in zip(patchIds, patchCoefs))
+
+
+if __name__ == '__main__':
+    size = 100000
+    rangeSize = 1000
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        rangeSize = int(sys.argv[2])
+
+    rng = numpy.random.default_rng(0)
+    path = os.path.join(tempfile.mkdtemp(), "patches.psa")
+    compressions = [None] + list(PatchArchive.compressors)
+    for name in meshNames:
+        mesh = makeMesh(name, 300)
+        # The patch constructors print every match
+        with contextlib.redirect_stdout(io.StringIO()):
+            stencilIndex = StencilIndex.build(mesh)
+        coefsList = IGESWriter.get_coefs(stencilIndex, mesh.positions)
+        coefs, structTypes = getExpected(stencilIndex, coefsList)
+        results = []
+        for compression in compressions:
+            structTypesList, sourceIds, subIds = PatchArchive.get_columns(stencilIndex)
+            numPatches = PatchArchive.write(path, coefsList, structTypesList, sourceIds, subIds, compression,
+                                            chunk_size=64)
+            archive = PatchArchive.open(path)
+            passed = numPatches == len(coefs) and checkArchive(archive, stencilIndex, coefs, structTypes, rng)
+            # The coefs of the groups feed the writers as they are
+            passed = passed and sum(len(c) for c in archive.get_coefs()) == len(coefs)
+            results.append("%s %d bytes %s" % (compression, os.path.getsize(path), "Passed" if passed else "Failed"))
+            archive.close()
+        print("%s %d patches: %s" % (name, len(coefs), ", ".join(results)))
+
+    mesh = makeMesh("torus", size)
+    stencilIndex = StencilIndex.build(mesh)
+    coefsList = IGESWriter.get_coefs(stencilIndex, mesh.positions)
+    numPatches = stencilIndex.num_patches
+    rawSize = sum(c.nbytes for c in coefsList)
+    for compression in compressions:
+        startTime = time.perf_counter()
+        PatchArchive.write_stencil_index(path, stencilIndex, mesh.positions, compression)
+        writeTime = time.perf_counter() - startTime
+
+        startTime = time.perf_counter()
+        archive = PatchArchive.open(path)
+        openTime = time.perf_counter() - startTime
+
+        starts = rng.integers(0, max(numPatches - rangeSize, 1), 100)
+        startTime = time.perf_counter()
+        for start in starts:
+            archive.read(int(start), int(start) + rangeSize)
+        readTime = (time.perf_counter() - startTime) / len(starts)
+        archive.close()
+        fileSize = os.path.getsize(path)
+        print("torus %d patches, %s: %.1f MB (%.2f of the coefs), write %.3f sec, open %.2f ms, "
+              "read %d patches %.2f ms" % (numPatches, compression, fileSize / 1e6, fileSize / rawSize, writeTime,
+                                           openTime * 1e3, rangeSize, readTime * 1e3))
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
@@ -0,0 +1,143 @@
+import sys
+sys.path.append('..')
+from operators.bivariateBBFunctions import bbFunctions
+from operators.helper import Helper
+from operators.iges_writer import IGESWriter
+from operators.moment_tensors import MomentTensors
+from operators.parallel_moments import ParallelMoments
+from operators.patch_helper import PatchHelper
+from operators.stencil_index import StencilIndex
+from meshGenerators import makeMesh
+from math import comb
+import contextlib
+import io
+import numpy
+
+
+# Regression check of the layout of non-square patches. The Bezier coefs of a patch
+# run with v fastest, a patch is order_u rows by order_v cols, which only matters
+# for the degree 3 by 2 polar patches. The fixtures of computedTestData.npz are all
+# square and momentTensorBenchmark feeds bbFunctions the same layout as the tensors,
+# so neither catches a transposed net.
+# Here the layout is pinned by the geometry of the closed polar spheres:
+#  - every boundary sample of every patch of IGESWriter.get_coefs must be a boundary
+#    sample of another patch, which only holds for nets of the right shape
+#  - volume, first and second moments of the sphere are integrated by Gauss
+#    quadrature of the divergence theorem (with other fields than bbFunctions)
+#    and must match the totals of MomentTensors, ParallelMoments and bbFunctions
+#    fed through Helper.list_to_npmatrices
+#   python patchLayoutTest.py [faces]
+def getBernstein(deg, t):
+    """ Bernstein basis of degree deg and its derivative at the params t, len(t) by deg + 1 each
+    """
+    t = numpy.asarray(t, dtype=numpy.float64)[:, None]
+    i = numpy.arange(deg + 1)
+    coefs = numpy.array([comb(deg, k) for k in i], dtype=numpy.float64)
+    basis = coefs * t ** i * (1 - t) ** (deg - i)
+    lower = numpy.zeros((len(t), deg + 2))
+    if deg > 0:
+        lower[:, 1:-1] = getBernstein(deg - 1, t[:, 0])[0]
+    derivative = deg * (lower[:, :-1] - lower[:, 1:])
+    return basis, derivative
+
+
+def evaluate(nets, u, v):
+    """ Points and partial derivatives of N by order_u by order_v by 3 nets on the grid u by v
+    """
+    basisU, derivU = getBernstein(nets.shape[1] - 1, u)
+    basisV, derivV = getBernstein(nets.shape[2] - 1, v)
+    points = numpy.einsum("ai,bj,nijk->nabk", basisU, basisV, nets)
+    pointsU = numpy.einsum("ai,bj,nijk->nabk", derivU, basisV, nets)
+    pointsV = numpy.einsum("ai,bj,nijk->nabk", basisU, derivV, nets)
+    return points, pointsU, pointsV
+
+
+def getBoundarySamples(nets, numSamples=5):
+    """ Samples of the four sides of every patch, N by 4 * numSamples by 3
+    """
+    t = numpy.linspace(0, 1, numSamples)
+    sides = [evaluate(nets, t, [0.0])[0][:, :, 0], evaluate(nets, t, [1.0])[0][:, :, 0],
+             evaluate(nets, [0.0], t)[0][:, 0], evaluate(nets, [1.0], t)[0][:, 0]]
+    return numpy.concatenate(sides, axis=1)
+
+
+def isWatertight(coefsList, tolerance=1e-7):
+    """ Every boundary sample is shared by at least two patches
+    """
+    samples = [getBoundarySamples(nets) for nets in coefsList if len(nets)]
+    patchIds = numpy.concatenate([numpy.repeat(numpy.arange(len(s)), s.shape[1]) + offset for s, offset in
+                                  zip(samples, numpy.cumsum([0] + [len(s) for s in samples])[:-1])])
+    keys = numpy.round(numpy.concatenate([s.reshape(-1, 3) for s in samples]) / tolerance).astype(numpy.int64)
+    # Unique (sample, patch) pairs, then the number of patches of every sample
+    pairs = numpy.unique(numpy.column_stack([keys, patchIds]), axis=0)
+    counts = numpy.unique(pairs[:, :3], axis=0, return_counts=True)[1]
+    return bool(numpy.all(counts >= 2))
+
+
+def getQuadratureMoments(coefsList, numPoints=8):
+    """ Volume, first and second moments about the origin of the closed surface of the nets, from
+    the divergence theorem with the fields p / 3, e_k x_k^2 / 2, e_k x_k^3 / 3 and e_k x_k^2 x_l / 2
+    """
+    nodes, weights = numpy.polynomial.legendre.leggauss(numPoints)
+    t, w = (nodes + 1) / 2, numpy.outer(weights, weights) / 4
+    volume, first, second = 0.0, numpy.zeros(3), numpy.zeros((3, 3))
+    for nets in coefsList:
+        if not len(nets):
+            continue
+        points, pointsU, pointsV = evaluate(nets, t, t)
+        # bbFunctions differentiates along the cols for its "u", so its normal is p_v x p_u
+        normals = numpy.cross(pointsV, pointsU)
+        volume += numpy.einsum("ab,nabk,nabk->", w, points, normals) / 3
+        first += numpy.einsum("ab,nabk,nabk->k", w, points ** 2, normals) / 2
+        for k in range(3):
+            for m in range(3):
+                if k == m:
+                    second[k, k] += numpy.einsum("ab,nab,nab->", w, points[..., k] ** 3, normals[..., k]) / 3
+                else:
+                    second[k, m] += numpy.einsum("ab,nab,nab,nab->", w, points[..., k] ** 2, points[..., m],
+                                                 normals[..., k]) / 2
+    return volume, first, second
+
+
+def getBBMoments(mesh):
+    """ Moments summed over the patches of PatchHelper.getPatches, through Helper.list_to_npmatrices
+    """
+    volume, first, second = 0.0, numpy.zeros(3), numpy.zeros((3, 3))
+    with contextlib.redirect_stdout(io.StringIO()):
+        patchWrappers = PatchHelper.getPatches(mesh, False)
+    for patchWrapper in patchWrappers:
+        for bp in patchWrapper.patch.bezier_coefs:
+            coefs = Helper.list_to_npmatrices(bp, patchWrapper.patch.order_u, patchWrapper.patch.order_v)
+            pieceVolume, pieceFirst = bbFunctions.allMoments(*coefs)
+            volume, first = volume + pieceVolume, first + numpy.array(pieceFirst)
+            second += bbFunctions.secondMoment(*coefs)
+    return volume, first, second
+
+
+if __name__ == '__main__':
+    size = 300
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+
+    for valence in range(3, 9):
+        mesh = makeMesh("polar%d" % valence, size)
+        # The patch constructors print every match
+        with contextlib.redirect_stdout(io.StringIO()):
+            stencilIndex = StencilIndex.build(mesh)
+        coefsList = IGESWriter.get_coefs(stencilIndex, mesh.positions)
+        orders = sorted({coefs.shape[1:3] for coefs in coefsList})
+        watertight = isWatertight(coefsList)
+        expected = getQuadratureMoments(coefsList)
+
+        _, volumes, firsts, seconds = MomentTensors.get_patch_moments(stencilIndex, mesh.positions)
+        tensorTotals = (volumes.sum(), firsts.sum(axis=0), seconds.sum(axis=0))
+        parallelTotals = ParallelMoments.get_totals(
+            *ParallelMoments.get_patch_moments(stencilIndex, mesh.positions, num_workers=1)[1:])
+        results = []
+        for name, totals in (("MomentTensors", tensorTotals), ("ParallelMoments", parallelTotals),
+                             ("bbFunctions", getBBMoments(mesh))):
+            passed = all(numpy.allclose(a, b, rtol=1e-9, atol=1e-12) for a, b in zip(totals, expected))
+            results.append("%s %s" % (name, "Passed" if passed else "Failed"))
+        print("polar%d %d patches, orders %s, volume %.6f: watertight %s, %s" % (
+            valence, stencilIndex.num_patches, orders, expected[0], "Passed" if watertight else "Failed",
+            ", ".join(results)))
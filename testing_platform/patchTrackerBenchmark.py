@@ -0,0 +1,75 @@
+import sys
+sys.path.append('..')
+from operators.patch_tracker import PatchTracker
+from operators.stencil_index import StencilIndex
+from meshGenerators import makeTorus
+import numpy
+import time
+
+
+# Registers one regular patch per vert of an n by n quad torus (3 by 3 neighbor
+# verts each) in PatchTracker, then reports the memory of the index and the
+# time of bulk lookups of moved verts. Last, registers the StencilIndex of an
+# m by m torus in one go, as the add-on does after generating the patches, and
+# checks its lookups against the index of the StencilIndex:
+#   python patchTrackerBenchmark.py [n] [m]
+def getTorusStencils(n):
+    i, j = numpy.divmod(numpy.arange(n * n), n)
+    offsets = numpy.array([-1, 0, 1])
+    rows = (i[:, None, None] + offsets[None, :, None]) % n
+    cols = (j[:, None, None] + offsets[None, None, :]) % n
+    return (rows * n + cols).reshape(n * n, 9)
+
+
+if __name__ == '__main__':
+    size = 1000
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+    stencilSize = 300
+    if len(sys.argv) > 2:
+        stencilSize = int(sys.argv[2])
+    neighborIds = getTorusStencils(size)
+    patchNames = ["SurfPatch.%d" % i for i in range(size * size)]
+
+    startTime = time.perf_counter()
+    PatchTracker.register_patch_arrays(patchNames, numpy.arange(size * size), True, neighborIds)
+    PatchTracker.build_index()
+    buildTime = time.perf_counter() - startTime
+
+    arrayBytes = sum(a.nbytes for a in [PatchTracker.vert_patch_offsets, PatchTracker.vert_patch_indices,
+                                        PatchTracker.patch_centre_ids, PatchTracker.patch_is_vert_based,
+                                        PatchTracker.patch_object_ids, PatchTracker.patch_spline_ids])
+    nameBytes = sys.getsizeof(PatchTracker.patch_name_table) + sys.getsizeof(PatchTracker.patch_ids) \
+        + sum(sys.getsizeof(name) for name in patchNames)
+    print("%d verts, %d patches: build %.3f sec, CSR arrays %.1f MB, name table %.1f MB" % (
+        size * size, len(patchNames), buildTime, arrayBytes / 2 ** 20, nameBytes / 2 ** 20))
+
+    rng = numpy.random.default_rng(0)
+    for numMoved in [1, 100, 1000, 10000, 100000]:
+        movedIds = rng.choice(size * size, numMoved, replace=False)
+        lookupTimes = []
+        for _ in range(10):
+            startTime = time.perf_counter()
+            patchIds = PatchTracker.get_patch_ids(movedIds)
+            lookupTimes.append(time.perf_counter() - startTime)
+        expected = numpy.unique(numpy.flatnonzero(numpy.isin(neighborIds, movedIds).any(axis=1)))
+        passed = numpy.array_equal(patchIds, expected)
+        print("%d moved verts -> %d patches: median %.3f ms %s" % (
+            numMoved, len(patchIds), numpy.median(lookupTimes) * 1000, "Passed" if passed else "Failed"))
+
+    stencilIndex = StencilIndex.build(makeTorus(stencilSize, stencilSize))
+    stencilIndex.set_patch_names(["SurfTorus.%d" % i for i in range(stencilIndex.num_patches)])
+    firstId = len(PatchTracker.patch_name_table)
+    startTime = time.perf_counter()
+    PatchTracker.register_stencil_index(stencilIndex)
+    PatchTracker.build_index()
+    registerTime = time.perf_counter() - startTime
+    movedIds = rng.choice(stencilSize * stencilSize, 1000, replace=False)
+    # Both tori number their verts from 0, keep the patches of the second one
+    patchIds = PatchTracker.get_patch_ids(movedIds)
+    passed = numpy.array_equal(patchIds[patchIds >= firstId] - firstId, stencilIndex.get_dirty_patches(movedIds))
+    passed = passed and numpy.array_equal(PatchTracker.patch_centre_ids[firstId:],
+                                          numpy.concatenate([b.source_ids for b in stencilIndex.batches]))
+    passed = passed and PatchTracker.get_patch_spline("SurfTorus.7") == ("SurfTorus.7", 0)
+    print("stencil index of %d patches: register and build %.3f sec %s" % (
+        stencilIndex.num_patches, registerTime, "Passed" if passed else "Failed"))
@@ -0,0 +1,125 @@
+import sys
+sys.path.append('..')
+from operators.stencil_index import StencilIndex
+from operators.incremental_updater import IncrementalUpdater
+from operators.parallel_patch_builder import ParallelPatchBuilder
+from operators.tessellator import Tessellator
+from parallelBenchmark import makeTorus
+from meshExportBenchmark import getEdges, getOpenEdgeCount
+from meshGenerators import makeMesh, meshNames
+import contextlib
+import io
+import numpy
+import time
+
+
+# Tessellates every patch of a quad torus into one welded mesh at several
+# resolutions, then moves a block of verts and times the re-tessellation of the
+# dirty patches. The welded torus must be closed (V - E + F = 0, no open edges)
+# and the updated positions must match a tessellation built from scratch.
+# Then compares a uniform fine tessellation with the adaptive one (resolution per
+# patch from the flatness tolerance), which must stay closed where neighbors differ
+# in resolution, and with the coarse drag preview. Last, every synthetic mesh of
+# meshGenerators is tessellated uniformly and adaptively, the edges met by two or
+# four patches and the T-junctions must not leave open edges either
+def getOpenEdges(tessellator):
+    return getOpenEdgeCount(getEdges(numpy.split(tessellator.face_indices, tessellator.face_offsets[1:-1])))
+
+
+def getEulerCharacteristic(tessellator):
+    faceIds = numpy.repeat(numpy.arange(tessellator.num_faces), numpy.diff(tessellator.face_offsets))
+    nextLoops = numpy.arange(len(tessellator.face_indices)) + 1
+    nextLoops[tessellator.face_offsets[1:] - 1] = tessellator.face_offsets[:-1]
+    edges = numpy.sort(numpy.stack([tessellator.face_indices, tessellator.face_indices[nextLoops]], axis=1), axis=1)
+    numEdges = len(numpy.unique(edges[:, 0] * tessellator.num_verts + edges[:, 1]))
+    return tessellator.num_verts - numEdges + len(numpy.unique(faceIds))
+
+
+if __name__ == '__main__':
+    size = 100
+    numMoved = 100
+    if len(sys.argv) > 1:
+        size = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        numMoved = int(sys.argv[2])
+
+    mesh = makeTorus(size, size)
+    patchBatches, batchCoefs = ParallelPatchBuilder.build(mesh)
+    stencilIndex = StencilIndex.build(mesh, patchBatches)
+    print("%d faces, %d patches" % (mesh.num_faces, stencilIndex.num_patches))
+
+    rng = numpy.random.default_rng(0)
+    movedIds = numpy.arange(numMoved) + mesh.num_verts // 2
+    for resolution in [4, 8, 16]:
+        startTime = time.perf_counter()
+        tessellator = Tessellator(stencilIndex, mesh.positions, resolution)
+        positions = tessellator.get_positions()
+        normals = tessellator.get_normals()
+        buildTime = time.perf_counter() - startTime
+
+        updater = IncrementalUpdater.from_mesh(stencilIndex, mesh)
+        movedPositions = updater.positions.copy()
+        movedPositions.reshape(-1, 3)[movedIds] += rng.standard_normal((numMoved, 3)).astype(numpy.float32) * 0.01
+        startTime = time.perf_counter()
+        patchIds, coefs = updater.update_positions(movedPositions)
+        tessellator.update(patchIds, coefs)
+        positions = tessellator.get_positions()
+        normals = tessellator.get_normals()
+        updateTime = time.perf_counter() - startTime
+
+        expected = Tessellator(stencilIndex, movedPositions, resolution)
+        passed = getEulerCharacteristic(tessellator) == 0 and getOpenEdges(tessellator) == 0 \
+            and tessellator.num_verts == mesh.num_faces * (resolution - 1) ** 2 \
+            and numpy.allclose(positions, expected.get_positions(), atol=1e-5) \
+            and numpy.allclose(normals, expected.get_normals(), atol=1e-4)
+        print("resolution %d: %d verts, %d faces, build %.3f sec, %d dirty patches %.2f ms %s" % (
+            resolution, tessellator.num_verts, tessellator.num_faces, buildTime, len(patchIds), updateTime * 1000,
+            "Passed" if passed else "Failed"))
+
+    # Adaptive resolution and drag preview, tolerance relative to the torus size
+    size = numpy.linalg.norm(numpy.ptp(mesh.positions, axis=0))
+    maxResolution = 17
+    previewResolution = 3
+    for tolerance in [1e-2, 1e-3, 1e-4]:
+        startTime = time.perf_counter()
+        resolutions = Tessellator.get_patch_resolutions(stencilIndex, mesh.positions, tolerance * size,
+                                                        max_resolution=maxResolution)
+        adaptive = Tessellator(stencilIndex, mesh.positions, resolutions)
+        adaptiveTime = time.perf_counter() - startTime
+        passed = getEulerCharacteristic(adaptive) == 0 and getOpenEdges(adaptive) == 0
+        print("tolerance %g: resolutions %d to %d, %d verts, %d open edges, build %.3f sec %s" % (
+            tolerance, resolutions.min(), resolutions.max(), adaptive.num_verts, getOpenEdges(adaptive),
+            adaptiveTime, "Passed" if passed else "Failed"))
+
+    for resolution in [maxResolution, previewResolution]:
+        tessellator = Tessellator(stencilIndex, mesh.positions, resolution)
+        updater = IncrementalUpdater.from_mesh(stencilIndex, mesh)
+        movedPositions = updater.positions.copy()
+        frameTimes = []
+        for frame in range(10):
+            movedPositions.reshape(-1, 3)[movedIds] += rng.standard_normal((numMoved, 3)).astype(numpy.float32) * 0.001
+            startTime = time.perf_counter()
+            patchIds, coefs = updater.update_positions(movedPositions)
+            tessellator.update(patchIds, coefs)
+            frameTimes.append(time.perf_counter() - startTime)
+        print("%s resolution %d: %d verts, drag update median %.2f ms" % (
+            "preview" if resolution == previewResolution else "uniform", resolution, tessellator.num_verts,
+            numpy.median(frameTimes) * 1000))
+
+    for name in meshNames:
+        mesh = makeMesh(name, 300)
+        # The patch constructors print every match
+        with contextlib.redirect_stdout(io.StringIO()):
+            stencilIndex = StencilIndex.build(mesh)
+        expectedEuler = mesh.num_verts - len(mesh.edge_verts) + mesh.num_faces
+        size = numpy.linalg.norm(numpy.ptp(mesh.positions, axis=0))
+        results = []
+        for kind, resolution in [("uniform", 5), ("adaptive", Tessellator.get_patch_resolutions(
+                stencilIndex, mesh.positions, 1e-3 * size, max_resolution=maxResolution))]:
+            tessellator = Tessellator(stencilIndex, mesh.positions, resolution)
+            openEdges = getOpenEdges(tessellator)
+            # The open boundary of the grid stays open
+            passed = (openEdges == 0 or name == "grid") and getEulerCharacteristic(tessellator) == expectedEuler
+            results.append("%s %d verts %d open edges %s" % (kind, tessellator.num_verts, openEdges,
+                                                             "Passed" if passed else "Failed"))
+        print("%s %d patches: %s" % (name, stencilIndex.num_patches, ", ".join(results)))
@@ -4,6 +4,8 @@ from time import time
 import numpy as np
 import json
 import random
+import re
+import sys
 def generateCuboid(dimensions = (1,1,1), offsets = (0,0,0), rotations=(0,0,0), degree=2):
     name = f"Cuboid degree:{degree}, offsets:{offsets}, rotations:{rotations}, dimensions:{dimensions}"
     desc = f"Computer Generated cuboid, the attributes of which are described in the name"
@@ -12,6 +14,7 @@ def generateCuboid(dimensions = (1,1,1), offsets = (0,0,0), rotations=(0,0,0), d
         "testDescription": desc,
         "testVol": (dimensions[0] * dimensions[1] * dimensions[2]),
         "testCOM": [offsets[0], offsets[1], offsets[2]],
+        "testDimensions": [float(d) for d in dimensions],
 
     }
     faces = []
@@ -45,42 +48,72 @@ def generateCuboid(dimensions = (1,1,1), offsets = (0,0,0), rotations=(0,0,0), d
     cuboid["testSurfaces"] = faceMatrices
     return cuboid
 
-#pprint.pprint(generateCuboid(degree=4))
-#print(json.dumps(generateCuboid(dimensions=(5,4,3),offsets=(5,4,3)), indent=4))
+def writeFixture(testCases, path):
+    """ Store the test cases as coefficient stacks, one per matrix shape, plus the expected values per case
+    coefs_RxC[s] is the 3 by R by C x, y, z matrices of surface s, cases_RxC[s] the index of its test case
+    """
+    dimensionPattern = re.compile(r"dimensions:\(([^)]*)\)")
+    arrays = {
+        "names": np.array([case["testName"] for case in testCases]),
+        "volumes": np.array([case["testVol"] for case in testCases], dtype=np.float64),
+        "coms": np.array([case["testCOM"] for case in testCases], dtype=np.float64),
+        # Cuboid dimensions for the analytic second moments, older JSON cases only have them in the name
+        "dimensions": np.array([case["testDimensions"] if "testDimensions" in case else
+                                [float(d) for d in dimensionPattern.search(case["testName"]).group(1).split(",")]
+                                for case in testCases], dtype=np.float64)
+    }
+    stacks = {}
+    for caseId, case in enumerate(testCases):
+        for surface in case["testSurfaces"]:
+            coefs = np.array([surface["xCoefs"], surface["yCoefs"], surface["zCoefs"]], dtype=np.float64)
+            key = "%dx%d" % coefs.shape[1:]
+            stacks.setdefault(key, ([], []))
+            stacks[key][0].append(coefs)
+            stacks[key][1].append(caseId)
+    for key, (coefs, caseIds) in stacks.items():
+        arrays["coefs_" + key] = np.stack(coefs)
+        arrays["cases_" + key] = np.array(caseIds, dtype=np.int64)
+    np.savez_compressed(path, **arrays)
+
+
+if __name__ == '__main__':
+    # python testCaseGenerator.py --from-json computedTestData.json converts stored cases instead of generating
+    if len(sys.argv) > 2 and sys.argv[1] == "--from-json":
+        with open(sys.argv[2]) as f:
+            writeFixture(json.load(f)["testCases"], "computedTestData.npz")
+        sys.exit(0)
+
+    #pprint.pprint(generateCuboid(degree=4))
+    #print(json.dumps(generateCuboid(dimensions=(5,4,3),offsets=(5,4,3)), indent=4))
 
-cuboids = []
-#Generate Cuboids made up of surfaces with degrees from 2 to 9
-for i in range(2, 12):
-    cuboids = cuboids + [generateCuboid(degree=i)]
-#Generate Cuboids with offset in each directions from -4 to 4
-for i in range(-2, 3):
-    for j in range(-2, 3):
-        for k in range(-2, 3):
-            cuboids = cuboids + [generateCuboid(offsets=(i,j,k))]
-#Generate Cuboids with dimensions in each direction from 0.1 to 1 (not inclusive)
-for i in np.arange(0.1, 1, 0.1):
-    for j in np.arange(0.1, 1, 0.1):
-        for k in np.arange(0.1, 1, 0.1):
-            cuboids = cuboids + [generateCuboid(dimensions=(i,j,k))]
-#Generate Cuboids with dimensions in each direction from 1 to 10
-for i in range(1, 5):
-    for j in range(1, 5):
-        for k in range(1, 5):
-            cuboids = cuboids + [generateCuboid(dimensions=(i,j,k))]
-#Generate Cuboids with random offsets, dimensions, and degrees from 2 to 9, -100 to 100, and 1 to 1000 
-random.seed(time())
-for i in range(0, 100):
-    deg = random.randrange(2,3)
-    offX = random.random() * 200 - 100
-    offY = random.random() * 200 - 100
-    offZ = random.random() * 200 - 100
-    dimX = random.random() * 999 + 1
-    dimY = random.random() * 999 + 1
-    dimZ = random.random() * 999 + 1
-    cuboids = cuboids + [generateCuboid(dimensions=(dimX,dimY,dimZ), offsets=(offX,offY,offZ), degree=deg)]
-toPrint = {
-    "description": "this file contains computer generated test data for for Unit Tests For the bivariateBBFunctions.py file",
-    "testCases": cuboids
-}
-with open('computedTestData.json', 'w') as outfile:
-    json.dump(toPrint, outfile)
+    cuboids = []
+    #Generate Cuboids made up of surfaces with degrees from 2 to 9
+    for i in range(2, 12):
+        cuboids = cuboids + [generateCuboid(degree=i)]
+    #Generate Cuboids with offset in each directions from -4 to 4
+    for i in range(-2, 3):
+        for j in range(-2, 3):
+            for k in range(-2, 3):
+                cuboids = cuboids + [generateCuboid(offsets=(i,j,k))]
+    #Generate Cuboids with dimensions in each direction from 0.1 to 1 (not inclusive)
+    for i in np.arange(0.1, 1, 0.1):
+        for j in np.arange(0.1, 1, 0.1):
+            for k in np.arange(0.1, 1, 0.1):
+                cuboids = cuboids + [generateCuboid(dimensions=(i,j,k))]
+    #Generate Cuboids with dimensions in each direction from 1 to 10
+    for i in range(1, 5):
+        for j in range(1, 5):
+            for k in range(1, 5):
+                cuboids = cuboids + [generateCuboid(dimensions=(i,j,k))]
+    #Generate Cuboids with random offsets, dimensions, and degrees from 2 to 9, -100 to 100, and 1 to 1000 
+    random.seed(time())
+    for i in range(0, 100):
+        deg = random.randrange(2,3)
+        offX = random.random() * 200 - 100
+        offY = random.random() * 200 - 100
+        offZ = random.random() * 200 - 100
+        dimX = random.random() * 999 + 1
+        dimY = random.random() * 999 + 1
+        dimZ = random.random() * 999 + 1
+        cuboids = cuboids + [generateCuboid(dimensions=(dimX,dimY,dimZ), offsets=(offX,offY,offZ), degree=deg)]
+    writeFixture(cuboids, "computedTestData.npz")